@@ -1,21 +1,54 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from acouchbase.bucket import Bucket as AsyncBucket
+from couchbase.bucket import Bucket
+from couchbase.exceptions import KeyExistsError
+from couchbase.mutation_state import MutationState
+from fastapi import APIRouter, Body, Depends, HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
 
 from app import crud
-from app.api.utils.security import get_current_active_user
-from app.db.database import get_default_bucket
-from app.models.item import Item, ItemCreate, ItemUpdate
-from app.models.user import UserInDB
+from app.api.utils.consistency import get_mutation_state, set_mutation_state
+from app.api.utils.db import get_async_db_bucket, get_db_bucket
+from app.api.utils.etag import get_cas_mismatch_error, get_if_match_cas, set_etag
+from app.api.utils.pagination import get_start_after, set_next_cursor
+from app.api.utils.search import (
+    check_facets,
+    get_facets,
+    get_search_cursors,
+    set_search_headers,
+)
+from app.api.utils.security import get_current_active_principal
+from app.api.utils.streaming import stream_n1ql_response, wants_ndjson
+from app.core import config
+from app.models.config import ITEM_DOC_TYPE
+from app.models.consistency import ScanConsistency
+from app.models.item import Item, ItemBatchResult, ItemCreate, ItemInDB, ItemUpdate
+from app.models.token import Principal
 
 router = APIRouter()
 
 
+def check_owner(doc: ItemInDB, current_user: Principal):
+    if not crud.user.is_superuser(current_user) and (
+        doc.owner_username != current_user.username
+    ):
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+
+
 @router.get("/", response_model=List[Item])
-def read_items(
+async def read_items(
+    request: Request,
+    response: Response,
+    bucket: AsyncBucket = Depends(get_async_db_bucket),
     skip: int = 0,
     limit: int = 100,
-    current_user: UserInDB = Depends(get_current_active_user),
+    start_after: str = Depends(get_start_after),
+    stream: bool = False,
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = Depends(get_mutation_state),
+    current_user: Principal = Depends(get_current_active_principal),
 ):
     """
     Retrieve items.
@@ -23,23 +56,72 @@ def read_items(
     If superuser, all the items.
 
     If normal user, the items owned by this user.
+
+    When there are more items, the `X-Next-Cursor` response header has the
+    `cursor` to pass to get the next page.
+
+    With `stream`, or with an `Accept: application/x-ndjson` header, the items are
+    streamed as they are read, as a JSON array or as NDJSON.
+
+    By default, when the `X-Couchbase-Mutation-State` header returned by the
+    client's own writes is sent back, the results include those writes
+    (`at_plus`). Pass `consistency=not_bounded` for the fastest, possibly
+    stale, results, or `consistency=request_plus` to wait for all the writes.
     """
-    bucket = get_default_bucket()
+    if stream or wants_ndjson(request):
+        if crud.user.is_superuser(current_user):
+            query = crud.utils.get_doc_results_by_type_query(
+                doc_type=ITEM_DOC_TYPE,
+                doc_model=Item,
+                skip=skip,
+                limit=limit,
+                start_after=start_after,
+                consistency=consistency,
+                mutation_state=mutation_state,
+            )
+        else:
+            query = crud.item.get_multi_by_owner_query(
+                owner_username=current_user.username,
+                skip=skip,
+                limit=limit,
+                start_after=start_after,
+                consistency=consistency,
+                mutation_state=mutation_state,
+            )
+        return stream_n1ql_response(request, query, doc_model=Item)
     if crud.user.is_superuser(current_user):
-        docs = crud.item.get_multi(bucket, skip=skip, limit=limit)
+        docs = await crud.item.get_multi_async(
+            bucket,
+            skip=skip,
+            limit=limit,
+            start_after=start_after,
+            consistency=consistency,
+            mutation_state=mutation_state,
+        )
     else:
-        docs = crud.item.get_multi_by_owner(
-            bucket=bucket, owner_username=current_user.username, skip=skip, limit=limit
+        docs = await crud.item.get_multi_by_owner_async(
+            bucket=bucket,
+            owner_username=current_user.username,
+            skip=skip,
+            limit=limit,
+            start_after=start_after,
+            consistency=consistency,
+            mutation_state=mutation_state,
         )
+    set_next_cursor(response, docs, limit=limit, get_cursor=crud.item.get_cursor)
     return docs
 
 
 @router.get("/search/", response_model=List[Item])
 def search_items(
     q: str,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
     skip: int = 0,
     limit: int = 100,
-    current_user: UserInDB = Depends(get_current_active_user),
+    facets: List[str] = Depends(get_facets),
+    cursors: tuple = Depends(get_search_cursors),
+    current_user: Principal = Depends(get_current_active_principal),
 ):
     """
     Search items, use Bleve Query String syntax:
@@ -47,88 +129,224 @@ def search_items(
 
     For typeahead suffix with `*`. For example, a query with: `title:foo*` will match
     items containing `football`, `fool proof`, etc.
+
+    Deep pages are faster with `search_after` (or `search_before`) set to the
+    `X-Next-Cursor` (or `X-Prev-Cursor`) header of the previous page, than with
+    `skip`.
+
+    The total number of hits is in the `X-Total-Count` header. The term counts of
+    the `facet` fields (`owner_username`) are in the `X-Search-Facets` header.
     """
-    bucket = get_default_bucket()
+    search_after, search_before = cursors
+    check_facets(facets, allowed=crud.item.search_facet_fields)
     if crud.user.is_superuser(current_user):
-        docs = crud.item.search(bucket=bucket, query_string=q, skip=skip, limit=limit)
+        results = crud.item.search(
+            bucket=bucket,
+            query_string=q,
+            facets=facets,
+            skip=skip,
+            limit=limit,
+            search_after=search_after,
+            search_before=search_before,
+        )
     else:
-        docs = crud.item.search_with_owner(
+        results = crud.item.search_with_owner(
             bucket=bucket,
             query_string=q,
             username=current_user.username,
+            facets=facets,
             skip=skip,
             limit=limit,
+            search_after=search_after,
+            search_before=search_before,
         )
-    return docs
+    set_search_headers(response, results)
+    return results.docs
 
 
 @router.post("/", response_model=Item)
 def create_item(
-    *, item_in: ItemCreate, current_user: UserInDB = Depends(get_current_active_user)
+    *,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
+    item_in: ItemCreate,
+    mutation_state: MutationState = Depends(get_mutation_state),
+    current_user: Principal = Depends(get_current_active_principal),
 ):
     """
     Create new item.
     """
-    bucket = get_default_bucket()
     id = crud.utils.generate_new_id()
     doc = crud.item.upsert(
-        bucket=bucket, id=id, doc_in=item_in, owner_username=current_user.username
+        bucket=bucket,
+        id=id,
+        doc_in=item_in,
+        owner_username=current_user.username,
+        mutation_state=mutation_state,
     )
+    set_mutation_state(response, mutation_state)
     return doc
 
 
+@router.post("/batch", response_model=List[ItemBatchResult])
+def create_items_batch(
+    *,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
+    items_in: List[ItemCreate],
+    mutation_state: MutationState = Depends(get_mutation_state),
+    current_user: Principal = Depends(get_current_active_principal),
+):
+    """
+    Create several items in a single batch.
+
+    The result of each item has its new ID and whether it was created or not.
+    """
+    if len(items_in) > config.BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can't have more than {config.BATCH_MAX_SIZE} items",
+        )
+    docs_in = {crud.utils.generate_new_id(): item_in for item_in in items_in}
+    results = crud.item.upsert_multi(
+        bucket=bucket,
+        docs_in=docs_in,
+        owner_username=current_user.username,
+        mutation_state=mutation_state,
+    )
+    set_mutation_state(response, mutation_state)
+    return results
+
+
+@router.delete("/batch", response_model=List[ItemBatchResult])
+def delete_items_batch(
+    *,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
+    ids: List[str] = Body(...),
+    mutation_state: MutationState = Depends(get_mutation_state),
+    current_user: Principal = Depends(get_current_active_principal),
+):
+    """
+    Delete several items by ID in a single batch.
+
+    The result of each item says whether it was deleted or not, and why.
+    """
+    if len(ids) > config.BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can't have more than {config.BATCH_MAX_SIZE} items",
+        )
+    docs = {doc.id: doc for doc in crud.item.get_multi_by_ids(bucket, ids=ids)}
+    results = {}
+    removable_ids = []
+    for id in ids:
+        doc = docs.get(id)
+        if not doc:
+            results[id] = ItemBatchResult(id=id, success=False, error="Item not found")
+        elif not crud.user.is_superuser(current_user) and (
+            doc.owner_username != current_user.username
+        ):
+            results[id] = ItemBatchResult(
+                id=id, success=False, error="Not enough permissions"
+            )
+        else:
+            removable_ids.append(id)
+    errors = crud.item.remove_multi(
+        bucket, ids=removable_ids, mutation_state=mutation_state
+    )
+    set_mutation_state(response, mutation_state)
+    for id in removable_ids:
+        error = errors.get(id)
+        if error is None:
+            results[id] = ItemBatchResult(id=id, success=True, item=docs[id].dict())
+        else:
+            results[id] = ItemBatchResult(id=id, success=False, error=error)
+    return [results[id] for id in ids]
+
+
 @router.put("/{id}", response_model=Item)
 def update_item(
     *,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
     id: str,
     item_in: ItemUpdate,
-    current_user: UserInDB = Depends(get_current_active_user),
+    cas: int = Depends(get_if_match_cas),
+    mutation_state: MutationState = Depends(get_mutation_state),
+    current_user: Principal = Depends(get_current_active_principal),
 ):
     """
     Update an item.
+
+    With an `If-Match` header with the `ETag` of a previous read, the item is
+    only updated if it didn't change since, otherwise the response is a 412.
     """
-    bucket = get_default_bucket()
-    doc = crud.item.get(bucket=bucket, id=id)
+    try:
+        doc, new_cas = crud.item.update_checked(
+            bucket=bucket,
+            id=id,
+            doc_in=item_in,
+            check=lambda doc: check_owner(doc, current_user),
+            cas=cas,
+            mutation_state=mutation_state,
+        )
+    except KeyExistsError:
+        raise get_cas_mismatch_error(cas)
     if not doc:
         raise HTTPException(status_code=404, detail="Item not found")
-    if not crud.user.is_superuser(current_user) and (
-        doc.owner_username != current_user.username
-    ):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    doc = crud.item.update(
-        bucket=bucket, id=id, doc_in=item_in, owner_username=doc.owner_username
-    )
+    set_etag(response, new_cas)
+    set_mutation_state(response, mutation_state)
     return doc
 
 
 @router.get("/{id}", response_model=Item)
-def read_item(id: str, current_user: UserInDB = Depends(get_current_active_user)):
+async def read_item(
+    id: str,
+    response: Response,
+    bucket: AsyncBucket = Depends(get_async_db_bucket),
+    current_user: Principal = Depends(get_current_active_principal),
+):
     """
     Get item by ID.
+
+    The `ETag` response header can be sent back in an `If-Match` header to
+    update or delete the item only if it didn't change since.
     """
-    bucket = get_default_bucket()
-    doc = crud.item.get(bucket=bucket, id=id)
+    doc, cas = await crud.item.get_with_cas_async(bucket=bucket, id=id)
     if not doc:
         raise HTTPException(status_code=404, detail="Item not found")
-    if not crud.user.is_superuser(current_user) and (
-        doc.owner_username != current_user.username
-    ):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    check_owner(doc, current_user)
+    set_etag(response, cas)
     return doc
 
 
 @router.delete("/{id}", response_model=Item)
-def delete_item(id: str, current_user: UserInDB = Depends(get_current_active_user)):
+def delete_item(
+    id: str,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
+    cas: int = Depends(get_if_match_cas),
+    mutation_state: MutationState = Depends(get_mutation_state),
+    current_user: Principal = Depends(get_current_active_principal),
+):
     """
     Delete an item by ID.
+
+    With an `If-Match` header, the item is only deleted if it didn't change
+    since it was read, as when updating it.
     """
-    bucket = get_default_bucket()
-    doc = crud.item.get(bucket=bucket, id=id)
+    try:
+        doc = crud.item.remove_checked(
+            bucket=bucket,
+            id=id,
+            check=lambda doc: check_owner(doc, current_user),
+            cas=cas,
+            mutation_state=mutation_state,
+        )
+    except KeyExistsError:
+        raise get_cas_mismatch_error(cas)
     if not doc:
         raise HTTPException(status_code=404, detail="Item not found")
-    if not crud.user.is_superuser(current_user) and (
-        doc.owner_username != current_user.username
-    ):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    doc = crud.item.remove(bucket=bucket, id=id)
+    set_mutation_state(response, mutation_state)
     return doc
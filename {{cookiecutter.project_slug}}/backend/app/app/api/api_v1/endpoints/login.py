@@ -1,13 +1,26 @@
+import math
 from datetime import timedelta
 
-from fastapi import APIRouter, Body, Depends, HTTPException
+from couchbase.bucket import Bucket
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
+from jwt import PyJWTError
+from starlette.requests import Request
+from starlette.status import HTTP_403_FORBIDDEN, HTTP_429_TOO_MANY_REQUESTS
 
 from app import crud
+from app.api.utils.db import get_db_bucket
 from app.api.utils.security import get_current_user
 from app.core import config
-from app.core.jwt import create_access_token
-from app.db.database import get_default_bucket
+from app.core.jwt import (
+    create_access_token,
+    create_refresh_token,
+    decode_token,
+    refresh_token_jwt_subject,
+)
+from app.core.login_throttle import LoginThrottled, login_throttle
+from app.core.security import PasswordHasherBusy
+from app.db.database import bucket_pool
 from app.models.msg import Msg
 from app.models.token import Token
 from app.models.user import User, UserInDB, UserUpdate
@@ -20,26 +33,115 @@ from app.utils import (
 router = APIRouter()
 
 
+def store_rehashed_password(user: UserInDB, password: str):
+    # Runs after the response is sent, when the request bucket is released
+    try:
+        with bucket_pool.checkout() as bucket:
+            crud.user.rehash_password(bucket, user=user, password=password)
+    except PasswordHasherBusy:
+        # It's tried again on the next login
+        pass
+
+
+def create_tokens(bucket: Bucket, *, user: UserInDB):
+    stored_token = crud.refresh_token.create(
+        bucket,
+        username=user.username,
+        expires_delta=timedelta(minutes=config.REFRESH_TOKEN_EXPIRE_MINUTES),
+    )
+    return {
+        "access_token": create_access_token(
+            data=crud.user.get_token_claims(user),
+            expires_delta=timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES),
+        ),
+        "token_type": "bearer",
+        "refresh_token": create_refresh_token(
+            username=user.username,
+            token_id=stored_token.id,
+            expires_delta=timedelta(minutes=config.REFRESH_TOKEN_EXPIRE_MINUTES),
+        ),
+    }
+
+
 @router.post("/login/access-token", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
+def login(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    bucket: Bucket = Depends(get_db_bucket),
+    form_data: OAuth2PasswordRequestForm = Depends(),
+):
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
-    bucket = get_default_bucket()
-    user = crud.user.authenticate(
-        bucket, username=form_data.username, password=form_data.password
-    )
+    client = None
+    if config.LOGIN_THROTTLE_BY_CLIENT and request.client:
+        # From X-Forwarded-For when the server trusts the proxy
+        client = request.client.host
+    try:
+        login_throttle.check(username=form_data.username, client=client)
+    except LoginThrottled as e:
+        raise HTTPException(
+            status_code=HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed logins, try again later",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    with login_throttle.verification():
+        user = crud.user.authenticate(
+            bucket, username=form_data.username, password=form_data.password
+        )
     if not user:
+        login_throttle.record_failure(username=form_data.username, client=client)
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+    login_throttle.record_success(username=form_data.username)
+    if not crud.user.is_active(user):
+        raise HTTPException(status_code=400, detail="Inactive user")
+    if crud.user.needs_rehash(user):
+        background_tasks.add_task(
+            store_rehashed_password, user=user, password=form_data.password
+        )
+    return create_tokens(bucket, user=user)
+
+
+@router.post("/login/refresh-token", response_model=Token)
+def refresh_access_token(
+    bucket: Bucket = Depends(get_db_bucket), refresh_token: str = Body(..., embed=True)
+):
+    """
+    Get a new access token, with the current roles and status of the user, and a
+    new refresh token. Each refresh token can be used only once.
+    """
+    try:
+        payload = decode_token(refresh_token, subject=refresh_token_jwt_subject)
+    except PyJWTError:
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Could not validate credentials"
+        )
+    stored_token = crud.refresh_token.revoke(bucket, token_id=payload.get("jti"))
+    if not stored_token or stored_token.username != payload.get("username"):
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Token revoked")
+    user = crud.user.get(bucket, username=stored_token.username)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     elif not crud.user.is_active(user):
         raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
-    return {
-        "access_token": create_access_token(
-            data={"username": user.username}, expires_delta=access_token_expires
-        ),
-        "token_type": "bearer",
-    }
+    return create_tokens(bucket, user=user)
+
+
+@router.post("/logout", response_model=Msg)
+def logout(
+    bucket: Bucket = Depends(get_db_bucket), refresh_token: str = Body(..., embed=True)
+):
+    """
+    Revoke a refresh token. Its access tokens are valid until they expire.
+    """
+    try:
+        payload = decode_token(refresh_token, subject=refresh_token_jwt_subject)
+    except PyJWTError:
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Could not validate credentials"
+        )
+    crud.refresh_token.revoke(bucket, token_id=payload.get("jti"))
+    return {"msg": "Logged out"}
 
 
 @router.post("/login/test-token", response_model=User)
@@ -51,11 +153,10 @@ def test_token(current_user: UserInDB = Depends(get_current_user)):
 
 
 @router.post("/password-recovery/{username}", response_model=Msg)
-def recover_password(username: str):
+def recover_password(username: str, bucket: Bucket = Depends(get_db_bucket)):
     """
     Password Recovery.
     """
-    bucket = get_default_bucket()
     user = crud.user.get(bucket, username=username)
 
     if not user:
@@ -71,14 +172,17 @@ def recover_password(username: str):
 
 
 @router.post("/reset-password/", response_model=Msg)
-def reset_password(token: str = Body(...), new_password: str = Body(...)):
+def reset_password(
+    bucket: Bucket = Depends(get_db_bucket),
+    token: str = Body(...),
+    new_password: str = Body(...),
+):
     """
     Reset password.
     """
     username = verify_password_reset_token(token)
     if not username:
         raise HTTPException(status_code=400, detail="Invalid token")
-    bucket = get_default_bucket()
     user = crud.user.get(bucket, username=username)
     if not user:
         raise HTTPException(
@@ -88,5 +192,5 @@ def reset_password(token: str = Body(...), new_password: str = Body(...)):
     elif not crud.user.is_active(user):
         raise HTTPException(status_code=400, detail="Inactive user")
     user_in = UserUpdate(name=username, password=new_password)
-    user = crud.user.update(bucket, username=username, user_in=user_in)
+    user = crud.user.update(bucket, user=user, user_in=user_in)
     return {"msg": "Password updated successfully"}
@@ -1,12 +1,32 @@
 from typing import List
 
+from couchbase.bucket import Bucket
+from couchbase.mutation_state import MutationState
 from fastapi import APIRouter, Body, Depends, HTTPException
 from pydantic.networks import EmailStr
+from starlette.requests import Request
+from starlette.responses import Response
 
 from app import crud
-from app.api.utils.security import get_current_active_superuser, get_current_active_user
+from app.api.utils.consistency import get_mutation_state, set_mutation_state
+from app.api.utils.db import get_db_bucket
+from app.api.utils.pagination import get_start_after, set_next_cursor
+from app.api.utils.search import (
+    check_facets,
+    get_facets,
+    get_search_cursors,
+    set_search_headers,
+)
+from app.api.utils.security import (
+    get_current_active_principal,
+    get_current_active_superuser,
+    get_current_active_user,
+)
+from app.api.utils.streaming import stream_n1ql_response, wants_ndjson
 from app.core import config
-from app.db.database import get_default_bucket
+from app.models.config import USERPROFILE_DOC_TYPE
+from app.models.consistency import ScanConsistency
+from app.models.token import Principal
 from app.models.user import User, UserCreate, UserInDB, UserUpdate
 from app.utils import send_new_account_email
 
@@ -15,24 +35,62 @@ router = APIRouter()
 
 @router.get("/", response_model=List[User])
 def read_users(
+    request: Request,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
     skip: int = 0,
     limit: int = 100,
-    current_user: UserInDB = Depends(get_current_active_superuser),
+    start_after: str = Depends(get_start_after),
+    stream: bool = False,
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = Depends(get_mutation_state),
+    current_user: Principal = Depends(get_current_active_superuser),
 ):
     """
     Retrieve users.
+
+    When there are more users, the `X-Next-Cursor` response header has the
+    `cursor` to pass to get the next page.
+
+    With `stream`, or with an `Accept: application/x-ndjson` header, the users are
+    streamed as they are read, as a JSON array or as NDJSON.
+
+    Pass `consistency` or the `X-Couchbase-Mutation-State` header returned by
+    your own writes as when reading items.
     """
-    bucket = get_default_bucket()
-    users = crud.user.get_multi(bucket, skip=skip, limit=limit)
+    if stream or wants_ndjson(request):
+        query = crud.utils.get_doc_results_by_type_query(
+            doc_type=USERPROFILE_DOC_TYPE,
+            doc_model=User,
+            skip=skip,
+            limit=limit,
+            start_after=start_after,
+            consistency=consistency,
+            mutation_state=mutation_state,
+        )
+        return stream_n1ql_response(request, query, doc_model=User)
+    users = crud.user.get_multi(
+        bucket,
+        skip=skip,
+        limit=limit,
+        start_after=start_after,
+        consistency=consistency,
+        mutation_state=mutation_state,
+    )
+    set_next_cursor(response, users, limit=limit, get_cursor=crud.user.get_cursor)
     return users
 
 
 @router.get("/search/", response_model=List[User])
 def search_users(
     q: str,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
     skip: int = 0,
     limit: int = 100,
-    current_user: UserInDB = Depends(get_current_active_superuser),
+    facets: List[str] = Depends(get_facets),
+    cursors: tuple = Depends(get_search_cursors),
+    current_user: Principal = Depends(get_current_active_superuser),
 ):
     """
     Search users, use Bleve Query String syntax:
@@ -40,29 +98,52 @@ def search_users(
 
     For typeahead suffix with `*`. For example, a query with: `email:johnd*` will match
     users with email `johndoe@example.com`, `johndid@example.net`, etc.
+
+    Deep pages are faster with `search_after` (or `search_before`) set to the
+    `X-Next-Cursor` (or `X-Prev-Cursor`) header of the previous page, than with
+    `skip`.
+
+    The total number of hits is in the `X-Total-Count` header. The term counts of
+    the `facet` fields (`admin_roles`, `admin_channels`, `disabled`) are in the
+    `X-Search-Facets` header.
     """
-    bucket = get_default_bucket()
-    users = crud.user.search(bucket=bucket, query_string=q, skip=skip, limit=limit)
-    return users
+    search_after, search_before = cursors
+    check_facets(facets, allowed=crud.user.search_facet_fields)
+    results = crud.user.search(
+        bucket=bucket,
+        query_string=q,
+        facets=facets,
+        skip=skip,
+        limit=limit,
+        search_after=search_after,
+        search_before=search_before,
+    )
+    set_search_headers(response, results)
+    return results.docs
 
 
 @router.post("/", response_model=User)
 def create_user(
     *,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
     user_in: UserCreate,
-    current_user: UserInDB = Depends(get_current_active_superuser),
+    mutation_state: MutationState = Depends(get_mutation_state),
+    current_user: Principal = Depends(get_current_active_superuser),
 ):
     """
     Create new user.
     """
-    bucket = get_default_bucket()
     user = crud.user.get(bucket, username=user_in.username)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this username already exists in the system.",
         )
-    user = crud.user.upsert(bucket, user_in=user_in, persist_to=1)
+    user = crud.user.upsert(
+        bucket, user_in=user_in, persist_to=1, mutation_state=mutation_state
+    )
+    set_mutation_state(response, mutation_state)
     if config.EMAILS_ENABLED and user_in.email:
         send_new_account_email(
             email_to=user_in.email, username=user_in.username, password=user_in.password
@@ -73,6 +154,7 @@ def create_user(
 @router.put("/me", response_model=User)
 def update_user_me(
     *,
+    bucket: Bucket = Depends(get_db_bucket),
     password: str = Body(None),
     full_name: str = Body(None),
     email: EmailStr = Body(None),
@@ -81,15 +163,20 @@ def update_user_me(
     """
     Update own user.
     """
-    user_in = UserUpdate(**current_user.dict())
+    fields = {}
     if password is not None:
-        user_in.password = password
+        fields["password"] = password
     if full_name is not None:
-        user_in.full_name = full_name
+        fields["full_name"] = full_name
     if email is not None:
-        user_in.email = email
-    bucket = get_default_bucket()
+        fields["email"] = email
+    user_in = UserUpdate(**fields)
+    # Only the given fields, read and written checked with CAS instead of from the
+    # current user, that can be cached, so a concurrent change of its roles or status
+    # isn't overwritten
     user = crud.user.update(bucket, username=current_user.username, user_in=user_in)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
@@ -104,6 +191,7 @@ def read_user_me(current_user: UserInDB = Depends(get_current_active_user)):
 @router.post("/open", response_model=User)
 def create_user_open(
     *,
+    bucket: Bucket = Depends(get_db_bucket),
     username: str = Body(...),
     password: str = Body(...),
     email: EmailStr = Body(None),
@@ -117,7 +205,6 @@ def create_user_open(
             status_code=403,
             detail="Open user resistration is forbidden on this server",
         )
-    bucket = get_default_bucket()
     user = crud.user.get(bucket, username=username)
     if user:
         raise HTTPException(
@@ -136,13 +223,16 @@ def create_user_open(
 
 
 @router.get("/{username}", response_model=User)
-def read_user(username: str, current_user: UserInDB = Depends(get_current_active_user)):
+def read_user(
+    username: str,
+    bucket: Bucket = Depends(get_db_bucket),
+    current_user: Principal = Depends(get_current_active_principal),
+):
     """
     Get a specific user by username (email).
     """
-    bucket = get_default_bucket()
     user = crud.user.get(bucket, username=username)
-    if user == current_user:
+    if user and user.username == current_user.username:
         return user
     if not crud.user.is_superuser(current_user):
         raise HTTPException(
@@ -154,14 +244,16 @@ def read_user(username: str, current_user: UserInDB = Depends(get_current_active
 @router.put("/{username}", response_model=User)
 def update_user(
     *,
+    response: Response,
+    bucket: Bucket = Depends(get_db_bucket),
     username: str,
     user_in: UserUpdate,
-    current_user: UserInDB = Depends(get_current_active_superuser),
+    mutation_state: MutationState = Depends(get_mutation_state),
+    current_user: Principal = Depends(get_current_active_superuser),
 ):
     """
     Update a user.
     """
-    bucket = get_default_bucket()
     user = crud.user.get(bucket, username=username)
 
     if not user:
@@ -169,5 +261,8 @@ def update_user(
             status_code=404,
             detail="The user with this username does not exist in the system",
         )
-    user = crud.user.update(bucket, username=username, user_in=user_in)
+    user = crud.user.update(
+        bucket, user=user, user_in=user_in, mutation_state=mutation_state
+    )
+    set_mutation_state(response, mutation_state)
     return user
@@ -1,10 +1,15 @@
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
+from app import crud
 from app.api.utils.security import get_current_active_superuser
+from app.core import http_client
 from app.core.celery_app import celery_app
+from app.core.login_throttle import login_throttle
+from app.core.security import password_hasher
+from app.db.database import bucket_pool
 from app.models.msg import Msg
-from app.models.user import UserInDB
+from app.models.token import Principal
 from app.utils import send_test_email
 
 router = APIRouter()
@@ -12,7 +17,7 @@ router = APIRouter()
 
 @router.post("/test-celery/", response_model=Msg, status_code=201)
 def test_celery(
-    msg: Msg, current_user: UserInDB = Depends(get_current_active_superuser)
+    msg: Msg, current_user: Principal = Depends(get_current_active_superuser)
 ):
     """
     Test Celery worker.
@@ -23,10 +28,29 @@ def test_celery(
 
 @router.post("/test-email/", response_model=Msg, status_code=201)
 def test_email(
-    email_to: EmailStr, current_user: UserInDB = Depends(get_current_active_superuser)
+    email_to: EmailStr, current_user: Principal = Depends(get_current_active_superuser)
 ):
     """
     Test emails.
     """
     send_test_email(email_to=email_to)
     return {"msg": "Test email sent"}
+
+
+@router.get("/metrics/")
+def read_metrics(current_user: Principal = Depends(get_current_active_superuser)):
+    """
+    Read internal metrics of this worker process.
+    """
+    return {
+        "couchbase_pool": bucket_pool.stats(),
+        "doc_cache": crud.utils.doc_cache.stats(),
+        "search_cache": crud.utils.search_cache.stats(),
+        "principal_cache": crud.principal_cache.principal_cache.stats(),
+        "token_revocations": crud.token_revocations.token_revocations.stats(),
+        "password_hashing": password_hasher.stats(),
+        "login_throttle": login_throttle.stats(),
+        "unknown_usernames": crud.user.unknown_usernames.stats(),
+        "n1ql_statements": crud.statements.statement_registry.stats(),
+        "http": http_client.stats(),
+    }
@@ -0,0 +1,28 @@
+from couchbase.mutation_state import MutationState
+from fastapi import Header, HTTPException
+from starlette.responses import Response
+
+from app import crud
+
+MUTATION_STATE_HEADER = "X-Couchbase-Mutation-State"
+
+
+def get_mutation_state(x_couchbase_mutation_state: str = Header(None)):
+    """
+    Decode the mutation tokens of the client's own recent writes, sent back in the
+    `X-Couchbase-Mutation-State` header, to add the new writes to them and to use
+    them for `at_plus` queries.
+    """
+    if not x_couchbase_mutation_state:
+        return MutationState()
+    try:
+        return crud.utils.decode_mutation_state(x_couchbase_mutation_state)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid mutation state")
+
+
+def set_mutation_state(response: Response, mutation_state: MutationState):
+    if mutation_state:
+        response.headers[MUTATION_STATE_HEADER] = crud.utils.encode_mutation_state(
+            mutation_state
+        )
@@ -0,0 +1,18 @@
+from couchbase.exceptions import CouchbaseNetworkError
+
+from app.db.database import async_bucket_holder, bucket_pool
+
+
+def get_db_bucket():
+    with bucket_pool.checkout() as bucket:
+        yield bucket
+
+
+async def get_async_db_bucket():
+    bucket = await async_bucket_holder.get()
+    try:
+        yield bucket
+    except CouchbaseNetworkError:
+        # Reconnect on the next request
+        async_bucket_holder.reset()
+        raise
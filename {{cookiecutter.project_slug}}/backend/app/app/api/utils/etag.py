@@ -0,0 +1,36 @@
+from fastapi import Header, HTTPException
+from starlette.responses import Response
+
+ETAG_HEADER = "ETag"
+
+
+def get_if_match_cas(if_match: str = Header(None)) -> int:
+    """
+    Get the CAS from an `If-Match` header with the `ETag` of a previous read,
+    to only write if the document didn't change since. It's 0 without it.
+    """
+    if not if_match or if_match.strip() == "*":
+        return 0
+    etag = if_match.strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    try:
+        return int(etag.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+
+def set_etag(response: Response, cas: int):
+    if cas:
+        response.headers[ETAG_HEADER] = f'"{cas}"'
+
+
+def get_cas_mismatch_error(cas: int) -> HTTPException:
+    if cas:
+        return HTTPException(
+            status_code=412, detail="The document was modified since it was read"
+        )
+    # Still changing after all the retries
+    return HTTPException(
+        status_code=409, detail="The document is being modified concurrently"
+    )
@@ -0,0 +1,29 @@
+from typing import Callable, List
+
+from fastapi import HTTPException
+from starlette.responses import Response
+
+from app import crud
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+
+
+def get_start_after(cursor: str = None):
+    """
+    Decode the opaque `cursor` query parameter into the document ID to start after.
+    """
+    if not cursor:
+        return ""
+    try:
+        return crud.utils.decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def set_next_cursor(
+    response: Response, docs: List, *, limit: int, get_cursor: Callable
+):
+    # A short page is the last one
+    if docs and len(docs) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = get_cursor(docs[-1])
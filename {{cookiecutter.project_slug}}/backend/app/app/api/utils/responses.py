@@ -0,0 +1,15 @@
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+from app.core import json_codec
+
+
+class CodecJSONResponse(JSONResponse):
+    """
+    JSON response rendered with the fast JSON codec, the default response
+    class of the app.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json_codec.dumps(content)
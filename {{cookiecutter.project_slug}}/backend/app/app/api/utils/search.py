@@ -0,0 +1,64 @@
+import json
+from typing import Collection, List, Optional, Tuple
+
+from fastapi import HTTPException, Query
+from starlette.responses import Response
+
+from app import crud
+from app.api.utils.pagination import NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER
+from app.crud.utils import SearchResults
+
+TOTAL_COUNT_HEADER = "X-Total-Count"
+FACETS_HEADER = "X-Search-Facets"
+
+
+def get_facets(facet: List[str] = Query(None)) -> List[str]:
+    """
+    Fields to count the most frequent terms of, in all the search hits, e.g.
+    `?facet=owner_username`.
+    """
+    return facet or []
+
+
+def get_search_cursors(
+    search_after: str = None, search_before: str = None
+) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+    """
+    Decode the opaque `search_after` and `search_before` query parameters, from
+    the `X-Next-Cursor` and `X-Prev-Cursor` headers of a previous page.
+    """
+    if search_after and search_before:
+        raise HTTPException(
+            status_code=400,
+            detail="Only one of search_after and search_before can be used",
+        )
+    try:
+        return (
+            crud.utils.decode_search_cursor(search_after) if search_after else None,
+            crud.utils.decode_search_cursor(search_before) if search_before else None,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid search cursor")
+
+
+def check_facets(facets: List[str], *, allowed: Collection[str]):
+    invalid = sorted(set(facets) - set(allowed))
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid facets: {', '.join(invalid)}. "
+            f"Allowed: {', '.join(sorted(allowed))}",
+        )
+
+
+def set_search_headers(response: Response, results: SearchResults):
+    # The total number of hits, not only the ones in this page
+    response.headers[TOTAL_COUNT_HEADER] = str(results.total_hits)
+    if results.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = results.next_cursor
+    if results.prev_cursor:
+        response.headers[PREV_CURSOR_HEADER] = results.prev_cursor
+    if results.facets:
+        response.headers[FACETS_HEADER] = json.dumps(
+            results.facets, separators=(",", ":")
+        )
@@ -1,31 +1,51 @@
-import jwt
-from fastapi import HTTPException, Security
+from couchbase.bucket import Bucket
+from fastapi import Depends, HTTPException, Security
 from fastapi.security import OAuth2PasswordBearer
 from jwt import PyJWTError
+from pydantic import ValidationError
 from starlette.status import HTTP_403_FORBIDDEN
 
 from app import crud
-from app.core import config
-from app.core.jwt import ALGORITHM
-from app.db.database import get_default_bucket
-from app.models.token import TokenPayload
+from app.api.utils.db import get_db_bucket
+from app.core.jwt import access_token_jwt_subject, decode_token
+from app.models.token import Principal, TokenPayload
 from app.models.user import UserInDB
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl="/api/v1/login/access-token")
 
 
-def get_current_user(token: str = Security(reusable_oauth2)):
+def get_token_payload(
+    bucket: Bucket = Depends(get_db_bucket), token: str = Security(reusable_oauth2)
+) -> TokenPayload:
     try:
-        payload = jwt.decode(token, config.SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token, subject=access_token_jwt_subject)
         token_data = TokenPayload(**payload)
-    except PyJWTError:
+    except (PyJWTError, ValidationError):
         raise HTTPException(
             status_code=HTTP_403_FORBIDDEN, detail="Could not validate credentials"
         )
-    bucket = get_default_bucket()
+    if crud.token_revocations.token_revocations.is_revoked(
+        bucket, token_data.username, issued_at=token_data.iat
+    ):
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Token revoked")
+    return token_data
+
+
+def get_current_user(
+    bucket: Bucket = Depends(get_db_bucket),
+    token_data: TokenPayload = Security(get_token_payload),
+):
+    principal_cache = crud.principal_cache.principal_cache
+    user = principal_cache.get(token_data.username, issued_at=token_data.iat)
+    if user:
+        return user
+    generation = principal_cache.generation()
     user = crud.user.get(bucket, username=token_data.username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    principal_cache.set(
+        token_data.username, issued_at=token_data.iat, user=user, generation=generation
+    )
     return user
 
 
@@ -35,7 +55,34 @@ def get_current_active_user(current_user: UserInDB = Security(get_current_user))
     return current_user
 
 
-def get_current_active_superuser(current_user: UserInDB = Security(get_current_user)):
+def get_current_principal(token_data: TokenPayload = Security(get_token_payload)):
+    """
+    Authenticate from the claims of the access token alone, without reading the
+    user, for endpoints that only need its username, roles and status.
+    """
+    if token_data.roles is None or token_data.disabled is None:
+        # Issued before tokens had claims
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Could not validate credentials"
+        )
+    return Principal(
+        username=token_data.username,
+        admin_roles=token_data.roles,
+        disabled=token_data.disabled,
+    )
+
+
+def get_current_active_principal(
+    current_user: Principal = Security(get_current_principal),
+):
+    if not crud.user.is_active(current_user):
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
+
+def get_current_active_superuser(
+    current_user: Principal = Security(get_current_principal),
+):
     if not crud.user.is_superuser(current_user):
         raise HTTPException(
             status_code=400, detail="The user doesn't have enough privileges"
@@ -0,0 +1,68 @@
+import logging
+from typing import Iterator, Type
+
+from couchbase.n1ql import N1QLQuery
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from app import crud
+from app.core import json_codec
+from app.crud.utils import PydanticModel
+from app.db.database import bucket_pool
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+JSON_MEDIA_TYPE = "application/json"
+
+
+def wants_ndjson(request: Request):
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def iter_n1ql_models(
+    query: N1QLQuery, *, doc_model: Type[PydanticModel]
+) -> Iterator[PydanticModel]:
+    # The rows are read from Couchbase as they are consumed, the bucket is
+    # checked out of the pool only while streaming
+    with bucket_pool.checkout() as bucket:
+        for row in crud.statements.iter_query(bucket, query):
+            yield crud.utils.doc_result_to_model(row, doc_model=doc_model)
+
+
+def encode_model(doc: PydanticModel) -> bytes:
+    return json_codec.dumps(doc)
+
+
+def iter_ndjson(docs: Iterator[PydanticModel]) -> Iterator[bytes]:
+    for doc in docs:
+        yield encode_model(doc) + b"\n"
+
+
+def iter_json_array(docs: Iterator[PydanticModel]) -> Iterator[bytes]:
+    yield b"["
+    separator = b""
+    try:
+        for doc in docs:
+            yield separator + encode_model(doc)
+            separator = b","
+    except Exception:
+        # The status code is already sent, abort the response without closing the
+        # array, so the client gets an invalid body instead of truncated results
+        logging.exception("Error streaming JSON array")
+        raise
+    yield b"]"
+
+
+def stream_n1ql_response(
+    request: Request, query: N1QLQuery, *, doc_model: Type[PydanticModel]
+):
+    """
+    Stream the results of a N1QL query as NDJSON, when the request accepts it,
+    or as a chunked JSON array otherwise.
+
+    `doc_model` should be the response model, as the results are not
+    filtered by FastAPI.
+    """
+    docs = iter_n1ql_models(query, doc_model=doc_model)
+    if wants_ndjson(request):
+        return StreamingResponse(iter_ndjson(docs), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(iter_json_array(docs), media_type=JSON_MEDIA_TYPE)
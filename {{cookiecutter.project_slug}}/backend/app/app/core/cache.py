@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread safe in-process cache, bounded by size and by the age of the entries.
+
+    When full, the least recently used entry is evicted. `get()` returns
+    `MISSING` (or the given default) for absent and expired keys, so `None` can
+    be cached too.
+    """
+
+    def __init__(self, *, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable, default=MISSING):
+        """
+        Like `get()`, but without counting a hit or miss or refreshing the LRU order.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return default
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, *, ttl: float = None):
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_matching(self, predicate: Callable[[Hashable], bool]):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "ttl_secs": self.ttl,
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -15,7 +15,14 @@ SECRET_KEY = os.getenvb(b"SECRET_KEY")
 if not SECRET_KEY:
     SECRET_KEY = os.urandom(32)
 
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 8  # 60 minutes * 24 hours * 8 days = 8 days
+# Access tokens carry the roles and status of the user, to authorize without reading
+# it. The bundled frontend doesn't use refresh tokens yet, so they last as long as
+# before by default, lower it, e.g. to 15 minutes, with clients that refresh them.
+# Refresh tokens are stored, to be able to revoke them
+ACCESS_TOKEN_EXPIRE_MINUTES = int(
+    os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", str(60 * 24 * 8))
+)  # 60 minutes * 24 hours * 8 days = 8 days
+REFRESH_TOKEN_EXPIRE_MINUTES = 60 * 24 * 8  # 60 minutes * 24 hours * 8 days = 8 days
 
 SERVER_NAME = os.getenv("SERVER_NAME")
 SERVER_HOST = os.getenv("SERVER_HOST")
@@ -47,14 +54,117 @@ COUCHBASE_SYNC_GATEWAY_DATABASE = os.getenv("COUCHBASE_SYNC_GATEWAY_DATABASE")
 COUCHBASE_DURABILITY_TIMEOUT_SECS = 60.0
 COUCHBASE_OPERATION_TIMEOUT_SECS = 30.0
 COUCHBASE_N1QL_TIMEOUT_SECS = 300.0
-
+# Read-modify-write retries when the document changed (CAS mismatch)
+COUCHBASE_CAS_MAX_RETRIES = 5
+COUCHBASE_CAS_RETRY_BACKOFF_SECS = 0.005
+# Default scan consistency of N1QL queries without mutation tokens,
+# "request_plus" or "not_bounded"
+COUCHBASE_N1QL_SCAN_CONSISTENCY = os.getenv(
+    "COUCHBASE_N1QL_SCAN_CONSISTENCY", "request_plus"
+)
+
+# Couchbase connection pool, one per worker process. Requests hold a bucket until
+# their response is sent, so there are as many as the threads that run sync
+# endpoints, 40 in Starlette. Requests that still wait longer get a 503
+COUCHBASE_POOL_SIZE = int(os.getenv("COUCHBASE_POOL_SIZE", "40"))
+COUCHBASE_POOL_CHECKOUT_TIMEOUT_SECS = float(
+    os.getenv("COUCHBASE_POOL_CHECKOUT_TIMEOUT_SECS", "1")
+)
+COUCHBASE_POOL_HEALTH_CHECK_INTERVAL_SECS = 30.0
+
+# In-process document cache, per document type
+DOC_CACHE_ENABLED = getenv_boolean("DOC_CACHE_ENABLED")
+DOC_CACHE_USERPROFILE_SIZE = int(os.getenv("DOC_CACHE_USERPROFILE_SIZE", "1000"))
+DOC_CACHE_USERPROFILE_TTL_SECS = float(
+    os.getenv("DOC_CACHE_USERPROFILE_TTL_SECS", "10")
+)
+DOC_CACHE_ITEM_SIZE = int(os.getenv("DOC_CACHE_ITEM_SIZE", "10000"))
+DOC_CACHE_ITEM_TTL_SECS = float(os.getenv("DOC_CACHE_ITEM_TTL_SECS", "10"))
+
+# In-process cache of full text search hits, cleared by writes to the same type
+SEARCH_CACHE_ENABLED = getenv_boolean("SEARCH_CACHE_ENABLED", True)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+SEARCH_CACHE_TTL_SECS = float(os.getenv("SEARCH_CACHE_TTL_SECS", "2"))
+# Max number of terms of each full text search facet
+SEARCH_FACET_SIZE = 10
+
+# In-process cache of the users authenticated with access tokens. Changes to users
+# made by other processes, e.g. disabling them, take effect after the TTL at most
+PRINCIPAL_CACHE_ENABLED = getenv_boolean("PRINCIPAL_CACHE_ENABLED", True)
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1000"))
+PRINCIPAL_CACHE_TTL_SECS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECS", "5"))
+
+# In-process cache of the access token revocations stored in DB, by username.
+# Revocations made by other processes take effect after the TTL at most
+TOKEN_REVOCATIONS_SIZE = int(os.getenv("TOKEN_REVOCATIONS_SIZE", "10000"))
+TOKEN_REVOCATIONS_TTL_SECS = float(os.getenv("TOKEN_REVOCATIONS_TTL_SECS", "5"))
+
+# Processes for password hashing, per worker process, 0 to hash in the request
+# thread. Operations beyond workers + max queue are rejected with a 503
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "16"))
+PASSWORD_HASH_TIMEOUT_SECS = 10.0
+
+# Password hashing scheme, "bcrypt" or "argon2" (requires argon2-cffi), and its
+# cost, calibrate it with scripts/calibrate_password_hash.py. Stored hashes with
+# other settings are rehashed in the background on the next login
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+PASSWORD_HASH_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_HASH_BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_ARGON2_ROUNDS = int(os.getenv("PASSWORD_HASH_ARGON2_ROUNDS", "2"))
+PASSWORD_HASH_ARGON2_MEMORY_COST = int(
+    os.getenv("PASSWORD_HASH_ARGON2_MEMORY_COST", "512")
+)
+PASSWORD_REHASH_ON_LOGIN = getenv_boolean("PASSWORD_REHASH_ON_LOGIN", True)
+
+# Failed logins after the free ones, by username and by client IP, double the time
+# to wait for the next try, up to the max. Counted per worker process
+LOGIN_FREE_FAILURES_PER_USERNAME = int(
+    os.getenv("LOGIN_FREE_FAILURES_PER_USERNAME", "5")
+)
+LOGIN_FREE_FAILURES_PER_CLIENT = int(os.getenv("LOGIN_FREE_FAILURES_PER_CLIENT", "20"))
+# Behind a proxy, the client IP is the proxy's unless the server trusts its
+# X-Forwarded-For header, with FORWARDED_ALLOW_IPS, so it's off by default
+LOGIN_THROTTLE_BY_CLIENT = getenv_boolean("LOGIN_THROTTLE_BY_CLIENT", False)
+LOGIN_BACKOFF_BASE_SECS = 1.0
+LOGIN_BACKOFF_MAX_SECS = float(os.getenv("LOGIN_BACKOFF_MAX_SECS", "900"))
+LOGIN_FAILURES_SIZE = 10000
+# Max number of logins verifying passwords at once, per worker process
+LOGIN_MAX_CONCURRENT_VERIFICATIONS = int(
+    os.getenv("LOGIN_MAX_CONCURRENT_VERIFICATIONS", "4")
+)
+# Usernames that don't exist, cached so that bursts of logins with them don't read
+# from DB. Users created by other processes can't log in here until the TTL expires,
+# so it's short
+LOGIN_UNKNOWN_USERNAMES_SIZE = 10000
+LOGIN_UNKNOWN_USERNAMES_TTL_SECS = float(
+    os.getenv("LOGIN_UNKNOWN_USERNAMES_TTL_SECS", "1")
+)
+
+# Create models from documents with the current schema version without validation
+TRUSTED_READS_ENABLED = getenv_boolean("TRUSTED_READS_ENABLED", True)
+
+# Max number of documents in a single batch request
+BATCH_MAX_SIZE = 1000
 
 # Couchbase Sync Gateway settings
 COUCHBASE_CORS_ORIGINS = os.getenv("COUCHBASE_CORS_ORIGINS")
 # a string of origins separated by commas, e.g: "http://localhost:5984, http://localhost, http://localhost:4200, http://localhost:3000, http://localhost:8080, http://dev.couchbase-project.com, https://stag.couchbase-project.com, https://db.stag.couchbase-project.com, https://couchbase-project.com, https://db.couchbase-project.com, http://local.dockertoolbox.tiangolo.com, http://local.dockertoolbox.tiangolo.com:5984"
-COUCHBASE_AUTH_TIMEOUT = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+COUCHBASE_AUTH_TIMEOUT = REFRESH_TOKEN_EXPIRE_MINUTES * 60
 
 COUCHBASE_FULL_TEXT_INDEX_DEFINITIONS_DIR = "/app/app/search_index_definitions/"
+# Max number of documents read, or checked to exist, at once for search hits
+COUCHBASE_FULL_TEXT_GET_MULTI_CHUNK_SIZE = 100
+
+# HTTP calls to Sync Gateway, Full Text Search and the cluster REST API, with
+# pooled connections. Idempotent calls are retried, with backoff
+HTTP_SYNC_GATEWAY_TIMEOUT_SECS = float(os.getenv("HTTP_SYNC_GATEWAY_TIMEOUT_SECS", "5"))
+HTTP_FULL_TEXT_SEARCH_TIMEOUT_SECS = float(
+    os.getenv("HTTP_FULL_TEXT_SEARCH_TIMEOUT_SECS", "30")
+)
+HTTP_CLUSTER_TIMEOUT_SECS = float(os.getenv("HTTP_CLUSTER_TIMEOUT_SECS", "30"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_RETRY_BACKOFF_SECS = 0.2
+HTTP_POOL_SIZE = 10
 
 SMTP_TLS = getenv_boolean("SMTP_TLS", True)
 SMTP_PORT = None
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.core import config
+
+# Server errors that a retry can get past, e.g. a node starting or restarting
+RETRY_STATUSES = (502, 503, 504)
+
+
+class HTTPService:
+    """
+    HTTP client of one of the services the backend calls, e.g. Sync Gateway.
+
+    Connections are kept alive in a pool, per process, and requests have a
+    timeout. Idempotent requests (GET, PUT, DELETE, etc.) are retried with
+    backoff on connection errors and on `RETRY_STATUSES`, POST requests aren't.
+    After the last retry, the last response is returned as is, for the caller to
+    check its status.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        timeout: float,
+        retries: int = config.HTTP_RETRIES,
+        backoff: float = config.HTTP_RETRY_BACKOFF_SECS,
+        pool_size: int = config.HTTP_POOL_SIZE,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._reset()
+
+    def _reset(self):
+        # Connections can't be shared with a forked child, each process gets its own
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._session = None
+        self.requests = 0
+        self.errors = 0
+        self.time_total = 0.0
+        self.time_max = 0.0
+
+    def _get_session(self) -> requests.Session:
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            if self._session is None:
+                retry = Retry(
+                    total=self.retries,
+                    backoff_factor=self.backoff,
+                    status_forcelist=RETRY_STATUSES,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        session = self._get_session()
+        start = time.monotonic()
+        error = True
+        try:
+            response = session.request(method, url, **kwargs)
+            error = False
+            return response
+        finally:
+            duration = time.monotonic() - start
+            with self._lock:
+                self.requests += 1
+                self.errors += error
+                self.time_total += duration
+                self.time_max = max(self.time_max, duration)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "time_total_secs": self.time_total,
+                "time_max_secs": self.time_max,
+                "time_avg_secs": (
+                    self.time_total / self.requests if self.requests else 0.0
+                ),
+            }
+
+
+sync_gateway = HTTPService(
+    "sync_gateway", timeout=config.HTTP_SYNC_GATEWAY_TIMEOUT_SECS
+)
+full_text_search = HTTPService(
+    "full_text_search", timeout=config.HTTP_FULL_TEXT_SEARCH_TIMEOUT_SECS
+)
+cluster = HTTPService("cluster", timeout=config.HTTP_CLUSTER_TIMEOUT_SECS)
+
+services: Dict[str, HTTPService] = {
+    service.name: service for service in [sync_gateway, full_text_search, cluster]
+}
+
+
+def stats():
+    return {name: service.stats() for name, service in services.items()}
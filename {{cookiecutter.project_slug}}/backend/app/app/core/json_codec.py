@@ -0,0 +1,56 @@
+"""
+JSON encoding and decoding for responses and Couchbase documents.
+
+Uses orjson when it's installed, and the standard library otherwise. Both
+encode Pydantic models, enums, datetimes, UUIDs and sets directly, so data
+doesn't have to go through `jsonable_encoder` first.
+"""
+
+import json
+from datetime import date, datetime, time
+from enum import Enum
+from typing import Any, Union
+from uuid import UUID
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(obj: Any):
+    # Types not supported natively by the backend
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default)
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+else:
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(
+            obj, default=_default, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
@@ -1,19 +1,48 @@
+import time
 from datetime import datetime, timedelta
 
 import jwt
+from jwt import InvalidTokenError
 
 from app.core import config
 
 ALGORITHM = "HS256"
 access_token_jwt_subject = "access"
+refresh_token_jwt_subject = "refresh"
 
 
 def create_access_token(*, data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire, "sub": access_token_jwt_subject})
+        expire = now + timedelta(minutes=15)
+    # With sub-second precision, to compare it with revocation times
+    to_encode.update(
+        {"exp": expire, "iat": time.time(), "sub": access_token_jwt_subject}
+    )
     encoded_jwt = jwt.encode(to_encode, config.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+def create_refresh_token(*, username: str, token_id: str, expires_delta: timedelta):
+    to_encode = {
+        "username": username,
+        "jti": token_id,
+        "exp": datetime.utcnow() + expires_delta,
+        "iat": time.time(),
+        "sub": refresh_token_jwt_subject,
+    }
+    return jwt.encode(to_encode, config.SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_token(token: str, *, subject: str) -> dict:
+    """
+    Decode and verify a token, raising `InvalidTokenError` if it's not valid or
+    it's for another use, e.g. a refresh token used as an access token.
+    """
+    payload = jwt.decode(token, config.SECRET_KEY, algorithms=[ALGORITHM])
+    if payload.get("sub") != subject:
+        raise InvalidTokenError("Invalid token subject")
+    return payload
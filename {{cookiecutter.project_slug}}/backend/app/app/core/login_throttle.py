@@ -0,0 +1,143 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Hashable, Optional
+
+from app.core import config
+from app.core.cache import LRUCache
+from app.core.security import PasswordHasherBusy
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many failed logins, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class FailureCounter:
+    """
+    Failed logins by key, e.g. username or client IP.
+
+    After `free_failures`, each failure blocks the key for twice as long as the
+    previous one, from `backoff_base` up to `backoff_max` seconds. Failures are
+    forgotten `backoff_max` seconds after the last one, or on a success.
+    """
+
+    def __init__(
+        self, *, free_failures: int, backoff_base: float, backoff_max: float, size: int
+    ):
+        self.free_failures = free_failures
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Entries are (failures, blocked until)
+        self._cache = LRUCache(size=size, ttl=backoff_max)
+        self._lock = threading.Lock()
+
+    def retry_after(self, key: Hashable) -> float:
+        _, blocked_until = self._cache.get(key, (0, 0.0))
+        return max(blocked_until - time.monotonic(), 0.0)
+
+    def record_failure(self, key: Hashable):
+        with self._lock:
+            failures, blocked_until = self._cache.get(key, (0, 0.0))
+            failures += 1
+            if failures > self.free_failures:
+                exponent = min(failures - self.free_failures - 1, 32)
+                delay = self.backoff_base * 2**exponent
+                blocked_until = time.monotonic() + min(delay, self.backoff_max)
+            self._cache.set(key, (failures, blocked_until))
+
+    def reset(self, key: Hashable):
+        self._cache.delete(key)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class LoginThrottle:
+    """
+    Limit the password verifications of logins, that are slow on purpose, so
+    that a burst of credential stuffing can't use all the CPU.
+
+    Usernames and clients with recent failed logins have to wait before trying
+    again, and at most `max_concurrent` logins verify passwords at once. The
+    state is per process.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrent: int,
+        username_failures: FailureCounter,
+        client_failures: FailureCounter,
+    ):
+        self.max_concurrent = max_concurrent
+        self.username_failures = username_failures
+        self.client_failures = client_failures
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._throttled = 0
+        self._busy = 0
+
+    def check(self, *, username: str, client: Optional[str]):
+        """
+        Raise `LoginThrottled` if the username or the client have to wait.
+        """
+        retry_after = self.username_failures.retry_after(username)
+        if client:
+            retry_after = max(retry_after, self.client_failures.retry_after(client))
+        if retry_after:
+            with self._lock:
+                self._throttled += 1
+            raise LoginThrottled(retry_after)
+
+    @contextmanager
+    def verification(self):
+        """
+        Hold one of the `max_concurrent` slots to verify a password, or raise
+        `PasswordHasherBusy` right away if there's none free.
+        """
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self._busy += 1
+            raise PasswordHasherBusy("Too many concurrent logins")
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    def record_failure(self, *, username: str, client: Optional[str]):
+        self.username_failures.record_failure(username)
+        if client:
+            self.client_failures.record_failure(client)
+
+    def record_success(self, *, username: str):
+        # Not the client, so that an account of the attacker can't reset it
+        self.username_failures.reset(username)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "throttled": self._throttled,
+                "busy": self._busy,
+                "username_failures": self.username_failures.stats(),
+                "client_failures": self.client_failures.stats(),
+            }
+
+
+login_throttle = LoginThrottle(
+    max_concurrent=config.LOGIN_MAX_CONCURRENT_VERIFICATIONS,
+    username_failures=FailureCounter(
+        free_failures=config.LOGIN_FREE_FAILURES_PER_USERNAME,
+        backoff_base=config.LOGIN_BACKOFF_BASE_SECS,
+        backoff_max=config.LOGIN_BACKOFF_MAX_SECS,
+        size=config.LOGIN_FAILURES_SIZE,
+    ),
+    client_failures=FailureCounter(
+        free_failures=config.LOGIN_FREE_FAILURES_PER_CLIENT,
+        backoff_base=config.LOGIN_BACKOFF_BASE_SECS,
+        backoff_max=config.LOGIN_BACKOFF_MAX_SECS,
+        size=config.LOGIN_FAILURES_SIZE,
+    ),
+)
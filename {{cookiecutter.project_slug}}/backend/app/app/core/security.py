@@ -1,11 +1,168 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.core import config
 
 
-def verify_password(plain_password: str, hashed_password: str):
+def get_crypt_context(
+    scheme: str, *, bcrypt_rounds: int, argon2_rounds: int, argon2_memory_cost: int
+) -> CryptContext:
+    """
+    Hash with `scheme` and the given cost, and verify bcrypt hashes too.
+
+    Hashes with another scheme or cost, smaller or larger, need an update.
+    """
+    return CryptContext(
+        schemes=list(dict.fromkeys([scheme, "bcrypt"])),
+        default=scheme,
+        deprecated="auto",
+        bcrypt__default_rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__default_rounds=argon2_rounds,
+        argon2__min_rounds=argon2_rounds,
+        argon2__max_rounds=argon2_rounds,
+        argon2__memory_cost=argon2_memory_cost,
+    )
+
+
+pwd_context = get_crypt_context(
+    config.PASSWORD_HASH_SCHEME,
+    bcrypt_rounds=config.PASSWORD_HASH_BCRYPT_ROUNDS,
+    argon2_rounds=config.PASSWORD_HASH_ARGON2_ROUNDS,
+    argon2_memory_cost=config.PASSWORD_HASH_ARGON2_MEMORY_COST,
+)
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password: str):
+def _hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+class PasswordHasher:
+    """
+    Pool of processes for password hashing, that is slow and CPU bound on
+    purpose, so it doesn't hold the request threads and the GIL.
+
+    At most `workers + max_queue` operations are admitted at once, more raise
+    `PasswordHasherBusy` right away instead of waiting in an unbounded queue,
+    so a login storm can't starve the rest of the endpoints. Without workers,
+    hashing runs in the calling thread.
+    """
+
+    def __init__(self, *, workers: int, max_queue: int, timeout: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        # A process pool can't be shared with a forked child, each process gets its own
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._in_flight = 0
+        self._operations = 0
+        self._rejected = 0
+        self._errors = 0
+        self._time_total = 0.0
+        self._time_max = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _run(self, func, *args):
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise PasswordHasherBusy("Too many password hashing operations")
+            self._in_flight += 1
+        start = time.monotonic()
+        error = True
+        try:
+            if not self.workers:
+                result = func(*args)
+            else:
+                future = self._get_executor().submit(func, *args)
+                try:
+                    result = future.result(timeout=self.timeout)
+                finally:
+                    future.cancel()
+            error = False
+            return result
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for memory, start a new pool on next use
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            duration = time.monotonic() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._operations += 1
+                self._errors += error
+                self._time_total += duration
+                self._time_max = max(self._time_max, duration)
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self._run(_verify, plain_password, hashed_password)
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queued": max(self._in_flight - self.workers, 0),
+                "operations": self._operations,
+                "rejected": self._rejected,
+                "errors": self._errors,
+                "time_total_secs": self._time_total,
+                "time_max_secs": self._time_max,
+                "time_avg_secs": (
+                    self._time_total / self._operations if self._operations else 0.0
+                ),
+            }
+
+
+password_hasher = PasswordHasher(
+    workers=config.PASSWORD_HASH_WORKERS,
+    max_queue=config.PASSWORD_HASH_MAX_QUEUE,
+    timeout=config.PASSWORD_HASH_TIMEOUT_SECS,
+)
+
+
+def verify_password(plain_password: str, hashed_password: str):
+    return password_hasher.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password: str):
+    return password_hasher.hash(password)
+
+
+def password_needs_update(hashed_password: str) -> bool:
+    """
+    Whether the hash was made with other settings than the current ones. It
+    doesn't compute any hash, so it's cheap.
+    """
+    return pwd_context.needs_update(hashed_password)
@@ -1 +1,10 @@
-from . import item, user, utils
+from . import (
+    async_utils,
+    item,
+    principal_cache,
+    refresh_token,
+    statements,
+    token_revocations,
+    user,
+    utils,
+)
@@ -0,0 +1,185 @@
+import time
+from typing import List, Optional, Tuple, Type, Union
+
+from acouchbase.bucket import Bucket as AsyncBucket
+from couchbase.exceptions import N1QLError
+from couchbase.fulltext import Query
+from couchbase.mutation_state import MutationState
+from couchbase.n1ql import N1QLQuery
+
+from app.models.consistency import ScanConsistency
+from app.models.schema import doc_to_model
+
+from .doc_cache import doc_cache
+from .search_cache import search_cache
+from .statements import needs_reprepare
+from .utils import (
+    PydanticModel,
+    doc_results_to_model,
+    get_cached_values,
+    get_doc_results_by_type_query,
+)
+
+# asyncio counterparts of the primitives in utils, for async path operations.
+# Queries are built and results are converted with the same functions as the
+# synchronous versions, only the I/O differs.
+
+
+async def get_doc_with_cas(
+    bucket: AsyncBucket, *, doc_id: str, doc_model: Type[PydanticModel]
+) -> Tuple[Optional[PydanticModel], int]:
+    cached = doc_cache.get(doc_id)
+    if cached:
+        return doc_to_model(cached[1], doc_model=doc_model), cached[0]
+    result = await bucket.get(doc_id, quiet=True)
+    if not result.value:
+        return None, 0
+    doc_cache.set(doc_id, cas=result.cas, value=result.value)
+    model = doc_to_model(result.value, doc_model=doc_model)
+    return model, result.cas
+
+
+async def get_doc(
+    bucket: AsyncBucket, *, doc_id: str, doc_model: Type[PydanticModel]
+) -> Optional[PydanticModel]:
+    model, _ = await get_doc_with_cas(bucket, doc_id=doc_id, doc_model=doc_model)
+    return model
+
+
+async def get_docs_by_keys(
+    bucket: AsyncBucket, *, keys: List[str], doc_model=Type[PydanticModel]
+) -> List[PydanticModel]:
+    values, missing_keys = get_cached_values(keys)
+    if missing_keys:
+        results = await bucket.get_multi(missing_keys, quiet=True)
+        for key, result in results.items():
+            if not result.value:
+                continue
+            doc_cache.set(key, cas=result.cas, value=result.value)
+            values[key] = result.value
+    docs = []
+    for key in keys:
+        if key not in values:
+            continue
+        doc = doc_to_model(values[key], doc_model=doc_model)
+        docs.append(doc)
+    return docs
+
+
+async def _n1ql_query(bucket: AsyncBucket, query: N1QLQuery) -> list:
+    request = bucket.n1ql_query(query)
+    await request.future
+    return list(request)
+
+
+async def n1ql_query(bucket: AsyncBucket, query: N1QLQuery) -> list:
+    statement = getattr(query, "statement", None)
+    if statement is None:
+        return await _n1ql_query(bucket, query)
+    start = time.monotonic()
+    error = True
+    reprepared = False
+    try:
+        try:
+            rows = await _n1ql_query(bucket, query)
+        except N1QLError as e:
+            if not needs_reprepare(e):
+                raise
+            reprepared = True
+            rows = await _n1ql_query(bucket, query)
+        error = False
+    finally:
+        statement.record(time.monotonic() - start, error=error, reprepared=reprepared)
+    return rows
+
+
+async def get_docs(
+    bucket: AsyncBucket,
+    *,
+    doc_type: str,
+    doc_model=Type[PydanticModel],
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+) -> List[PydanticModel]:
+    q = get_doc_results_by_type_query(
+        doc_type=doc_type,
+        doc_model=doc_model,
+        skip=skip,
+        limit=limit,
+        start_after=start_after,
+        consistency=consistency,
+        mutation_state=mutation_state,
+    )
+    doc_results = await n1ql_query(bucket, q)
+    return doc_results_to_model(doc_results, doc_model=doc_model)
+
+
+async def upsert(
+    bucket: AsyncBucket, *, doc_id: str, doc_in: PydanticModel, persist_to=0, ttl=0
+) -> Optional[PydanticModel]:
+    doc_data = doc_in.dict()
+    result = await bucket.upsert(doc_id, doc_data, ttl=ttl, persist_to=persist_to)
+    if result.success:
+        doc_cache.set_written(doc_id, cas=result.cas, value=doc_data)
+        search_cache.invalidate(doc_id)
+        return doc_in
+    return None
+
+
+async def remove(
+    bucket: AsyncBucket,
+    *,
+    doc_id: str,
+    doc_model: Type[PydanticModel] = None,
+    persist_to=0,
+) -> Optional[Union[PydanticModel, bool]]:
+    result = await bucket.get(doc_id, quiet=True)
+    if not result.value:
+        return None
+    if doc_model:
+        model = doc_to_model(result.value, doc_model=doc_model)
+    result = await bucket.remove(doc_id, persist_to=persist_to)
+    if not result.success:
+        return None
+    doc_cache.invalidate(doc_id, cas=result.cas)
+    search_cache.invalidate(doc_id)
+    if doc_model:
+        return model
+    return True
+
+
+async def search(
+    bucket: AsyncBucket, *, index_name: str, query: Query, skip=0, limit=100, **kwargs
+) -> list:
+    request = bucket.search(index_name, query, skip=skip, limit=limit, **kwargs)
+    await request.future
+    return list(request)
+
+
+async def search_get_doc_ids(
+    bucket: AsyncBucket, *, index_name: str, query: Query, skip=0, limit=100
+) -> List[str]:
+    hits = await search(
+        bucket, index_name=index_name, query=query, skip=skip, limit=limit
+    )
+    return [hit["id"] for hit in hits]
+
+
+async def search_get_docs(
+    bucket: AsyncBucket,
+    *,
+    index_name: str,
+    query: Query,
+    doc_model: Type[PydanticModel],
+    skip=0,
+    limit=100,
+) -> List[PydanticModel]:
+    keys = await search_get_doc_ids(
+        bucket, index_name=index_name, query=query, skip=skip, limit=limit
+    )
+    if not keys:
+        return []
+    return await get_docs_by_keys(bucket, keys=keys, doc_model=doc_model)
@@ -0,0 +1,79 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+from app.core import config, json_codec
+from app.core.cache import LRUCache
+
+# The document type is the prefix of the document ids, as in "userprofile::johndoe"
+DOC_ID_SEPARATOR = "::"
+
+
+class DocCache:
+    """
+    Read-through cache of raw documents by id, with their CAS.
+
+    Only document types registered with `configure()` are cached. An entry is
+    only replaced by a read or write with a CAS at least as recent as the
+    cached one, so a slow read can't overwrite the result of a newer write.
+    Writes from other processes are only seen after the TTL of the entry.
+    """
+
+    def __init__(self, *, enabled: bool):
+        self.enabled = enabled
+        self._caches: Dict[str, LRUCache] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, doc_type: str, *, size: int, ttl: float):
+        self._caches[doc_type] = LRUCache(size=size, ttl=ttl)
+
+    def _get_cache(self, doc_id: str) -> Optional[LRUCache]:
+        if not self.enabled:
+            return None
+        doc_type, separator, _ = doc_id.partition(DOC_ID_SEPARATOR)
+        if not separator:
+            return None
+        return self._caches.get(doc_type)
+
+    def get(self, doc_id: str) -> Optional[Tuple[int, dict]]:
+        cache = self._get_cache(doc_id)
+        if cache is None:
+            return None
+        entry = cache.get(doc_id, None)
+        # Removed documents are kept as (cas, None) tombstones
+        if entry is None or entry[1] is None:
+            return None
+        return entry
+
+    def set(self, doc_id: str, *, cas: int, value: Optional[dict]):
+        cache = self._get_cache(doc_id)
+        if cache is None:
+            return
+        with self._lock:
+            current = cache.peek(doc_id, None)
+            if current is not None and current[0] > cas:
+                return
+            cache.set(doc_id, (cas, value))
+
+    def set_written(self, doc_id: str, *, cas: int, value: dict):
+        """
+        Like `set()`, for a document just written, cached as it's read back, with
+        enums, models, etc. as their JSON values.
+        """
+        if self._get_cache(doc_id) is None:
+            return
+        self.set(doc_id, cas=cas, value=json_codec.loads(json_codec.dumps(value)))
+
+    def invalidate(self, doc_id: str, *, cas: int = 0):
+        cache = self._get_cache(doc_id)
+        if cache is None:
+            return
+        if cas:
+            self.set(doc_id, cas=cas, value=None)
+        else:
+            cache.delete(doc_id)
+
+    def stats(self):
+        return {doc_type: cache.stats() for doc_type, cache in self._caches.items()}
+
+
+doc_cache = DocCache(enabled=config.DOC_CACHE_ENABLED)
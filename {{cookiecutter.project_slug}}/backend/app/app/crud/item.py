@@ -1,14 +1,34 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+from acouchbase.bucket import Bucket as AsyncBucket
 from couchbase.bucket import Bucket
-from couchbase.n1ql import CONSISTENCY_REQUEST, N1QLQuery
+from couchbase.mutation_state import MutationState
 
 from app.core import config
 from app.models.config import ITEM_DOC_TYPE
-from app.models.item import ItemCreate, ItemInDB, ItemUpdate
+from app.models.consistency import ScanConsistency
+from app.models.item import Item, ItemBatchResult, ItemCreate, ItemInDB, ItemUpdate
 
-from . import utils
+from . import async_utils, utils
+from .statements import iter_query, statement_registry
 
 # Same as file name /app/app/search_index_definitions/items.json
 full_text_index_name = "items"
+# Fields of the index that search results can have term facets of
+search_facet_fields = {"owner_username"}
+
+utils.doc_cache.configure(
+    ITEM_DOC_TYPE, size=config.DOC_CACHE_ITEM_SIZE, ttl=config.DOC_CACHE_ITEM_TTL_SECS
+)
+utils.search_cache.configure(full_text_index_name, doc_type=ITEM_DOC_TYPE)
+
+# Indexes with all the fields of the list queries, so they don't fetch documents
+covering_indexes = {
+    "idx_item_list": utils.get_index_fields(Item, keys=["META().id"]),
+    "idx_item_owner_list": utils.get_index_fields(
+        Item, keys=["owner_username", "META().id"]
+    ),
+}
 
 
 def get_doc_id(id: str):
@@ -20,6 +40,11 @@ def get(bucket: Bucket, *, id: str):
     return utils.get_doc(bucket=bucket, doc_id=doc_id, doc_model=ItemInDB)
 
 
+def get_with_cas(bucket: Bucket, *, id: str) -> Tuple[Optional[ItemInDB], int]:
+    doc_id = get_doc_id(id)
+    return utils.get_doc_with_cas(bucket=bucket, doc_id=doc_id, doc_model=ItemInDB)
+
+
 def upsert(
     bucket: Bucket,
     *,
@@ -28,11 +53,17 @@ def upsert(
     owner_username: str,
     persist_to=0,
     ttl=0,
+    mutation_state: MutationState = None,
 ):
     doc_id = get_doc_id(id)
     doc = ItemInDB(**doc_in.dict(), id=id, owner_username=owner_username)
     return utils.upsert(
-        bucket=bucket, doc_id=doc_id, doc_in=doc, persist_to=persist_to, ttl=ttl
+        bucket=bucket,
+        doc_id=doc_id,
+        doc_in=doc,
+        persist_to=persist_to,
+        ttl=ttl,
+        mutation_state=mutation_state,
     )
 
 
@@ -41,79 +72,339 @@ def update(
     *,
     id: str,
     doc_in: ItemUpdate,
+    doc: ItemInDB = None,
     owner_username=None,
+    cas=0,
     persist_to=0,
     ttl=0,
+    mutation_state: MutationState = None,
 ):
+    """
+    Update only the fields set in `doc_in`.
+
+    Pass the current `doc`, if it was already read, to get it back updated
+    without reading it again.
+    """
     doc_id = get_doc_id(id=id)
-    doc = get(bucket, id=id)
-    doc = doc.copy(update=doc_in.dict(skip_defaults=True))
+    fields = doc_in.dict(skip_defaults=True)
     if owner_username is not None:
-        doc.owner_username = owner_username
-    return utils.upsert(
-        bucket=bucket, doc_id=doc_id, doc_in=doc, persist_to=persist_to, ttl=ttl
+        fields["owner_username"] = owner_username
+    utils.update_fields(
+        bucket,
+        doc_id=doc_id,
+        fields=fields,
+        cas=cas,
+        persist_to=persist_to,
+        ttl=ttl,
+        mutation_state=mutation_state,
     )
+    if doc is None:
+        return get(bucket, id=id)
+    return doc.copy(update=fields)
 
 
-def remove(bucket: Bucket, *, id: str, persist_to=0):
+def update_checked(
+    bucket: Bucket,
+    *,
+    id: str,
+    doc_in: ItemUpdate,
+    check: Callable[[ItemInDB], None] = None,
+    cas=0,
+    persist_to=0,
+    ttl=0,
+    mutation_state: MutationState = None,
+) -> Tuple[Optional[ItemInDB], int]:
+    """
+    Update the fields set in `doc_in`, checked with CAS and retried if the item
+    changed concurrently. `check` receives the current item, to raise if it
+    can't be updated.
+
+    Return the updated item and its new CAS, or `(None, 0)` if it doesn't exist.
+    """
+
+    def get_fields(doc: ItemInDB):
+        if check:
+            check(doc)
+        return doc_in.dict(skip_defaults=True)
+
+    return utils.update_checked(
+        bucket,
+        doc_id=get_doc_id(id),
+        doc_model=ItemInDB,
+        get_fields=get_fields,
+        cas=cas,
+        persist_to=persist_to,
+        ttl=ttl,
+        mutation_state=mutation_state,
+    )
+
+
+def remove(
+    bucket: Bucket,
+    *,
+    id: str,
+    cas=0,
+    persist_to=0,
+    mutation_state: MutationState = None,
+):
     doc_id = get_doc_id(id)
     return utils.remove(
-        bucket=bucket, doc_id=doc_id, doc_model=ItemInDB, persist_to=persist_to
+        bucket=bucket,
+        doc_id=doc_id,
+        doc_model=ItemInDB,
+        cas=cas,
+        persist_to=persist_to,
+        mutation_state=mutation_state,
+    )
+
+
+def remove_checked(
+    bucket: Bucket,
+    *,
+    id: str,
+    check: Callable[[ItemInDB], None] = None,
+    cas=0,
+    persist_to=0,
+    mutation_state: MutationState = None,
+) -> Optional[ItemInDB]:
+    return utils.remove_checked(
+        bucket,
+        doc_id=get_doc_id(id),
+        doc_model=ItemInDB,
+        check=check,
+        cas=cas,
+        persist_to=persist_to,
+        mutation_state=mutation_state,
+    )
+
+
+def get_multi_by_ids(bucket: Bucket, *, ids: List[str]):
+    doc_ids = [get_doc_id(id) for id in ids]
+    return utils.get_docs_by_keys(bucket=bucket, keys=doc_ids, doc_model=ItemInDB)
+
+
+def upsert_multi(
+    bucket: Bucket,
+    *,
+    docs_in: Dict[str, ItemCreate],
+    owner_username: str,
+    persist_to=0,
+    ttl=0,
+    mutation_state: MutationState = None,
+) -> List[ItemBatchResult]:
+    docs = {
+        get_doc_id(id): ItemInDB(**doc_in.dict(), id=id, owner_username=owner_username)
+        for id, doc_in in docs_in.items()
+    }
+    errors = utils.upsert_multi(
+        bucket=bucket,
+        docs_in=docs,
+        persist_to=persist_to,
+        ttl=ttl,
+        mutation_state=mutation_state,
+    )
+    results = []
+    for doc_id, doc in docs.items():
+        error = errors.get(doc_id)
+        if error is None:
+            results.append(ItemBatchResult(id=doc.id, success=True, item=doc.dict()))
+        else:
+            results.append(ItemBatchResult(id=doc.id, success=False, error=error))
+    return results
+
+
+def remove_multi(
+    bucket: Bucket,
+    *,
+    ids: List[str],
+    persist_to=0,
+    mutation_state: MutationState = None,
+) -> Dict[str, Optional[str]]:
+    doc_ids = {get_doc_id(id): id for id in ids}
+    errors = utils.remove_multi(
+        bucket=bucket,
+        doc_ids=list(doc_ids),
+        persist_to=persist_to,
+        mutation_state=mutation_state,
     )
+    return {id: errors.get(doc_id) for doc_id, id in doc_ids.items()}
+
 
+def get_cursor(doc: Item):
+    return utils.encode_cursor(get_doc_id(doc.id))
 
-def get_multi(bucket: Bucket, *, skip=0, limit=100):
+
+def get_multi(
+    bucket: Bucket,
+    *,
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+):
     return utils.get_docs(
         bucket=bucket,
         doc_type=ITEM_DOC_TYPE,
-        doc_model=ItemInDB,
+        doc_model=Item,
         skip=skip,
         limit=limit,
+        start_after=start_after,
+        consistency=consistency,
+        mutation_state=mutation_state,
     )
 
 
-def get_multi_by_owner(bucket: Bucket, *, owner_username: str, skip=0, limit=100):
-    query_str = f"SELECT *, META().id as doc_id FROM {config.COUCHBASE_BUCKET_NAME} WHERE type = $type AND owner_username = $owner_username LIMIT $limit OFFSET $skip;"
-    q = N1QLQuery(
-        query_str,
-        bucket=config.COUCHBASE_BUCKET_NAME,
-        type=ITEM_DOC_TYPE,
+items_by_owner_statement = statement_registry.register(
+    "items_by_owner",
+    f'SELECT RAW {utils.get_projection(Item)} FROM `{config.COUCHBASE_BUCKET_NAME}` AS doc WHERE doc.type = "{ITEM_DOC_TYPE}" AND doc.owner_username = $owner_username AND META(doc).id > $start_after ORDER BY META(doc).id LIMIT $limit OFFSET $skip;',
+)
+
+
+def get_multi_by_owner_query(
+    *,
+    owner_username: str,
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+):
+    return items_by_owner_statement.query(
+        consistency=consistency,
+        mutation_state=mutation_state,
         owner_username=owner_username,
+        start_after=start_after,
+        limit=limit,
+        skip=skip,
+    )
+
+
+def get_multi_by_owner(
+    bucket: Bucket,
+    *,
+    owner_username: str,
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+):
+    q = get_multi_by_owner_query(
+        owner_username=owner_username,
+        skip=skip,
+        limit=limit,
+        start_after=start_after,
+        consistency=consistency,
+        mutation_state=mutation_state,
+    )
+    doc_results = iter_query(bucket, q)
+    return utils.doc_results_to_model(doc_results, doc_model=Item)
+
+
+async def get_async(bucket: AsyncBucket, *, id: str):
+    doc_id = get_doc_id(id)
+    return await async_utils.get_doc(bucket=bucket, doc_id=doc_id, doc_model=ItemInDB)
+
+
+async def get_with_cas_async(
+    bucket: AsyncBucket, *, id: str
+) -> Tuple[Optional[ItemInDB], int]:
+    doc_id = get_doc_id(id)
+    return await async_utils.get_doc_with_cas(
+        bucket=bucket, doc_id=doc_id, doc_model=ItemInDB
+    )
+
+
+async def get_multi_async(
+    bucket: AsyncBucket,
+    *,
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+):
+    return await async_utils.get_docs(
+        bucket=bucket,
+        doc_type=ITEM_DOC_TYPE,
+        doc_model=Item,
+        skip=skip,
         limit=limit,
+        start_after=start_after,
+        consistency=consistency,
+        mutation_state=mutation_state,
+    )
+
+
+async def get_multi_by_owner_async(
+    bucket: AsyncBucket,
+    *,
+    owner_username: str,
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+):
+    q = get_multi_by_owner_query(
+        owner_username=owner_username,
         skip=skip,
+        limit=limit,
+        start_after=start_after,
+        consistency=consistency,
+        mutation_state=mutation_state,
     )
-    q.consistency = CONSISTENCY_REQUEST
-    doc_results = bucket.n1ql_query(q)
-    return utils.doc_results_to_model(doc_results, doc_model=ItemInDB)
+    doc_results = await async_utils.n1ql_query(bucket, q)
+    return utils.doc_results_to_model(doc_results, doc_model=Item)
 
 
-def search(bucket: Bucket, *, query_string: str, skip=0, limit=100):
-    docs = utils.search_get_docs(
+def search(
+    bucket: Bucket,
+    *,
+    query_string: str,
+    facets: List[str] = None,
+    skip=0,
+    limit=100,
+    search_after: List[str] = None,
+    search_before: List[str] = None,
+) -> utils.SearchResults:
+    return utils.search_get_docs(
         bucket=bucket,
         query_string=query_string,
         index_name=full_text_index_name,
         doc_model=ItemInDB,
+        facets=facets,
         skip=skip,
         limit=limit,
+        search_after=search_after,
+        search_before=search_before,
     )
-    return docs
 
 
 def search_with_owner(
-    bucket: Bucket, *query_string: str, username: str, skip=0, limit=100
-):
-    username_filter = f"owner_username:{username}"
-    if username_filter not in query_string:
-        query_string = f"{query_string} {username_filter}"
-    docs = utils.search_get_docs(
+    bucket: Bucket,
+    *,
+    query_string: str,
+    username: str,
+    facets: List[str] = None,
+    skip=0,
+    limit=100,
+    search_after: List[str] = None,
+    search_before: List[str] = None,
+) -> utils.SearchResults:
+    return utils.search_get_docs(
         bucket=bucket,
         query_string=query_string,
         index_name=full_text_index_name,
         doc_model=ItemInDB,
+        filters={"owner_username": username},
+        facets=facets,
         skip=skip,
         limit=limit,
+        search_after=search_after,
+        search_before=search_before,
     )
-    return docs
 
 
 def search_get_search_results_to_docs(
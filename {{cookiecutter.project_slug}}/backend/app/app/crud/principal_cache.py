@@ -0,0 +1,63 @@
+import threading
+from typing import Optional
+
+from app.core import config
+from app.core.cache import LRUCache
+from app.models.user import UserInDB
+
+
+class PrincipalCache:
+    """
+    Cache of the users authenticated with access tokens, by username and the
+    issue time of the token, so that authenticated requests don't read the
+    user every time.
+
+    Writes to a user in this process remove its entries, and a read that
+    started before a write doesn't store its result. Changes made by other
+    processes, e.g. disabling a user or changing its roles, take effect after
+    the TTL at most.
+    """
+
+    def __init__(self, *, enabled: bool, size: int, ttl: float):
+        self.enabled = enabled
+        self._cache = LRUCache(size=size, ttl=ttl)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, username: str, *, issued_at: Optional[float]) -> Optional[UserInDB]:
+        if not self.enabled:
+            return None
+        return self._cache.get((username, issued_at), None)
+
+    def set(
+        self,
+        username: str,
+        *,
+        issued_at: Optional[float],
+        user: UserInDB,
+        generation: int,
+    ):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._generation != generation:
+                return
+            self._cache.set((username, issued_at), user)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._generation += 1
+            self._cache.delete_matching(lambda key: key[0] == username)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+principal_cache = PrincipalCache(
+    enabled=config.PRINCIPAL_CACHE_ENABLED,
+    size=config.PRINCIPAL_CACHE_SIZE,
+    ttl=config.PRINCIPAL_CACHE_TTL_SECS,
+)
@@ -0,0 +1,42 @@
+import uuid
+from datetime import timedelta
+from typing import Optional
+
+from couchbase.bucket import Bucket
+from couchbase.exceptions import NotFoundError
+
+from app.models.config import REFRESH_TOKEN_DOC_TYPE
+from app.models.token import RefreshTokenInDB
+
+from . import utils
+
+
+def get_doc_id(token_id: str):
+    return f"{REFRESH_TOKEN_DOC_TYPE}::{token_id}"
+
+
+def create(
+    bucket: Bucket, *, username: str, expires_delta: timedelta
+) -> RefreshTokenInDB:
+    token = RefreshTokenInDB(id=str(uuid.uuid4()), username=username)
+    # Couchbase removes the document when the token expires
+    return utils.upsert(
+        bucket,
+        doc_id=get_doc_id(token.id),
+        doc_in=token,
+        ttl=int(expires_delta.total_seconds()),
+    )
+
+
+def revoke(bucket: Bucket, *, token_id: str) -> Optional[RefreshTokenInDB]:
+    """
+    Remove a stored refresh token. Return it, or `None` if it was already
+    revoked or expired, so that it can be used only once.
+    """
+    try:
+        return utils.remove(
+            bucket, doc_id=get_doc_id(token_id), doc_model=RefreshTokenInDB
+        )
+    except NotFoundError:
+        # Removed after it was read, e.g. by a concurrent refresh
+        return None
@@ -0,0 +1,142 @@
+import re
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from app.core import config
+from app.core.cache import LRUCache
+
+from .doc_cache import DOC_ID_SEPARATOR
+
+# Filter terms typed in query strings, their order doesn't change the hits
+FILTER_PREFIXES = ("type:", "owner_username:")
+
+_TERM_RE = re.compile(r'(?:"[^"]*"|[^\s"])+')
+
+# (index name, normalized query string, filters, fields, facets, skip, limit,
+# search after, search before)
+SearchKey = Tuple[
+    str,
+    str,
+    Tuple[Tuple[str, str], ...],
+    Tuple[str, ...],
+    Tuple[str, ...],
+    Tuple[str, ...],
+    int,
+    int,
+    Tuple[str, ...],
+    Tuple[str, ...],
+]
+
+
+def normalize_query_string(query_string: str) -> str:
+    """
+    Collapse the whitespace between terms and sort the filter terms, keeping
+    phrases as they are. Query strings with unbalanced quotes are kept as is.
+    """
+    if query_string.count('"') % 2:
+        return query_string
+    terms = []
+    filters = []
+    for term in _TERM_RE.findall(query_string):
+        if term.startswith(FILTER_PREFIXES):
+            filters.append(term)
+        else:
+            terms.append(term)
+    return " ".join(terms + sorted(filters))
+
+
+def get_search_key(
+    *,
+    index_name: str,
+    query_string: str,
+    filters: Dict[str, str] = None,
+    fields: Sequence[str] = None,
+    facets: Sequence[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    search_after: Sequence[str] = None,
+    search_before: Sequence[str] = None,
+) -> SearchKey:
+    return (
+        index_name,
+        normalize_query_string(query_string or ""),
+        tuple(sorted((filters or {}).items())),
+        tuple(fields or ()),
+        tuple(sorted(facets or ())),
+        skip,
+        limit,
+        tuple(search_after or ()),
+        tuple(search_before or ()),
+    )
+
+
+class SearchCache:
+    """
+    Short lived cache of full text search results, for repeated queries, e.g.
+    from typeahead. Cached results are shared, they must not be modified.
+
+    Only indexes registered with `configure()` are cached. A write to a
+    document of the type an index has clears its cached results in this process,
+    and a search that started before the write doesn't store its results. Writes
+    from other processes are seen after the TTL, as the index itself is
+    updated asynchronously.
+    """
+
+    def __init__(self, *, enabled: bool, size: int, ttl: float):
+        self.enabled = enabled
+        self.size = size
+        self.ttl = ttl
+        self._caches: Dict[str, LRUCache] = {}
+        self._index_doc_types: Dict[str, str] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, index_name: str, *, doc_type: str):
+        self._index_doc_types[index_name] = doc_type
+        if doc_type not in self._caches:
+            self._caches[doc_type] = LRUCache(size=self.size, ttl=self.ttl)
+            self._generations[doc_type] = 0
+
+    def _get_doc_type(self, key: SearchKey) -> Optional[str]:
+        if not self.enabled:
+            return None
+        return self._index_doc_types.get(key[0])
+
+    def get(self, key: SearchKey) -> Optional[Any]:
+        doc_type = self._get_doc_type(key)
+        if doc_type is None:
+            return None
+        return self._caches[doc_type].get(key, None)
+
+    def generation(self, key: SearchKey) -> int:
+        doc_type = self._get_doc_type(key)
+        if doc_type is None:
+            return 0
+        return self._generations[doc_type]
+
+    def set(self, key: SearchKey, results: Any, *, generation: int):
+        doc_type = self._get_doc_type(key)
+        if doc_type is None:
+            return
+        with self._lock:
+            if self._generations[doc_type] != generation:
+                return
+            self._caches[doc_type].set(key, results)
+
+    def invalidate(self, doc_id: str):
+        doc_type, separator, _ = doc_id.partition(DOC_ID_SEPARATOR)
+        if not separator or doc_type not in self._caches:
+            return
+        with self._lock:
+            self._generations[doc_type] += 1
+            self._caches[doc_type].clear()
+
+    def stats(self):
+        return {doc_type: cache.stats() for doc_type, cache in self._caches.items()}
+
+
+search_cache = SearchCache(
+    enabled=config.SEARCH_CACHE_ENABLED,
+    size=config.SEARCH_CACHE_SIZE,
+    ttl=config.SEARCH_CACHE_TTL_SECS,
+)
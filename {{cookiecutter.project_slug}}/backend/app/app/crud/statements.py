@@ -0,0 +1,175 @@
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from couchbase.bucket import Bucket
+from couchbase.exceptions import N1QLError
+from couchbase.mutation_state import MutationState
+from couchbase.n1ql import CONSISTENCY_REQUEST, CONSISTENCY_UNBOUNDED, N1QLQuery
+
+from app.core import config
+from app.models.consistency import ScanConsistency
+
+# Query service errors meaning that the prepared plan is gone or no longer valid,
+# e.g. after a restart of a query node or a change in the indexes it used
+REPREPARE_ERROR_CODES = {4040, 4050, 4070}
+
+
+class Statement:
+    """
+    N1QL statement defined once, executed as a prepared statement.
+
+    The SDK prepares the statement on first use and reuses the plan while it
+    is valid. Execution counts and latencies are kept per statement.
+    """
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.errors = 0
+        self.reprepares = 0
+        self.time_total = 0.0
+        self.time_max = 0.0
+
+    def query(
+        self,
+        *,
+        consistency: ScanConsistency = None,
+        mutation_state: MutationState = None,
+        **params,
+    ) -> "PreparedQuery":
+        q = PreparedQuery(self, **params)
+        set_scan_consistency(q, consistency=consistency, mutation_state=mutation_state)
+        return q
+
+    def record(self, duration: float, *, error=False, reprepared=False):
+        with self._lock:
+            self.executions += 1
+            self.errors += error
+            self.reprepares += reprepared
+            self.time_total += duration
+            self.time_max = max(self.time_max, duration)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "errors": self.errors,
+                "reprepares": self.reprepares,
+                "time_total_secs": self.time_total,
+                "time_max_secs": self.time_max,
+                "time_avg_secs": (
+                    self.time_total / self.executions if self.executions else 0.0
+                ),
+            }
+
+
+class PreparedQuery(N1QLQuery):
+    def __init__(self, statement: Statement, **params):
+        super().__init__(statement.text, **params)
+        self.statement = statement
+        self.adhoc = False
+
+
+def set_scan_consistency(
+    query: N1QLQuery,
+    *,
+    consistency: Optional[ScanConsistency] = None,
+    mutation_state: MutationState = None,
+):
+    """
+    Set how up to date the indexes have to be for the query.
+
+    By default, a query with the mutation tokens of the caller's own writes is
+    `at_plus` (read your own writes) and others use the configured default.
+    `at_plus` without tokens has nothing to wait for, so it's `not_bounded`.
+    """
+    if consistency is None:
+        if mutation_state:
+            consistency = ScanConsistency.at_plus
+        else:
+            consistency = ScanConsistency(config.COUCHBASE_N1QL_SCAN_CONSISTENCY)
+    if consistency == ScanConsistency.request_plus:
+        query.consistency = CONSISTENCY_REQUEST
+        return
+    query.consistency = CONSISTENCY_UNBOUNDED
+    if consistency == ScanConsistency.at_plus and mutation_state:
+        query.consistent_with(mutation_state)
+
+
+class StatementRegistry:
+    def __init__(self):
+        self._statements: Dict[str, Statement] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, text: str) -> Statement:
+        with self._lock:
+            if name in self._statements:
+                raise ValueError(f"The statement {name} is already registered")
+            statement = Statement(name, text)
+            self._statements[name] = statement
+            return statement
+
+    def get_or_register(self, name: str, text: str) -> Statement:
+        with self._lock:
+            statement = self._statements.get(name)
+            if statement is None:
+                statement = Statement(name, text)
+                self._statements[name] = statement
+            elif statement.text != text:
+                raise ValueError(f"The statement {name} has a different text")
+            return statement
+
+    def get(self, name: str) -> Statement:
+        return self._statements[name]
+
+    def stats(self):
+        return {name: s.stats() for name, s in self._statements.items()}
+
+
+statement_registry = StatementRegistry()
+
+
+def needs_reprepare(e: N1QLError):
+    errors = e.objextra
+    if isinstance(errors, dict):
+        errors = [errors]
+    if not isinstance(errors, list):
+        return False
+    return any(
+        isinstance(error, dict) and error.get("code") in REPREPARE_ERROR_CODES
+        for error in errors
+    )
+
+
+def iter_query(bucket: Bucket, query: N1QLQuery) -> Iterator[dict]:
+    """
+    Iterate the rows of a query as they are read.
+
+    For registered statements, a stale prepared plan is prepared again and
+    the query retried once, as long as no row was returned yet.
+    """
+    statement = getattr(query, "statement", None)
+    if statement is None:
+        yield from bucket.n1ql_query(query)
+        return
+    start = time.monotonic()
+    error = True
+    reprepared = False
+    rows_read = False
+    try:
+        while True:
+            try:
+                for row in bucket.n1ql_query(query):
+                    rows_read = True
+                    yield row
+                break
+            except N1QLError as e:
+                if rows_read or reprepared or not needs_reprepare(e):
+                    raise
+                reprepared = True
+        error = False
+    finally:
+        statement.record(time.monotonic() - start, error=error, reprepared=reprepared)
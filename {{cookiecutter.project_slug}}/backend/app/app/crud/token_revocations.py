@@ -0,0 +1,68 @@
+import time
+from typing import Optional
+
+from couchbase.bucket import Bucket
+
+from app.core import config
+from app.core.cache import LRUCache
+from app.models.config import TOKEN_REVOCATION_DOC_TYPE
+from app.models.token import TokenRevocationInDB
+
+from . import utils
+
+
+def get_doc_id(username: str):
+    return f"{TOKEN_REVOCATION_DOC_TYPE}::{username}"
+
+
+class TokenRevocations:
+    """
+    Access tokens revoked because the roles or the status of their users
+    changed, so that the users get new ones with a refresh token, with the new
+    claims.
+
+    The revocation time of each user is stored in DB, so all the processes see
+    it, until the tokens issued before it expire. Each process caches it for
+    `ttl` seconds, so revocations made by other processes take effect after the
+    TTL at most, and the ones made by this process right away.
+    """
+
+    def __init__(self, *, size: int, ttl: float, expiry: int):
+        self.expiry = expiry
+        # 0.0 when the user has no revocation
+        self._revoked_at = LRUCache(size=size, ttl=ttl)
+
+    def revoke(self, bucket: Bucket, username: str):
+        revocation = TokenRevocationInDB(username=username, revoked_at=time.time())
+        # Couchbase removes the document when the revoked tokens expire
+        utils.upsert(
+            bucket, doc_id=get_doc_id(username), doc_in=revocation, ttl=self.expiry
+        )
+        self._revoked_at.set(username, revocation.revoked_at)
+
+    def get_revoked_at(self, bucket: Bucket, username: str) -> float:
+        revoked_at = self._revoked_at.get(username, None)
+        if revoked_at is None:
+            # Not from the doc cache, that other processes don't update
+            result = bucket.get(get_doc_id(username), quiet=True)
+            revoked_at = result.value["revoked_at"] if result.value else 0.0
+            self._revoked_at.set(username, revoked_at)
+        return revoked_at
+
+    def is_revoked(
+        self, bucket: Bucket, username: str, *, issued_at: Optional[float]
+    ) -> bool:
+        revoked_at = self.get_revoked_at(bucket, username)
+        if not revoked_at:
+            return False
+        return issued_at is None or issued_at <= revoked_at
+
+    def stats(self):
+        return self._revoked_at.stats()
+
+
+token_revocations = TokenRevocations(
+    size=config.TOKEN_REVOCATIONS_SIZE,
+    ttl=config.TOKEN_REVOCATIONS_TTL_SECS,
+    expiry=config.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
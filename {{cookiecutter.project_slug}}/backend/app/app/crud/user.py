@@ -1,18 +1,46 @@
-import requests
+from typing import List, Union
+
 from couchbase.bucket import Bucket
-from couchbase.n1ql import CONSISTENCY_REQUEST, N1QLQuery
+from couchbase.mutation_state import MutationState
 from fastapi.encoders import jsonable_encoder
 
-from app.core import config
-from app.core.security import get_password_hash, verify_password
+from app.core import config, http_client
+from app.core.cache import LRUCache
+from app.core.security import get_password_hash, password_needs_update, verify_password
 from app.models.config import USERPROFILE_DOC_TYPE
+from app.models.consistency import ScanConsistency
 from app.models.role import RoleEnum
-from app.models.user import UserCreate, UserInDB, UserSyncIn, UserUpdate
+from app.models.token import Principal
+from app.models.user import User, UserCreate, UserInDB, UserSyncIn, UserUpdate
 
 from . import utils
+from .principal_cache import principal_cache
+from .statements import iter_query, statement_registry
+from .token_revocations import token_revocations
 
 # Same as file name /app/app/search_index_definitions/users.json
 full_text_index_name = "users"
+# Fields of the index that search results can have term facets of
+search_facet_fields = {"admin_roles", "admin_channels", "disabled"}
+
+utils.doc_cache.configure(
+    USERPROFILE_DOC_TYPE,
+    size=config.DOC_CACHE_USERPROFILE_SIZE,
+    ttl=config.DOC_CACHE_USERPROFILE_TTL_SECS,
+)
+utils.search_cache.configure(full_text_index_name, doc_type=USERPROFILE_DOC_TYPE)
+
+# Usernames that didn't exist on login, so they are not read again right away.
+# Users created by other processes can log in here after the TTL, a second
+unknown_usernames = LRUCache(
+    size=config.LOGIN_UNKNOWN_USERNAMES_SIZE,
+    ttl=config.LOGIN_UNKNOWN_USERNAMES_TTL_SECS,
+)
+
+# Indexes with all the fields of the list queries, so they don't fetch documents
+covering_indexes = {
+    "idx_userprofile_list": utils.get_index_fields(User, keys=["META().id"])
+}
 
 
 def get_doc_id(username: str):
@@ -24,16 +52,25 @@ def get(bucket: Bucket, *, username: str):
     return utils.get_doc(bucket=bucket, doc_id=doc_id, doc_model=UserInDB)
 
 
-def get_by_email(bucket: Bucket, *, email: str):
-    query_str = f"SELECT *, META().id as doc_id FROM {config.COUCHBASE_BUCKET_NAME} WHERE type = $type AND email = $email;"
-    q = N1QLQuery(
-        query_str,
-        bucket=config.COUCHBASE_BUCKET_NAME,
-        type=USERPROFILE_DOC_TYPE,
+users_by_email_statement = statement_registry.register(
+    "users_by_email",
+    f'SELECT RAW doc FROM `{config.COUCHBASE_BUCKET_NAME}` AS doc WHERE doc.type = "{USERPROFILE_DOC_TYPE}" AND doc.email = $email;',
+)
+
+
+def get_by_email(
+    bucket: Bucket,
+    *,
+    email: str,
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+):
+    q = users_by_email_statement.query(
+        consistency=consistency,
+        mutation_state=mutation_state,
         email=email,
     )
-    q.consistency = CONSISTENCY_REQUEST
-    doc_results = bucket.n1ql_query(q)
+    doc_results = iter_query(bucket, q)
     users = utils.doc_results_to_model(doc_results, doc_model=UserInDB)
     if not users:
         return None
@@ -44,7 +81,7 @@ def insert_sync_gateway(user: UserSyncIn):
     name = user.name
     url = f"http://{config.COUCHBASE_SYNC_GATEWAY_HOST}:{config.COUCHBASE_SYNC_GATEWAY_PORT}/{config.COUCHBASE_SYNC_GATEWAY_DATABASE}/_user/{name}"
     data = jsonable_encoder(user)
-    response = requests.put(url, json=data)
+    response = http_client.sync_gateway.put(url, json=data)
     return response.status_code == 200 or response.status_code == 201
 
 
@@ -55,48 +92,130 @@ def update_sync_gateway(user: UserSyncIn):
         data = jsonable_encoder(user)
     else:
         data = jsonable_encoder(user, exclude={"password"})
-    response = requests.put(url, json=data)
+    response = http_client.sync_gateway.put(url, json=data)
     return response.status_code == 200 or response.status_code == 201
 
 
-def upsert_in_db(bucket: Bucket, *, user_in: UserCreate, persist_to=0):
+def upsert_in_db(
+    bucket: Bucket,
+    *,
+    user_in: UserCreate,
+    persist_to=0,
+    mutation_state: MutationState = None,
+):
     user_doc_id = get_doc_id(user_in.username)
     passwordhash = get_password_hash(user_in.password)
     user = UserInDB(**user_in.dict(), hashed_password=passwordhash)
-    doc_data = jsonable_encoder(user)
-    with bucket.durability(
-        persist_to=persist_to, timeout=config.COUCHBASE_DURABILITY_TIMEOUT_SECS
-    ):
-        bucket.upsert(user_doc_id, doc_data)
-    return user
-
+    try:
+        return utils.upsert(
+            bucket=bucket,
+            doc_id=user_doc_id,
+            doc_in=user,
+            persist_to=persist_to,
+            mutation_state=mutation_state,
+        )
+    finally:
+        principal_cache.invalidate(user_in.username)
+        token_revocations.revoke(bucket, user_in.username)
+        unknown_usernames.delete(user_in.username)
+
+
+def update_in_db(
+    bucket: Bucket,
+    *,
+    username: str,
+    user_in: UserUpdate,
+    user: UserInDB = None,
+    cas=0,
+    persist_to=0,
+    mutation_state: MutationState = None,
+):
+    """
+    Update only the fields set in `user_in`.
 
-def update_in_db(bucket: Bucket, *, username: str, user_in: UserUpdate, persist_to=0):
+    Pass the current `user`, if it was already read, to get it back updated
+    without reading it again.
+    """
     user_doc_id = get_doc_id(username)
-    stored_user = get(bucket, username=username)
-    stored_user = stored_user.copy(update=user_in.dict(skip_defaults=True))
-    if user_in.password:
-        passwordhash = get_password_hash(user_in.password)
-        stored_user.hashed_password = passwordhash
-    data = jsonable_encoder(stored_user)
-    with bucket.durability(
-        persist_to=persist_to, timeout=config.COUCHBASE_DURABILITY_TIMEOUT_SECS
-    ):
-        bucket.upsert(user_doc_id, data)
-    return stored_user
-
-
-def upsert(bucket: Bucket, *, user_in: UserCreate, persist_to=0):
-    user = upsert_in_db(bucket, user_in=user_in, persist_to=persist_to)
+    fields = user_in.dict(skip_defaults=True)
+    # The password is only stored hashed
+    password = fields.pop("password", None)
+    if password:
+        fields["hashed_password"] = get_password_hash(password)
+    claims_changed = False
+
+    def get_fields(stored_user: UserInDB):
+        nonlocal claims_changed
+        claims_changed = token_claims_changed(stored_user, fields=fields)
+        return fields
+
+    try:
+        if user is None:
+            # Read and update checked with CAS, to return the stored version
+            user, _ = utils.update_checked(
+                bucket,
+                doc_id=user_doc_id,
+                doc_model=UserInDB,
+                get_fields=get_fields,
+                cas=cas,
+                persist_to=persist_to,
+                mutation_state=mutation_state,
+            )
+            return user
+        utils.update_fields(
+            bucket,
+            doc_id=user_doc_id,
+            fields=get_fields(user),
+            cas=cas,
+            persist_to=persist_to,
+            mutation_state=mutation_state,
+        )
+        return user.copy(update=fields)
+    finally:
+        principal_cache.invalidate(username)
+        # Only when they change, the admin UI sends the roles and status on every edit
+        if claims_changed:
+            token_revocations.revoke(bucket, username)
+
+
+def upsert(
+    bucket: Bucket,
+    *,
+    user_in: UserCreate,
+    persist_to=0,
+    mutation_state: MutationState = None,
+):
+    user = upsert_in_db(
+        bucket, user_in=user_in, persist_to=persist_to, mutation_state=mutation_state
+    )
     user_in_sync = UserSyncIn(**user_in.dict(), name=user_in.username)
     assert insert_sync_gateway(user_in_sync)
     return user
 
 
-def update(bucket: Bucket, *, username: str, user_in: UserUpdate, persist_to=0):
+def update(
+    bucket: Bucket,
+    *,
+    user_in: UserUpdate,
+    username: str = None,
+    user: UserInDB = None,
+    cas=0,
+    persist_to=0,
+    mutation_state: MutationState = None,
+):
+    if username is None:
+        username = user.username
     user = update_in_db(
-        bucket, username=username, user_in=user_in, persist_to=persist_to
+        bucket,
+        username=username,
+        user_in=user_in,
+        user=user,
+        cas=cas,
+        persist_to=persist_to,
+        mutation_state=mutation_state,
     )
+    if user is None:
+        return None
     user_in_sync_data = user.dict()
     user_in_sync_data.update({"name": user.username})
     if user_in.password:
@@ -107,46 +226,132 @@ def update(bucket: Bucket, *, username: str, user_in: UserUpdate, persist_to=0):
 
 
 def authenticate(bucket: Bucket, *, username: str, password: str):
+    if unknown_usernames.get(username, False):
+        return None
     user = get(bucket, username=username)
     if not user:
+        unknown_usernames.set(username, True)
         return None
     if not verify_password(password, user.hashed_password):
         return None
     return user
 
 
-def is_active(user: UserInDB):
+def needs_rehash(user: UserInDB) -> bool:
+    """
+    Whether the password of a user just authenticated should be hashed again,
+    with `rehash_password()`, to use the current scheme and cost.
+    """
+    return config.PASSWORD_REHASH_ON_LOGIN and password_needs_update(
+        user.hashed_password
+    )
+
+
+def rehash_password(bucket: Bucket, *, user: UserInDB, password: str):
+    """
+    Store the verified `password` of `user` hashed with the current settings.
+
+    The stored hash is only replaced if it's still the one that was verified,
+    so a password changed in the meantime is kept.
+    """
+    hashed_password = get_password_hash(password)
+
+    def get_fields(stored_user: UserInDB):
+        if stored_user.hashed_password != user.hashed_password:
+            return {}
+        return {"hashed_password": hashed_password}
+
+    try:
+        utils.update_checked(
+            bucket,
+            doc_id=get_doc_id(user.username),
+            doc_model=UserInDB,
+            get_fields=get_fields,
+        )
+    finally:
+        principal_cache.invalidate(user.username)
+
+
+def get_token_claims(user: UserInDB):
+    """
+    Claims of the access tokens of the user, to authorize from the token alone.
+    """
+    return {
+        "username": user.username,
+        "roles": utils.ensure_enums_to_strs(user.admin_roles or []),
+        "disabled": bool(user.disabled),
+    }
+
+
+def token_claims_changed(user: UserInDB, *, fields: dict) -> bool:
+    """
+    Whether updating the `fields` of `user` changes the claims of its access
+    tokens, so they have to be revoked.
+    """
+    return get_token_claims(user) != get_token_claims(user.copy(update=fields))
+
+
+def is_active(user: Union[UserInDB, Principal]):
     return not user.disabled
 
 
-def is_superuser(user: UserInDB):
+def is_superuser(user: Union[UserInDB, Principal]):
+    if isinstance(user, Principal):
+        # Roles from token claims are already strings
+        return RoleEnum.superuser.value in user.admin_roles
     return RoleEnum.superuser.value in utils.ensure_enums_to_strs(
         user.admin_roles or []
     )
 
 
-def get_multi(bucket: Bucket, *, skip=0, limit=100):
+def get_cursor(user: User):
+    return utils.encode_cursor(get_doc_id(user.username))
+
+
+def get_multi(
+    bucket: Bucket,
+    *,
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+):
     users = utils.get_docs(
         bucket=bucket,
         doc_type=USERPROFILE_DOC_TYPE,
-        doc_model=UserInDB,
+        doc_model=User,
         skip=skip,
         limit=limit,
+        start_after=start_after,
+        consistency=consistency,
+        mutation_state=mutation_state,
     )
     return users
 
 
-def search(bucket: Bucket, *, query_string: str, skip=0, limit=100):
-    users = utils.search_get_docs(
+def search(
+    bucket: Bucket,
+    *,
+    query_string: str,
+    facets: List[str] = None,
+    skip=0,
+    limit=100,
+    search_after: List[str] = None,
+    search_before: List[str] = None,
+) -> utils.SearchResults:
+    return utils.search_get_docs(
         bucket=bucket,
         query_string=query_string,
         index_name=full_text_index_name,
         doc_model=UserInDB,
         doc_type=USERPROFILE_DOC_TYPE,
+        facets=facets,
         skip=skip,
         limit=limit,
+        search_after=search_after,
+        search_before=search_before,
     )
-    return users
 
 
 def search_get_search_results_to_docs(
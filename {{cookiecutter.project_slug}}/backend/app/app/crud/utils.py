@@ -1,17 +1,53 @@
+import base64
+import binascii
+import json
+import random
+import time
 import uuid
 from enum import Enum
-from typing import List, Optional, Sequence, Type, TypeVar, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
+from couchbase import subdocument
 from couchbase.bucket import Bucket
-from couchbase.fulltext import MatchAllQuery, QueryStringQuery
-from couchbase.n1ql import CONSISTENCY_REQUEST, N1QLQuery
+from couchbase.exceptions import CouchbaseError, KeyExistsError, NotFoundError
+from couchbase.fulltext import (
+    ConjunctionQuery,
+    MatchAllQuery,
+    Params,
+    Query,
+    QueryStringQuery,
+    TermFacet,
+    TermQuery,
+)
+from couchbase.mutation_state import MutationState
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from pydantic.fields import Field, SHAPE_LIST, SHAPE_SET, SHAPE_TUPLE
+from pydantic.fields import SHAPE_LIST, SHAPE_SET, SHAPE_TUPLE
 
 from app.core import config
+from app.db.full_text_search_utils import get_stored_fields
+from app.models.consistency import ScanConsistency
+from app.models.schema import SCHEMA_VERSION_FIELD, doc_to_model, get_schema_version
+
+from .doc_cache import doc_cache
+from .search_cache import get_search_key, search_cache
+from .statements import PreparedQuery, iter_query, statement_registry
 
 PydanticModel = TypeVar("PydanticModel", bound=BaseModel)
+T = TypeVar("T")
 
 
 def generate_new_id():
@@ -28,36 +64,230 @@ def ensure_enums_to_strs(items: Union[Sequence[Union[Enum, str]], Type[Enum]]):
     return str_items
 
 
-def get_doc_results_by_type(bucket: Bucket, *, doc_type: str, skip=0, limit=100):
-    query_str = f"SELECT *, META().id as doc_id FROM {config.COUCHBASE_BUCKET_NAME} WHERE type = $type LIMIT $limit OFFSET $skip;"
-    q = N1QLQuery(
-        query_str,
-        bucket=config.COUCHBASE_BUCKET_NAME,
-        type=doc_type,
+def encode_cursor(doc_id: str) -> str:
+    return base64.urlsafe_b64encode(doc_id.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (binascii.Error, UnicodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def encode_search_cursor(sort: List[str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(sort).encode()).decode()
+
+
+def decode_search_cursor(cursor: str) -> List[str]:
+    try:
+        sort = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError(f"Invalid search cursor: {cursor}")
+    if not isinstance(sort, list) or not all(isinstance(v, str) for v in sort):
+        raise ValueError(f"Invalid search cursor: {cursor}")
+    return sort
+
+
+def encode_mutation_state(mutation_state: MutationState) -> str:
+    return base64.urlsafe_b64encode(mutation_state.encode().encode()).decode()
+
+
+def is_valid_scan_vectors(data: Any) -> bool:
+    """
+    Whether `data` has the shape of an encoded `MutationState`, by bucket name
+    and vBucket ID, the sequence number and UUID of the last mutation.
+    """
+    if not isinstance(data, dict) or not data:
+        return False
+    for bucket_name, vbuckets in data.items():
+        if not isinstance(vbuckets, dict) or not vbuckets:
+            return False
+        for vbucket_id, token in vbuckets.items():
+            if not vbucket_id.isdigit():
+                return False
+            if not isinstance(token, list) or len(token) != 2:
+                return False
+            seqno, vbuuid = token
+            if not isinstance(seqno, int) or not isinstance(vbuuid, (str, int)):
+                return False
+    return True
+
+
+def decode_mutation_state(encoded: str) -> MutationState:
+    """
+    Decode a mutation state from a client, raising `ValueError` if it's not
+    valid, so that it's not sent to the query service.
+    """
+    try:
+        data = base64.urlsafe_b64decode(encoded.encode()).decode()
+        if not is_valid_scan_vectors(json.loads(data)):
+            raise ValueError(f"Invalid mutation state: {encoded}")
+        return MutationState.decode(data)
+    except (binascii.Error, UnicodeError, TypeError, KeyError):
+        raise ValueError(f"Invalid mutation state: {encoded}")
+
+
+def add_mutation_tokens(mutation_state: Optional[MutationState], *results):
+    # Results without a token, e.g. if the bucket doesn't fetch them, are skipped
+    if mutation_state is not None and results:
+        mutation_state.add_results(*results, quiet=True)
+
+
+def get_projected_fields(doc_model: Type[PydanticModel]) -> List[str]:
+    names = list(doc_model.__fields__)
+    # Needed to trust the projected documents, see app.models.schema
+    if get_schema_version(doc_model) is not None and SCHEMA_VERSION_FIELD not in names:
+        names.append(SCHEMA_VERSION_FIELD)
+    return names
+
+
+def get_projection(doc_model: Type[PydanticModel], *, alias="doc") -> str:
+    """
+    N1QL object with only the fields of the model, to use with `SELECT RAW`.
+
+    Fields missing in a document are left out of its object.
+    """
+    fields = ", ".join(
+        f'"{name}": {alias}.`{name}`' for name in get_projected_fields(doc_model)
+    )
+    return "{" + fields + "}"
+
+
+def get_index_fields(doc_model: Type[PydanticModel], *, keys: List[str]) -> List[str]:
+    """
+    Keys of an index covering the projection of the model, after the given keys.
+    """
+    fields = list(keys)
+    for name in get_projected_fields(doc_model):
+        field = f"`{name}`"
+        if name not in fields and field not in fields:
+            fields.append(field)
+    return fields
+
+
+def get_docs_by_type_statement(*, doc_type: str, doc_model: Type[PydanticModel]):
+    # Results are ordered by document ID, so the last ID of a page can be passed as
+    # start_after to get the next page, with the same cost as the first one.
+    # The type is part of the text so the query can use partial indexes by type
+    projection = get_projection(doc_model)
+    return statement_registry.get_or_register(
+        f"docs_by_type_{doc_type}_{doc_model.__name__}",
+        f'SELECT RAW {projection} FROM `{config.COUCHBASE_BUCKET_NAME}` AS doc WHERE doc.type = "{doc_type}" AND META(doc).id > $start_after ORDER BY META(doc).id LIMIT $limit OFFSET $skip;',
+    )
+
+
+def get_doc_results_by_type_query(
+    *,
+    doc_type: str,
+    doc_model: Type[PydanticModel],
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+) -> PreparedQuery:
+    statement = get_docs_by_type_statement(doc_type=doc_type, doc_model=doc_model)
+    return statement.query(
+        consistency=consistency,
+        mutation_state=mutation_state,
+        start_after=start_after,
         limit=limit,
         skip=skip,
     )
-    q.consistency = CONSISTENCY_REQUEST
-    result = bucket.n1ql_query(q)
+
+
+def get_doc_results_by_type(
+    bucket: Bucket,
+    *,
+    doc_type: str,
+    doc_model: Type[PydanticModel],
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
+):
+    q = get_doc_results_by_type_query(
+        doc_type=doc_type,
+        doc_model=doc_model,
+        skip=skip,
+        limit=limit,
+        start_after=start_after,
+        consistency=consistency,
+        mutation_state=mutation_state,
+    )
+    result = iter_query(bucket, q)
     return result
 
 
+def get_cached_values(keys: List[str]) -> Tuple[Dict[str, dict], List[str]]:
+    values = {}
+    missing_keys = []
+    for key in keys:
+        cached = doc_cache.get(key)
+        if cached:
+            values[key] = cached[1]
+        else:
+            missing_keys.append(key)
+    return values, missing_keys
+
+
+def get_values_by_keys(bucket: Bucket, *, keys: List[str]) -> Dict[str, dict]:
+    """
+    Read the raw documents, from the cache or with a single `get_multi`.
+
+    Keys of documents that don't exist are not in the result.
+    """
+    values, missing_keys = get_cached_values(keys)
+    if missing_keys:
+        results = bucket.get_multi(missing_keys, quiet=True)
+        for key, result in results.items():
+            if not result.value:
+                continue
+            doc_cache.set(key, cas=result.cas, value=result.value)
+            values[key] = result.value
+    return values
+
+
+# Observe statuses of keys without a document, removed or never stored, as in
+# libcouchbase LCB_OBSERVE_LOGICALLY_DELETED and LCB_OBSERVE_NOT_FOUND
+OBSERVE_REMOVED_FLAGS = frozenset({0x80, 0x81})
+
+
+def get_removed_keys(bucket: Bucket, *, keys: List[str]) -> Set[str]:
+    """
+    Return the keys that have no document, with a single `observe_multi` on
+    the active nodes, that doesn't read the documents themselves.
+    """
+    results = bucket.observe_multi(keys, master_only=True)
+    removed_keys = set()
+    for key, result in results.items():
+        if all(info.flags in OBSERVE_REMOVED_FLAGS for info in result.value):
+            removed_keys.add(key)
+    return removed_keys
+
+
 def get_docs_by_keys(
     bucket: Bucket, *, keys: List[str], doc_model=Type[PydanticModel]
 ) -> List[PydanticModel]:
-    results = bucket.get_multi(keys, quiet=True)
+    values = get_values_by_keys(bucket, keys=keys)
     docs = []
-    for result in results.values():
-        doc = doc_model(**result.value)
+    for key in keys:
+        if key not in values:
+            continue
+        doc = doc_to_model(values[key], doc_model=doc_model)
         docs.append(doc)
     return docs
 
 
+# Query results are the documents or projections themselves, from SELECT RAW
+
+
 def doc_result_to_model(
     couchbase_result, *, doc_model: Type[PydanticModel]
 ) -> PydanticModel:
-    data = couchbase_result[config.COUCHBASE_BUCKET_NAME]
-    doc = doc_model(**data)
+    doc = doc_to_model(couchbase_result, doc_model=doc_model)
     return doc
 
 
@@ -65,120 +295,628 @@ def doc_results_to_model(
     results_from_couchbase: list, *, doc_model: Type[PydanticModel]
 ) -> List[PydanticModel]:
     items = []
-    for doc in results_from_couchbase:
-        data = doc[config.COUCHBASE_BUCKET_NAME]
-        doc = doc_model(**data)
+    for data in results_from_couchbase:
+        doc = doc_to_model(data, doc_model=doc_model)
         items.append(doc)
     return items
 
 
+_SEQUENCE_SHAPES = {SHAPE_LIST, SHAPE_SET, SHAPE_TUPLE}
+# Fields set from the model defaults when they are not stored in the full text index
+SEARCH_DEFAULT_FIELDS = frozenset({"type", SCHEMA_VERSION_FIELD})
+# Per model, whether each of its fields is a sequence, by field name
+_search_field_plans: Dict[Type[BaseModel], Dict[str, bool]] = {}
+
+
+def get_search_field_plan(doc_model: Type[BaseModel]) -> Dict[str, bool]:
+    plan = _search_field_plans.get(doc_model)
+    if plan is None:
+        plan = {
+            name: field.shape in _SEQUENCE_SHAPES
+            for name, field in doc_model.__fields__.items()
+        }
+        _search_field_plans[doc_model] = plan
+    return plan
+
+
+def search_fields_to_data(data: dict, *, plan: Dict[str, bool]) -> dict:
+    data_nones = {}
+    for key, value in data.items():
+        is_sequence = plan.get(key)
+        if is_sequence is None:
+            continue
+        if not value:
+            value = None
+        elif is_sequence and not isinstance(value, list):
+            value = [value]
+        data_nones[key] = value
+    return data_nones
+
+
 def search_results_to_model(
     results_from_couchbase: list, *, doc_model: Type[PydanticModel]
 ) -> List[PydanticModel]:
+    """
+    Create models from the stored fields of full text search hits.
+
+    Empty values are `None` and single values of sequence fields are wrapped
+    in a list. Fields of the hits that are not in the model are ignored.
+    """
+    plan = get_search_field_plan(doc_model)
     items = []
     for doc in results_from_couchbase:
         data = doc.get("fields")
         if not data:
             continue
-        data_nones = {}
-        for key, value in data.items():
-            field: Field = doc_model.__fields__[key]
-            if not value:
-                value = None
-            elif field.shape in {SHAPE_LIST, SHAPE_SET, SHAPE_TUPLE} and not isinstance(
-                value, list
-            ):
-                value = [value]
-            data_nones[key] = value
-        doc = doc_model(**data_nones)
-        items.append(doc)
+        data_nones = search_fields_to_data(data, plan=plan)
+        items.append(doc_to_model(data_nones, doc_model=doc_model))
     return items
 
 
 def get_docs(
-    bucket: Bucket, *, doc_type: str, doc_model=Type[PydanticModel], skip=0, limit=100
+    bucket: Bucket,
+    *,
+    doc_type: str,
+    doc_model=Type[PydanticModel],
+    skip=0,
+    limit=100,
+    start_after="",
+    consistency: ScanConsistency = None,
+    mutation_state: MutationState = None,
 ) -> List[PydanticModel]:
     doc_results = get_doc_results_by_type(
-        bucket, doc_type=doc_type, skip=skip, limit=limit
+        bucket,
+        doc_type=doc_type,
+        doc_model=doc_model,
+        skip=skip,
+        limit=limit,
+        start_after=start_after,
+        consistency=consistency,
+        mutation_state=mutation_state,
     )
     return doc_results_to_model(doc_results, doc_model=doc_model)
 
 
+def get_doc_with_cas(
+    bucket: Bucket, *, doc_id: str, doc_model: Type[PydanticModel], use_cache=True
+) -> Tuple[Optional[PydanticModel], int]:
+    if use_cache:
+        cached = doc_cache.get(doc_id)
+        if cached:
+            return doc_to_model(cached[1], doc_model=doc_model), cached[0]
+    result = bucket.get(doc_id, quiet=True)
+    if not result.value:
+        return None, 0
+    doc_cache.set(doc_id, cas=result.cas, value=result.value)
+    model = doc_to_model(result.value, doc_model=doc_model)
+    return model, result.cas
+
+
 def get_doc(
     bucket: Bucket, *, doc_id: str, doc_model: Type[PydanticModel]
 ) -> Optional[PydanticModel]:
-    result = bucket.get(doc_id, quiet=True)
-    if not result.value:
-        return None
-    model = doc_model(**result.value)
+    model, _ = get_doc_with_cas(bucket, doc_id=doc_id, doc_model=doc_model)
     return model
 
 
+def retry_on_cas_mismatch(
+    func: Callable[[int], T],
+    *,
+    max_retries=config.COUCHBASE_CAS_MAX_RETRIES,
+    backoff=config.COUCHBASE_CAS_RETRY_BACKOFF_SECS,
+) -> T:
+    """
+    Call `func(attempt)` again while it fails because the document changed.
+
+    Waits a random time, growing with each attempt, before retrying, so that
+    concurrent writers don't collide again. After `max_retries` the
+    `KeyExistsError` is raised.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(attempt)
+        except KeyExistsError:
+            if attempt >= max_retries:
+                raise
+        time.sleep(random.uniform(0, backoff * 2**attempt))
+        attempt += 1
+
+
 def upsert(
-    bucket: Bucket, *, doc_id: str, doc_in: PydanticModel, persist_to=0, ttl=0
+    bucket: Bucket,
+    *,
+    doc_id: str,
+    doc_in: PydanticModel,
+    cas=0,
+    persist_to=0,
+    ttl=0,
+    mutation_state: MutationState = None,
 ) -> Optional[PydanticModel]:
-    doc_data = jsonable_encoder(doc_in)
+    """
+    Store the whole document. With `cas`, fail with `KeyExistsError` if the
+    document changed since it was read.
+    """
+    # Encoded to JSON only once, by the bucket transcoder
+    doc_data = doc_in.dict()
     with bucket.durability(
         persist_to=persist_to, timeout=config.COUCHBASE_DURABILITY_TIMEOUT_SECS
     ):
-        result = bucket.upsert(doc_id, doc_data, ttl=ttl)
+        result = bucket.upsert(doc_id, doc_data, cas=cas, ttl=ttl)
         if result.success:
+            doc_cache.set_written(doc_id, cas=result.cas, value=doc_data)
+            search_cache.invalidate(doc_id)
+            add_mutation_tokens(mutation_state, result)
             return doc_in
     return None
 
 
+def update_fields(
+    bucket: Bucket,
+    *,
+    doc_id: str,
+    fields: dict,
+    cas=0,
+    persist_to=0,
+    ttl=0,
+    mutation_state: MutationState = None,
+) -> Optional[int]:
+    """
+    Set only the given top level fields of a document, without reading it first.
+
+    Fields not given are kept as they are, so concurrent updates of different
+    fields don't overwrite each other. With `cas`, the update fails with
+    `KeyExistsError` if the document changed since it was read.
+
+    Return the new CAS, or `None` if there was nothing to update.
+    """
+    if not fields:
+        return None
+    data = jsonable_encoder(fields)
+    specs = [subdocument.upsert(name, value) for name, value in data.items()]
+    with bucket.durability(
+        persist_to=persist_to, timeout=config.COUCHBASE_DURABILITY_TIMEOUT_SECS
+    ):
+        result = bucket.mutate_in(doc_id, *specs, cas=cas, ttl=ttl)
+    # The full document is not known here, the next read gets it from Couchbase
+    doc_cache.invalidate(doc_id, cas=result.cas)
+    search_cache.invalidate(doc_id)
+    add_mutation_tokens(mutation_state, result)
+    return result.cas
+
+
 def update(
     bucket: Bucket,
     *,
     doc_id: str,
     doc: PydanticModel,
     doc_updated: PydanticModel,
+    cas=0,
     persist_to=0,
     ttl=0,
+    mutation_state: MutationState = None,
 ):
-    doc_updated = doc.copy(update=doc_updated.dict(skip_defaults=True))
-    data = jsonable_encoder(doc_updated)
-    with bucket.durability(
-        persist_to=persist_to, timeout=config.COUCHBASE_DURABILITY_TIMEOUT_SECS
-    ):
-        result = bucket.upsert(doc_id, data, ttl=ttl)
-        if result.success:
-            return doc_updated
+    fields = doc_updated.dict(skip_defaults=True)
+    update_fields(
+        bucket,
+        doc_id=doc_id,
+        fields=fields,
+        cas=cas,
+        persist_to=persist_to,
+        ttl=ttl,
+        mutation_state=mutation_state,
+    )
+    return doc.copy(update=fields)
+
+
+def update_checked(
+    bucket: Bucket,
+    *,
+    doc_id: str,
+    doc_model: Type[PydanticModel],
+    get_fields: Callable[[PydanticModel], dict],
+    cas=0,
+    persist_to=0,
+    ttl=0,
+    mutation_state: MutationState = None,
+) -> Tuple[Optional[PydanticModel], int]:
+    """
+    Read, modify and write a document, checked with CAS.
+
+    `get_fields` receives the current document and returns the fields to
+    update. If the document changed between the read and the write, it's read
+    again and `get_fields` called again, as in `retry_on_cas_mismatch()`.
+
+    With `cas`, e.g. from an `If-Match` header, the update is only done if the
+    document still has that CAS, without retrying.
+
+    Return the updated document and its new CAS, or `(None, 0)` if it doesn't exist.
+    """
+
+    def attempt(number: int):
+        # A retry means the cached version is outdated
+        doc, current_cas = get_doc_with_cas(
+            bucket, doc_id=doc_id, doc_model=doc_model, use_cache=number == 0
+        )
+        if doc is None:
+            return None, 0
+        fields = get_fields(doc)
+        new_cas = update_fields(
+            bucket,
+            doc_id=doc_id,
+            fields=fields,
+            cas=cas or current_cas,
+            persist_to=persist_to,
+            ttl=ttl,
+            mutation_state=mutation_state,
+        )
+        return doc.copy(update=fields), new_cas or current_cas
+
+    if cas:
+        return attempt(0)
+    return retry_on_cas_mismatch(attempt)
 
 
 def remove(
-    bucket: Bucket, *, doc_id: str, doc_model: Type[PydanticModel] = None, persist_to=0
+    bucket: Bucket,
+    *,
+    doc_id: str,
+    doc_model: Type[PydanticModel] = None,
+    cas=0,
+    persist_to=0,
+    mutation_state: MutationState = None,
 ) -> Optional[Union[PydanticModel, bool]]:
     result = bucket.get(doc_id, quiet=True)
     if not result.value:
         return None
     if doc_model:
-        model = doc_model(**result.value)
+        model = doc_to_model(result.value, doc_model=doc_model)
     with bucket.durability(
         persist_to=persist_to, timeout=config.COUCHBASE_DURABILITY_TIMEOUT_SECS
     ):
-        result = bucket.remove(doc_id)
+        result = bucket.remove(doc_id, cas=cas)
         if not result.success:
             return None
+        doc_cache.invalidate(doc_id, cas=result.cas)
+        search_cache.invalidate(doc_id)
+        add_mutation_tokens(mutation_state, result)
         if doc_model:
             return model
         return True
 
 
+def remove_checked(
+    bucket: Bucket,
+    *,
+    doc_id: str,
+    doc_model: Type[PydanticModel],
+    check: Callable[[PydanticModel], None] = None,
+    cas=0,
+    persist_to=0,
+    mutation_state: MutationState = None,
+) -> Optional[PydanticModel]:
+    """
+    Read and remove a document, checked with CAS, as in `update_checked()`.
+
+    `check` receives the current document, to raise if it can't be removed.
+
+    Return the removed document, or `None` if it doesn't exist, also when it's
+    removed by someone else between the read and the remove.
+    """
+
+    def attempt(number: int):
+        doc, current_cas = get_doc_with_cas(
+            bucket, doc_id=doc_id, doc_model=doc_model, use_cache=number == 0
+        )
+        if doc is None:
+            return None
+        if check:
+            check(doc)
+        try:
+            with bucket.durability(
+                persist_to=persist_to, timeout=config.COUCHBASE_DURABILITY_TIMEOUT_SECS
+            ):
+                result = bucket.remove(doc_id, cas=cas or current_cas)
+        except NotFoundError:
+            # Removed concurrently after it was read, or it was a stale cached copy
+            doc_cache.invalidate(doc_id)
+            return None
+        doc_cache.invalidate(doc_id, cas=result.cas)
+        search_cache.invalidate(doc_id)
+        add_mutation_tokens(mutation_state, result)
+        return doc
+
+    if cas:
+        return attempt(0)
+    return retry_on_cas_mismatch(attempt)
+
+
+def get_multi_errors(results) -> Dict[str, Optional[str]]:
+    errors = {}
+    for doc_id, result in results.items():
+        errors[doc_id] = None if result.success else result.errstr
+    return errors
+
+
+def upsert_multi(
+    bucket: Bucket,
+    *,
+    docs_in: Dict[str, PydanticModel],
+    persist_to=0,
+    ttl=0,
+    mutation_state: MutationState = None,
+) -> Dict[str, Optional[str]]:
+    """
+    Upsert several documents, by document ID, in a single batch.
+
+    Return the error for each document ID, or `None` if it was stored.
+    """
+    docs_data = {doc_id: doc.dict() for doc_id, doc in docs_in.items()}
+    with bucket.durability(
+        persist_to=persist_to, timeout=config.COUCHBASE_DURABILITY_TIMEOUT_SECS
+    ):
+        try:
+            results = bucket.upsert_multi(docs_data, ttl=ttl)
+        except CouchbaseError as e:
+            results = e.all_results
+    stored = []
+    for doc_id, result in results.items():
+        if result.success:
+            doc_cache.set_written(doc_id, cas=result.cas, value=docs_data[doc_id])
+            search_cache.invalidate(doc_id)
+            stored.append(result)
+    add_mutation_tokens(mutation_state, *stored)
+    return get_multi_errors(results)
+
+
+def remove_multi(
+    bucket: Bucket,
+    *,
+    doc_ids: List[str],
+    persist_to=0,
+    mutation_state: MutationState = None,
+) -> Dict[str, Optional[str]]:
+    """
+    Remove several documents in a single batch.
+
+    Return the error for each document ID, or `None` if it was removed.
+    """
+    with bucket.durability(
+        persist_to=persist_to, timeout=config.COUCHBASE_DURABILITY_TIMEOUT_SECS
+    ):
+        try:
+            results = bucket.remove_multi(doc_ids)
+        except CouchbaseError as e:
+            results = e.all_results
+    removed = []
+    for doc_id, result in results.items():
+        if result.success:
+            doc_cache.invalidate(doc_id, cas=result.cas)
+            search_cache.invalidate(doc_id)
+            removed.append(result)
+    add_mutation_tokens(mutation_state, *removed)
+    return get_multi_errors(results)
+
+
+def build_search_query(query_string: str, *, filters: Dict[str, str] = None) -> Query:
+    """
+    Build the full text search query for a user's query string, in Bleve Query
+    String syntax, and the exact terms that the hits must have, by field.
+
+    The filters are term queries, not parsed with the user input, in a
+    conjunction with the user's query. They have no boost, so they don't
+    change the relevance scores.
+    """
+    if query_string:
+        query = QueryStringQuery(query_string)
+    else:
+        query = MatchAllQuery()
+    if not filters:
+        return query
+    term_queries = [
+        TermQuery(term, field=field, boost=0.0)
+        for field, term in sorted(filters.items())
+    ]
+    return ConjunctionQuery(query, *term_queries)
+
+
+class SearchResults(NamedTuple):
+    # Raw hits, or the documents created from them
+    docs: list
+    # Number of matches in the index, not only the ones in this page
+    total_hits: int
+    # Term facets by field, each with its "total", "missing", "other" and "terms"
+    facets: Dict[str, dict]
+    # Cursors for `search_after` and `search_before`, to get the next and
+    # previous pages, if there are any
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+# Sort of all searches, by relevance and then by document ID, so that the order is
+# deterministic and any hit can be the cursor of a page
+SEARCH_SORT = ["-_score", "_id"]
+
+
+def get_hit_sort(hit: dict) -> List[str]:
+    """
+    Sort values of a search hit, to use in `search_after` or `search_before`.
+
+    FTS returns the placeholder `"_score"` as the sort value of the score, that
+    can't be parsed back, so it's replaced with the actual score of the hit.
+    """
+    return [repr(hit["score"]) if value == "_score" else value for value in hit["sort"]]
+
+
+class CursorSearchParams(Params):
+    """
+    Search parameters with `search_after` or `search_before`, the sort values
+    of the hit to start the page after or end it before.
+    """
+
+    def __init__(
+        self,
+        *,
+        search_after: List[str] = None,
+        search_before: List[str] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.search_after = search_after
+        self.search_before = search_before
+
+    def as_encodable(self, index_name):
+        encoded = super().as_encodable(index_name)
+        if self.search_after:
+            encoded["search_after"] = self.search_after
+        if self.search_before:
+            encoded["search_before"] = self.search_before
+        return encoded
+
+
+def get_term_facets(facet_results: Optional[dict]) -> Dict[str, dict]:
+    facets = {}
+    for name, facet in (facet_results or {}).items():
+        facets[name] = {
+            "total": facet.get("total", 0),
+            "missing": facet.get("missing", 0),
+            "other": facet.get("other", 0),
+            "terms": [
+                {"term": term["term"], "count": term["count"]}
+                for term in facet.get("terms") or []
+            ],
+        }
+    return facets
+
+
+def search_query(
+    bucket: Bucket,
+    *,
+    query_string: str,
+    index_name: str,
+    filters: Dict[str, str] = None,
+    fields: List[str] = None,
+    facets: List[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    search_after: List[str] = None,
+    search_before: List[str] = None,
+) -> SearchResults:
+    """
+    Run a full text search, or return its recent results from the search cache.
+
+    `filters` are the exact terms the hits must have, by field, as in
+    `build_search_query()`.
+
+    `facets` are the fields to count the most frequent terms of, in all the hits.
+
+    Pages are read after (or before) the sort values of a hit, from a cursor of
+    a previous page. Unlike `skip`, deep pages cost the same as the first one.
+    """
+    if search_after and search_before:
+        raise ValueError("Only one of search_after and search_before can be used")
+    if search_after or search_before:
+        skip = 0
+    key = get_search_key(
+        index_name=index_name,
+        query_string=query_string,
+        filters=filters,
+        fields=fields,
+        facets=facets,
+        skip=skip,
+        limit=limit,
+        search_after=search_after,
+        search_before=search_before,
+    )
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+    generation = search_cache.generation(key)
+    query = build_search_query(query_string, filters=filters)
+    params = {}
+    if fields:
+        params["fields"] = fields
+    if facets:
+        params["facets"] = {
+            name: TermFacet(name, limit=config.SEARCH_FACET_SIZE) for name in facets
+        }
+    search_params = CursorSearchParams(
+        skip=skip,
+        limit=limit,
+        sort=SEARCH_SORT,
+        search_after=search_after,
+        search_before=search_before,
+        **params,
+    )
+    request = bucket.search(index_name, query, params=search_params)
+    hits = list(request)
+    meta = request.meta or {}
+    next_cursor = prev_cursor = None
+    if hits:
+        # A short page is the first or last one, depending on the direction
+        if search_before or len(hits) >= limit:
+            next_cursor = encode_search_cursor(get_hit_sort(hits[-1]))
+        if skip or search_after or (search_before and len(hits) >= limit):
+            prev_cursor = encode_search_cursor(get_hit_sort(hits[0]))
+    results = SearchResults(
+        docs=hits,
+        total_hits=meta.get("total_hits", len(hits)),
+        facets=get_term_facets(meta.get("facets")),
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+    )
+    search_cache.set(key, results, generation=generation)
+    return results
+
+
+def search_get_hits(
+    bucket: Bucket,
+    *,
+    query_string: str,
+    index_name: str,
+    filters: Dict[str, str] = None,
+    fields: List[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    search_after: List[str] = None,
+    search_before: List[str] = None,
+) -> List[dict]:
+    results = search_query(
+        bucket,
+        query_string=query_string,
+        index_name=index_name,
+        filters=filters,
+        fields=fields,
+        skip=skip,
+        limit=limit,
+        search_after=search_after,
+        search_before=search_before,
+    )
+    return results.docs
+
+
 def search_get_doc_ids(
     bucket: Bucket,
     *,
     query_string: str,
     index_name: str,
+    filters: Dict[str, str] = None,
     skip: int = 0,
     limit: int = 100,
+    search_after: List[str] = None,
+    search_before: List[str] = None,
 ) -> List[str]:
-    query = QueryStringQuery(query_string)
-    hits = bucket.search(index_name, query, skip=skip, limit=limit)
-    doc_ids = []
-    for hit in hits:
-        doc_ids.append(hit["id"])
-    return doc_ids
+    hits = search_get_hits(
+        bucket,
+        query_string=query_string,
+        index_name=index_name,
+        filters=filters,
+        skip=skip,
+        limit=limit,
+        search_after=search_after,
+        search_before=search_before,
+    )
+    return [hit["id"] for hit in hits]
 
 
 def search_get_search_results(
@@ -186,18 +924,23 @@ def search_get_search_results(
     *,
     query_string: str,
     index_name: str,
+    filters: Dict[str, str] = None,
     skip: int = 0,
     limit: int = 100,
+    search_after: List[str] = None,
+    search_before: List[str] = None,
 ):
-    if query_string:
-        query = QueryStringQuery(query_string)
-    else:
-        query = MatchAllQuery()
-    hits = bucket.search(index_name, query, fields=["*"], skip=skip, limit=limit)
-    docs = []
-    for hit in hits:
-        docs.append(hit)
-    return docs
+    return search_get_hits(
+        bucket,
+        query_string=query_string,
+        index_name=index_name,
+        filters=filters,
+        fields=["*"],
+        skip=skip,
+        limit=limit,
+        search_after=search_after,
+        search_before=search_before,
+    )
 
 
 def search_by_type_get_search_results(
@@ -208,18 +951,19 @@ def search_by_type_get_search_results(
     doc_type: str,
     skip: int = 0,
     limit: int = 100,
+    search_after: List[str] = None,
+    search_before: List[str] = None,
 ):
-    type_filter = f"type:{doc_type}"
-    if not query_string:
-        query_string = type_filter
-    if query_string and type_filter not in query_string:
-        query_string += f" {type_filter}"
-    query = QueryStringQuery(query_string)
-    hits = bucket.search(index_name, query, fields=["*"], skip=skip, limit=limit)
-    docs = []
-    for hit in hits:
-        docs.append(hit)
-    return docs
+    return search_get_search_results(
+        bucket,
+        query_string=query_string,
+        index_name=index_name,
+        filters={"type": doc_type},
+        skip=skip,
+        limit=limit,
+        search_after=search_after,
+        search_before=search_before,
+    )
 
 
 def search_get_docs(
@@ -229,25 +973,73 @@ def search_get_docs(
     index_name: str,
     doc_model: Type[PydanticModel],
     doc_type: str = None,
+    filters: Dict[str, str] = None,
+    facets: List[str] = None,
     skip=0,
     limit=100,
-) -> List[PydanticModel]:
+    search_after: List[str] = None,
+    search_before: List[str] = None,
+) -> SearchResults:
+    """
+    Search documents with full text search, with the total number of hits and
+    the requested term `facets`, paginated as in `search_query()`.
+
+    Only documents of `doc_type` are returned, if given, and with the `filters`.
+
+    When the index stores all the fields of the model, the documents are
+    created from the hits, and only checked to still exist with
+    `get_removed_keys()`, without reading them. Otherwise, and for hits without
+    stored fields, e.g. from an index created before the fields were stored,
+    the documents are read with `get_multi`. Both in chunks.
+
+    The order of the hits is kept, and documents removed since they were
+    indexed are dropped. With stored fields, updates not yet indexed, usually
+    for a few seconds, are not seen, as with the hits themselves.
+    """
+    filters = dict(filters or {})
     if doc_type is not None:
-        type_filter = f"type:{doc_type}"
-        if not query_string:
-            query_string = type_filter
-        if query_string and type_filter not in query_string:
-            query_string += f" {type_filter}"
-    keys = search_get_doc_ids(
-        bucket=bucket,
+        filters["type"] = doc_type
+    stored_fields = get_stored_fields(index_name, doc_type=doc_type)
+    covered = set(doc_model.__fields__).issubset(stored_fields | SEARCH_DEFAULT_FIELDS)
+    fields = None
+    if covered:
+        fields = [name for name in doc_model.__fields__ if name in stored_fields]
+    results = search_query(
+        bucket,
         query_string=query_string,
         index_name=index_name,
+        filters=filters,
+        fields=fields,
+        facets=facets,
         skip=skip,
         limit=limit,
+        search_after=search_after,
+        search_before=search_before,
     )
-    if not keys:
-        return []
-    return get_docs_by_keys(bucket=bucket, keys=keys, doc_model=doc_model)
+    hits = results.docs
+    plan = get_search_field_plan(doc_model)
+    docs: Dict[str, PydanticModel] = {}
+    missing_keys = []
+    for hit in hits:
+        doc_id = hit["id"]
+        data = hit.get("fields")
+        if not covered or not data:
+            missing_keys.append(doc_id)
+        else:
+            data_nones = search_fields_to_data(data, plan=plan)
+            docs[doc_id] = doc_to_model(data_nones, doc_model=doc_model)
+    chunk_size = config.COUCHBASE_FULL_TEXT_GET_MULTI_CHUNK_SIZE
+    found_keys = list(docs)
+    for start in range(0, len(found_keys), chunk_size):
+        keys = found_keys[start : start + chunk_size]
+        for key in get_removed_keys(bucket, keys=keys):
+            del docs[key]
+    for start in range(0, len(missing_keys), chunk_size):
+        keys = missing_keys[start : start + chunk_size]
+        values = get_values_by_keys(bucket, keys=keys)
+        for key, value in values.items():
+            docs[key] = doc_to_model(value, doc_model=doc_model)
+    return results._replace(docs=[docs[hit["id"]] for hit in hits if hit["id"] in docs])
 
 
 def search_get_search_results_to_docs(
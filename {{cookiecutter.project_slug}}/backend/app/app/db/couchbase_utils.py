@@ -1,8 +1,8 @@
 import logging
 
-import requests
 from requests.auth import HTTPBasicAuth
 
+from app.core import http_client
 from app.core.config import (
     COUCHBASE_FTS_MEMORY_QUOTA_MB,
     COUCHBASE_INDEX_MEMORY_QUOTA_MB,
@@ -41,6 +41,19 @@ def get_cluster_couchbase_url(
     return cluster_url
 
 
+def get_bucket_couchbase_url(
+    bucket_name: str,
+    host="couchbase",
+    port="8091",
+    fetch_mutation_tokens="1",
+    operation_timeout=f"{COUCHBASE_OPERATION_TIMEOUT_SECS}",
+    n1ql_timeout=f"{COUCHBASE_N1QL_TIMEOUT_SECS}",
+):
+    # Buckets opened directly, without a Cluster, take the bucket name in the path
+    bucket_url = f"couchbase://{host}:{port}/{bucket_name}?fetch_mutation_tokens={fetch_mutation_tokens}&operation_timeout={operation_timeout}&n1ql_timeout={n1ql_timeout}"
+    return bucket_url
+
+
 def get_allowed_username(username):
     chars_to_remove = '()<>@,;:"/\[]?={}'
     modified_username = username
@@ -50,14 +63,14 @@ def get_allowed_username(username):
 
 
 def is_couchbase_ready(cluster_url):
-    r = requests.get(cluster_url)
+    r = http_client.cluster.get(cluster_url)
     return r.status_code == 200
 
 
 def setup_couchbase_services(*, cluster_url, username, password):
     auth = HTTPBasicAuth(username, password)
     url = f"{cluster_url}/node/controller/setupServices"
-    r = requests.post(url, data={"services": "kv,index,fts,n1ql"}, auth=auth)
+    r = http_client.cluster.post(url, data={"services": "kv,index,fts,n1ql"}, auth=auth)
     return (
         r.status_code == 200
         or "cannot change node services after cluster is provisioned" in r.text
@@ -75,7 +88,7 @@ def setup_memory_quota(
 ):
     auth = HTTPBasicAuth(username, password)
     url = f"{cluster_url}/pools/default"
-    r = requests.post(
+    r = http_client.cluster.post(
         url,
         data={
             "memoryQuota": memory_quota_mb,
@@ -90,14 +103,14 @@ def setup_memory_quota(
 def setup_index_storage(*, cluster_url, username, password):
     url = f"{cluster_url}/settings/indexes"
     auth = HTTPBasicAuth(username, password)
-    r = requests.post(url, data={"storageMode": "forestdb"}, auth=auth)
+    r = http_client.cluster.post(url, data={"storageMode": "forestdb"}, auth=auth)
     return r.status_code == 200
 
 
 def setup_couchbase_username_password(*, cluster_url, username, password):
     url = f"{cluster_url}/settings/web"
     auth = HTTPBasicAuth(COUCHBASE_DEFAULT_USER, COUCHBASE_DEFAULT_PASSWORD)
-    r = requests.post(
+    r = http_client.cluster.post(
         url,
         data={"username": username, "password": password, "port": "SAME"},
         auth=auth,
@@ -108,7 +121,7 @@ def setup_couchbase_username_password(*, cluster_url, username, password):
 def check_couchbase_username_password(*, cluster_url, username, password):
     url = f"{cluster_url}/settings/web"
     auth = HTTPBasicAuth(username, password)
-    r = requests.get(url, auth=auth)
+    r = http_client.cluster.get(url, auth=auth)
     return r.status_code == 200
 
 
@@ -125,7 +138,7 @@ def ensure_couchbase_username_password(*, cluster_url, username, password):
 def import_couchbase_default_data(*, cluster_url, username, password):
     url = f"{cluster_url}/sampleBuckets/install"
     auth = HTTPBasicAuth(username, password)
-    r = requests.post(url, json=["travel-sample"], auth=auth)
+    r = http_client.cluster.post(url, json=["travel-sample"], auth=auth)
     return (
         r.status_code == 202
         or f"Sample bucket {COUCHBASE_DEFAULT_DATASET} is already loaded." in r.text
@@ -135,7 +148,7 @@ def import_couchbase_default_data(*, cluster_url, username, password):
 def is_bucket_created(*, cluster_url, username, password, bucket_name):
     url = f"{cluster_url}/pools/default/buckets/{bucket_name}"
     auth = HTTPBasicAuth(username, password)
-    r = requests.get(url, auth=auth)
+    r = http_client.cluster.get(url, auth=auth)
     return r.status_code == 200
 
 
@@ -151,7 +164,7 @@ def create_bucket(
     url = f"{cluster_url}/pools/default/buckets"
     auth = HTTPBasicAuth(username, password)
     data = {"name": bucket_name, "ramQuotaMB": ram_quota_mb, "bucketType": bucket_type}
-    r = requests.post(url, data=data, auth=auth)
+    r = http_client.cluster.post(url, data=data, auth=auth)
     return r.status_code == 202
 
 
@@ -184,7 +197,7 @@ def ensure_create_bucket(
 def is_couchbase_user_created(*, cluster_url, username, password, new_user_id):
     url = f"{cluster_url}/settings/rbac/users/local/{new_user_id}"
     auth = HTTPBasicAuth(username, password)
-    r = requests.get(url, auth=auth)
+    r = http_client.cluster.get(url, auth=auth)
     return r.status_code == 200
 
 
@@ -198,7 +211,7 @@ def create_couchbase_user(
         "roles": "ro_admin,bucket_full_access[*]",
         "password": new_user_password,
     }
-    r = requests.put(url, data=data, auth=auth)
+    r = http_client.cluster.put(url, data=data, auth=auth)
     return r.status_code == 200
 
 
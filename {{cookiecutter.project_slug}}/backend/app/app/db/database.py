@@ -1,6 +1,16 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+
+from acouchbase.bucket import Bucket as AsyncBucket
 from couchbase import LOCKMODE_WAIT
 from couchbase.bucket import Bucket
 from couchbase.cluster import Cluster, PasswordAuthenticator
+from couchbase.exceptions import CouchbaseError, CouchbaseNetworkError
 
 from app.core.config import (
     COUCHBASE_BUCKET_NAME,
@@ -8,10 +18,14 @@ from app.core.config import (
     COUCHBASE_N1QL_TIMEOUT_SECS,
     COUCHBASE_OPERATION_TIMEOUT_SECS,
     COUCHBASE_PASSWORD,
+    COUCHBASE_POOL_CHECKOUT_TIMEOUT_SECS,
+    COUCHBASE_POOL_HEALTH_CHECK_INTERVAL_SECS,
+    COUCHBASE_POOL_SIZE,
     COUCHBASE_PORT,
     COUCHBASE_USER,
 )
-from app.db.couchbase_utils import get_cluster_couchbase_url
+from app.db.couchbase_utils import get_bucket_couchbase_url, get_cluster_couchbase_url
+from app.db.transcoder import transcoder
 
 
 def get_default_bucket():
@@ -45,12 +59,259 @@ def get_bucket(
     n1ql_timeout: float = COUCHBASE_N1QL_TIMEOUT_SECS,
 ):
     cluster = get_cluster(username, password, host=host, port=port)
-    bucket: Bucket = cluster.open_bucket(bucket_name, lockmode=LOCKMODE_WAIT)
+    bucket: Bucket = cluster.open_bucket(
+        bucket_name, lockmode=LOCKMODE_WAIT, transcoder=transcoder
+    )
+    bucket.timeout = timeout
+    bucket.n1ql_timeout = n1ql_timeout
+    return bucket
+
+
+class BucketPoolTimeout(Exception):
+    pass
+
+
+class BucketPool:
+    """
+    Pool of open buckets shared by all the requests in a worker process.
+
+    Buckets are opened lazily, up to `size`, and handed out with `checkout()`.
+    Idle buckets are pinged before being reused if they haven't been checked
+    for `health_check_interval` seconds, and replaced when the ping fails.
+    """
+
+    def __init__(
+        self,
+        *,
+        username: str,
+        password: str,
+        bucket_name: str,
+        host="couchbase",
+        port="8091",
+        size: int = COUCHBASE_POOL_SIZE,
+        checkout_timeout: float = COUCHBASE_POOL_CHECKOUT_TIMEOUT_SECS,
+        health_check_interval: float = COUCHBASE_POOL_HEALTH_CHECK_INTERVAL_SECS,
+    ):
+        self.username = username
+        self.password = password
+        self.bucket_name = bucket_name
+        self.host = host
+        self.port = port
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self._reset()
+
+    def _reset(self):
+        # Buckets can't be shared with a forked child, each process gets its own
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        # (bucket, last time it was known to be healthy)
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._checkouts = 0
+        self._checkout_timeouts = 0
+        self._reconnects = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _ensure_process(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _open(self):
+        return get_bucket(
+            self.username,
+            self.password,
+            self.bucket_name,
+            host=self.host,
+            port=self.port,
+        )
+
+    def _is_healthy(self, bucket: Bucket):
+        try:
+            bucket.ping()
+        except CouchbaseError:
+            return False
+        return True
+
+    def _discard(self, bucket: Bucket):
+        with self._lock:
+            self._opened -= 1
+            self._reconnects += 1
+
+    def _reserve_new(self):
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                return True
+        return False
+
+    def _get(self, deadline: float):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        if self._reserve_new():
+            try:
+                bucket = self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+            return bucket, time.monotonic()
+        remaining = deadline - time.monotonic()
+        try:
+            return self._idle.get(timeout=max(remaining, 0))
+        except queue.Empty:
+            with self._lock:
+                self._checkout_timeouts += 1
+            raise BucketPoolTimeout(
+                f"No Couchbase bucket available after {self.checkout_timeout} seconds"
+            )
+
+    def acquire(self) -> Bucket:
+        self._ensure_process()
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+        while True:
+            bucket, last_checked = self._get(deadline)
+            now = time.monotonic()
+            if now - last_checked < self.health_check_interval:
+                break
+            if self._is_healthy(bucket):
+                break
+            self._discard(bucket)
+        wait = time.monotonic() - start
+        with self._lock:
+            self._checkouts += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        return bucket
+
+    def release(self, bucket: Bucket, *, healthy=True):
+        if self._pid != os.getpid():
+            return
+        # A last check time of 0 forces a ping on the next checkout
+        last_checked = time.monotonic() if healthy else 0.0
+        self._idle.put((bucket, last_checked))
+
+    @contextmanager
+    def checkout(self):
+        bucket = self.acquire()
+        healthy = True
+        try:
+            yield bucket
+        except CouchbaseNetworkError:
+            healthy = False
+            raise
+        finally:
+            self.release(bucket, healthy=healthy)
+
+    def stats(self):
+        with self._lock:
+            idle = self._idle.qsize()
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "idle": idle,
+                "in_use": self._opened - idle,
+                "checkouts": self._checkouts,
+                "checkout_timeouts": self._checkout_timeouts,
+                "reconnects": self._reconnects,
+                "checkout_wait_total_secs": self._wait_total,
+                "checkout_wait_max_secs": self._wait_max,
+                "checkout_wait_avg_secs": (
+                    self._wait_total / self._checkouts if self._checkouts else 0.0
+                ),
+            }
+
+
+bucket_pool = BucketPool(
+    username=COUCHBASE_USER,
+    password=COUCHBASE_PASSWORD,
+    bucket_name=COUCHBASE_BUCKET_NAME,
+    host=COUCHBASE_HOST,
+    port=COUCHBASE_PORT,
+)
+
+
+async def get_async_bucket(
+    username: str,
+    password: str,
+    bucket_name: str,
+    host="couchbase",
+    port="8091",
+    timeout: float = COUCHBASE_OPERATION_TIMEOUT_SECS,
+    n1ql_timeout: float = COUCHBASE_N1QL_TIMEOUT_SECS,
+):
+    bucket_url = get_bucket_couchbase_url(bucket_name, host=host, port=port)
+    bucket = AsyncBucket(
+        bucket_url, username=username, password=password, transcoder=transcoder
+    )
+    await bucket.connect()
     bucket.timeout = timeout
     bucket.n1ql_timeout = n1ql_timeout
     return bucket
 
 
+class AsyncBucketHolder:
+    """
+    Single asyncio bucket shared by all the coroutines of a worker process.
+
+    An asyncio bucket multiplexes any number of concurrent operations over its
+    connections, so there's no need to pool several of them.
+    """
+
+    def __init__(
+        self,
+        *,
+        username: str,
+        password: str,
+        bucket_name: str,
+        host="couchbase",
+        port="8091",
+    ):
+        self.username = username
+        self.password = password
+        self.bucket_name = bucket_name
+        self.host = host
+        self.port = port
+        self._pid = None
+        self._bucket = None
+        self._lock = None
+
+    async def get(self) -> AsyncBucket:
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._bucket = None
+            self._lock = asyncio.Lock()
+        if self._bucket is not None:
+            return self._bucket
+        async with self._lock:
+            if self._bucket is None:
+                self._bucket = await get_async_bucket(
+                    self.username,
+                    self.password,
+                    self.bucket_name,
+                    host=self.host,
+                    port=self.port,
+                )
+        return self._bucket
+
+    def reset(self):
+        self._bucket = None
+
+
+async_bucket_holder = AsyncBucketHolder(
+    username=COUCHBASE_USER,
+    password=COUCHBASE_PASSWORD,
+    bucket_name=COUCHBASE_BUCKET_NAME,
+    host=COUCHBASE_HOST,
+    port=COUCHBASE_PORT,
+)
+
+
 def ensure_create_primary_index(bucket: Bucket):
     manager = bucket.bucket_manager()
     return manager.n1ql_index_create_primary(ignore_exists=True)
@@ -59,3 +320,22 @@ def ensure_create_primary_index(bucket: Bucket):
 def ensure_create_type_index(bucket: Bucket):
     manager = bucket.bucket_manager()
     return manager.n1ql_index_create("idx_type", ignore_exists=True, fields=["type"])
+
+
+def ensure_create_type_id_index(bucket: Bucket):
+    # Lets listings by type be sorted and paginated by document ID from the index
+    manager = bucket.bucket_manager()
+    return manager.n1ql_index_create(
+        "idx_type_id", ignore_exists=True, fields=["type", "META().id"]
+    )
+
+
+def ensure_create_covering_index(
+    bucket: Bucket, *, name: str, doc_type: str, fields: List[str]
+):
+    # Partial index over the documents of a type, with all the fields a query uses,
+    # so the query is answered from the index without fetching the documents
+    manager = bucket.bucket_manager()
+    return manager.n1ql_index_create(
+        name, ignore_exists=True, fields=fields, condition=f'type = "{doc_type}"'
+    )
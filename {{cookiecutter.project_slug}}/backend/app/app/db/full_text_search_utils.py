@@ -1,10 +1,11 @@
 import json
+from functools import lru_cache
 from pathlib import Path, PurePath
-from typing import Any, Dict
+from typing import Any, Dict, FrozenSet, Optional
 
-import requests
 from requests.auth import HTTPBasicAuth
 
+from app.core import http_client
 from app.core.config import (
     COUCHBASE_FULL_TEXT_INDEX_DEFINITIONS_DIR,
     COUCHBASE_PASSWORD,
@@ -23,7 +24,7 @@ def get_index(
     full_text_url = f"http://{host}:{port}"
     index_url = f"{full_text_url}/api/index/{index_name}"
     auth = HTTPBasicAuth(username, password)
-    response = requests.get(index_url, auth=auth)
+    response = http_client.full_text_search.get(index_url, auth=auth)
     if response.status_code == 400:
         content = response.json()
         error = content.get("error")
@@ -56,7 +57,9 @@ def create_index(
     full_text_url = f"http://{host}:{port}"
     index_url = f"{full_text_url}/api/index/{index_name}"
     auth = HTTPBasicAuth(username, password)
-    response = requests.put(index_url, auth=auth, json=index_definition)
+    response = http_client.full_text_search.put(
+        index_url, auth=auth, json=index_definition
+    )
     content = response.json()
     if response.status_code == 400:
         error = content.get("error")
@@ -104,3 +107,70 @@ def ensure_create_full_text_indexes(
                     host=host,
                     port=port,
                 ), "Full Text Search index could not be created"
+
+
+@lru_cache()
+def get_index_definitions(
+    index_dir: str = COUCHBASE_FULL_TEXT_INDEX_DEFINITIONS_DIR,
+) -> Dict[str, Dict[str, Any]]:
+    definitions = {}
+    path = Path(index_dir)
+    if not path.is_dir():
+        return definitions
+    for file_path in path.iterdir():
+        if file_path.name.endswith(".json"):
+            with open(file_path) as f:
+                index_definition = json.load(f)
+            definitions[index_definition.get("name")] = index_definition
+    return definitions
+
+
+def get_mapping_stored_fields(
+    index_definition: Dict[str, Any], *, doc_type: Optional[str] = None
+) -> FrozenSet[str]:
+    mapping = (index_definition.get("params") or {}).get("mapping") or {}
+    types = mapping.get("types") or {}
+    if doc_type is not None:
+        type_mappings = [types.get(doc_type)]
+    else:
+        type_mappings = list(types.values())
+    stored_by_type = []
+    for type_mapping in type_mappings:
+        stored = set()
+        if type_mapping and type_mapping.get("enabled", True):
+            properties = type_mapping.get("properties") or {}
+            for name, field_mapping in properties.items():
+                for field in field_mapping.get("fields") or []:
+                    if field.get("store"):
+                        stored.add(field.get("name", name))
+        stored_by_type.append(stored)
+    if not stored_by_type:
+        return frozenset()
+    return frozenset(set.intersection(*stored_by_type))
+
+
+@lru_cache()
+def get_stored_fields(
+    index_name: str,
+    *,
+    doc_type: Optional[str] = None,
+    index_dir: str = COUCHBASE_FULL_TEXT_INDEX_DEFINITIONS_DIR,
+) -> FrozenSet[str]:
+    """
+    Names of the fields stored by a full text search index, for the documents
+    of `doc_type` (or of all the types it maps), as in the index definition
+    files. For an alias, the fields stored by all its targets.
+    """
+    index_definition = get_index_definitions(index_dir).get(index_name)
+    if index_definition is None:
+        return frozenset()
+    if index_definition.get("type") == "fulltext-alias":
+        targets = (index_definition.get("params") or {}).get("targets") or {}
+        stored_by_target = [
+            get_stored_fields(target, doc_type=doc_type, index_dir=index_dir)
+            for target in targets
+        ]
+        if not stored_by_target:
+            return frozenset()
+        return frozenset.intersection(*stored_by_target)
+    return get_mapping_stored_fields(index_definition, doc_type=doc_type)
@@ -9,11 +9,14 @@ from app.db.couchbase_utils import (
     get_cluster_http_url,
 )
 from app.db.database import (
+    ensure_create_covering_index,
     ensure_create_primary_index,
+    ensure_create_type_id_index,
     ensure_create_type_index,
     get_bucket,
 )
 from app.db.full_text_search_utils import ensure_create_full_text_indexes
+from app.models.config import ITEM_DOC_TYPE, USERPROFILE_DOC_TYPE
 from app.models.role import RoleEnum
 from app.models.user import UserCreate
 
@@ -56,6 +59,19 @@ def init_db():
     logging.info("before ensure_create_type_index")
     ensure_create_type_index(bucket)
     logging.info("after ensure_create_type_index")
+    logging.info("before ensure_create_type_id_index")
+    ensure_create_type_id_index(bucket)
+    logging.info("after ensure_create_type_id_index")
+    logging.info("before ensure_create_covering_index")
+    for doc_type, indexes in (
+        (ITEM_DOC_TYPE, crud.item.covering_indexes),
+        (USERPROFILE_DOC_TYPE, crud.user.covering_indexes),
+    ):
+        for name, fields in indexes.items():
+            ensure_create_covering_index(
+                bucket, name=name, doc_type=doc_type, fields=fields
+            )
+    logging.info("after ensure_create_covering_index")
     logging.info("before ensure_create_full_text_indexes")
     ensure_create_full_text_indexes(
         index_dir=config.COUCHBASE_FULL_TEXT_INDEX_DEFINITIONS_DIR,
@@ -0,0 +1,27 @@
+from couchbase import FMT_JSON
+from couchbase.transcoder import Transcoder, get_decode_format
+
+from app.core import json_codec
+
+
+class JSONCodecTranscoder(Transcoder):
+    """
+    Transcoder that encodes and decodes JSON documents with the fast JSON
+    codec. Other formats are handled by the default transcoder.
+
+    Models and enums in the values are encoded directly, without a previous
+    `jsonable_encoder` pass.
+    """
+
+    def encode_value(self, value, format):
+        if format == FMT_JSON:
+            return json_codec.dumps(value), FMT_JSON
+        return super().encode_value(value, format)
+
+    def decode_value(self, value, flags):
+        if get_decode_format(flags) == FMT_JSON:
+            return json_codec.loads(value)
+        return super().decode_value(value, flags)
+
+
+transcoder = JSONCodecTranscoder()
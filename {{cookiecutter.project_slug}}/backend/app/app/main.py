@@ -1,10 +1,23 @@
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
 from app.api.api_v1.api import api_router
+from app.api.utils.consistency import MUTATION_STATE_HEADER
+from app.api.utils.etag import ETAG_HEADER
+from app.api.utils.pagination import NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER
+from app.api.utils.responses import CodecJSONResponse
+from app.api.utils.search import FACETS_HEADER, TOTAL_COUNT_HEADER
 from app.core import config
+from app.core.security import PasswordHasherBusy
+from app.db.database import BucketPoolTimeout
 
-app = FastAPI(title=config.PROJECT_NAME, openapi_url="/api/v1/openapi.json")
+app = FastAPI(
+    title=config.PROJECT_NAME,
+    openapi_url="/api/v1/openapi.json",
+    default_response_class=CodecJSONResponse,
+)
 
 # CORS
 origins = []
@@ -21,6 +34,32 @@ if config.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[
+            NEXT_CURSOR_HEADER,
+            PREV_CURSOR_HEADER,
+            MUTATION_STATE_HEADER,
+            ETAG_HEADER,
+            TOTAL_COUNT_HEADER,
+            FACETS_HEADER,
+        ],
     ),
 
 app.include_router(api_router, prefix=config.API_V1_STR)
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many password operations, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(BucketPoolTimeout)
+async def bucket_pool_timeout_handler(request: Request, exc: BucketPoolTimeout):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many concurrent requests, try again later"},
+        headers={"Retry-After": "1"},
+    )
@@ -1,2 +1,10 @@
 USERPROFILE_DOC_TYPE = "userprofile"
 ITEM_DOC_TYPE = "item"
+REFRESH_TOKEN_DOC_TYPE = "refresh_token"
+TOKEN_REVOCATION_DOC_TYPE = "token_revocation"
+
+# Bump when the stored documents of the type no longer match its models
+USERPROFILE_SCHEMA_VERSION = 1
+ITEM_SCHEMA_VERSION = 1
+REFRESH_TOKEN_SCHEMA_VERSION = 1
+TOKEN_REVOCATION_SCHEMA_VERSION = 1
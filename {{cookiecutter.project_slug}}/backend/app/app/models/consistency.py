@@ -0,0 +1,10 @@
+from enum import Enum
+
+
+class ScanConsistency(str, Enum):
+    # Don't wait for the indexes, the fastest, results can miss recent writes
+    not_bounded = "not_bounded"
+    # Wait for the indexes to have the mutations passed in X-Couchbase-Mutation-State
+    at_plus = "at_plus"
+    # Wait for the indexes to have all the mutations up to the query
+    request_plus = "request_plus"
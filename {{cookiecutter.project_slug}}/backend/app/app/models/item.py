@@ -1,6 +1,9 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
-from app.models.config import ITEM_DOC_TYPE
+from app.models.config import ITEM_DOC_TYPE, ITEM_SCHEMA_VERSION
+from app.models.schema import register_schema_version
 
 
 # Shared properties
@@ -29,6 +32,18 @@ class Item(ItemBase):
 # Properties properties stored in DB
 class ItemInDB(ItemBase):
     type: str = ITEM_DOC_TYPE
+    schema_version: int = ITEM_SCHEMA_VERSION
     id: str
     title: str
     owner_username: str
+
+
+register_schema_version(ITEM_SCHEMA_VERSION, Item, ItemInDB)
+
+
+# Result of each item in a batch operation
+class ItemBatchResult(BaseModel):
+    id: str
+    success: bool
+    error: Optional[str] = None
+    item: Optional[Item] = None
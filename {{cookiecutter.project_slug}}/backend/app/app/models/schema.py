@@ -0,0 +1,79 @@
+from copy import deepcopy
+from typing import Dict, FrozenSet, Type, TypeVar
+
+from pydantic import BaseModel
+
+from app.core.config import TRUSTED_READS_ENABLED
+
+PydanticModel = TypeVar("PydanticModel", bound=BaseModel)
+
+# Field stored in each document with the version of the schema it was written with
+SCHEMA_VERSION_FIELD = "schema_version"
+
+_schema_versions: Dict[Type[BaseModel], int] = {}
+_required_fields: Dict[Type[BaseModel], FrozenSet[str]] = {}
+
+
+def register_schema_version(version: int, *doc_models: Type[BaseModel]):
+    """
+    Declare that documents with this schema version can be read into these
+    models without validation.
+
+    Bump the version when a change of the models makes the stored documents
+    invalid, so they are validated again when read.
+    """
+    for doc_model in doc_models:
+        _schema_versions[doc_model] = version
+
+
+def get_schema_version(doc_model: Type[BaseModel]):
+    return _schema_versions.get(doc_model)
+
+
+def construct_model(doc_model: Type[PydanticModel], data: dict) -> PydanticModel:
+    """
+    Create a model from trusted data without validating it, as `construct()`.
+
+    Missing fields get their defaults and unknown keys are dropped.
+    """
+    values = {}
+    fields_set = set()
+    for name, field in doc_model.__fields__.items():
+        if name in data:
+            values[name] = data[name]
+            fields_set.add(name)
+        else:
+            values[name] = deepcopy(field.default)
+    model = doc_model.__new__(doc_model)
+    object.__setattr__(model, "__dict__", values)
+    object.__setattr__(model, "__fields_set__", fields_set)
+    return model
+
+
+def _get_required_fields(doc_model: Type[BaseModel]):
+    required = _required_fields.get(doc_model)
+    if required is None:
+        required = frozenset(
+            name for name, field in doc_model.__fields__.items() if field.required
+        )
+        _required_fields[doc_model] = required
+    return required
+
+
+def doc_to_model(data: dict, *, doc_model: Type[PydanticModel]) -> PydanticModel:
+    """
+    Create a model from a document read from Couchbase.
+
+    Documents written with the current schema version of the model were
+    validated when written, so they are trusted and not validated again.
+    Others, e.g. written before a schema change, are validated.
+    """
+    version = _schema_versions.get(doc_model)
+    if (
+        TRUSTED_READS_ENABLED
+        and version is not None
+        and data.get(SCHEMA_VERSION_FIELD) == version
+        and _get_required_fields(doc_model).issubset(data)
+    ):
+        return construct_model(doc_model, data)
+    return doc_model(**data)
@@ -1,10 +1,60 @@
+from typing import List
+
 from pydantic import BaseModel
 
+from app.models.config import (
+    REFRESH_TOKEN_DOC_TYPE,
+    REFRESH_TOKEN_SCHEMA_VERSION,
+    TOKEN_REVOCATION_DOC_TYPE,
+    TOKEN_REVOCATION_SCHEMA_VERSION,
+)
+from app.models.schema import register_schema_version
+
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str = None
 
 
 class TokenPayload(BaseModel):
     username: str = None
+    # Issue time, as a timestamp
+    iat: float = None
+    # Claims of access tokens, to authorize without reading the user
+    roles: List[str] = None
+    disabled: bool = None
+    # ID of refresh tokens, as stored in DB
+    jti: str = None
+
+
+# User authenticated by the claims of an access token, with the same fields as
+# UserInDB used for authorization
+class Principal(BaseModel):
+    username: str
+    admin_roles: List[str] = []
+    disabled: bool = False
+
+
+# Properties stored in DB, with the document expiring with the token
+class RefreshTokenInDB(BaseModel):
+    type: str = REFRESH_TOKEN_DOC_TYPE
+    schema_version: int = REFRESH_TOKEN_SCHEMA_VERSION
+    id: str
+    username: str
+
+
+register_schema_version(REFRESH_TOKEN_SCHEMA_VERSION, RefreshTokenInDB)
+
+
+# Properties stored in DB, with the document expiring with the access tokens
+# issued before the revocation
+class TokenRevocationInDB(BaseModel):
+    type: str = TOKEN_REVOCATION_DOC_TYPE
+    schema_version: int = TOKEN_REVOCATION_SCHEMA_VERSION
+    username: str
+    # Timestamp, access tokens issued up to it are revoked
+    revoked_at: float
+
+
+register_schema_version(TOKEN_REVOCATION_SCHEMA_VERSION, TokenRevocationInDB)
@@ -2,8 +2,9 @@ from typing import List, Optional, Union
 
 from pydantic import BaseModel
 
-from app.models.config import USERPROFILE_DOC_TYPE
+from app.models.config import USERPROFILE_DOC_TYPE, USERPROFILE_SCHEMA_VERSION
 from app.models.role import RoleEnum
+from app.models.schema import register_schema_version
 
 
 # Shared properties in Couchbase and Sync Gateway
@@ -42,10 +43,14 @@ class User(UserBaseInDB):
 # Additional properties stored in DB
 class UserInDB(UserBaseInDB):
     type: str = USERPROFILE_DOC_TYPE
+    schema_version: int = USERPROFILE_SCHEMA_VERSION
     hashed_password: str
     username: str
 
 
+register_schema_version(USERPROFILE_SCHEMA_VERSION, User, UserInDB)
+
+
 # Additional properties in Sync Gateway
 class UserSyncIn(UserBase):
     name: str
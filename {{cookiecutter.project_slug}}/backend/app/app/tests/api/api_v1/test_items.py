@@ -1,3 +1,6 @@
+import base64
+import json
+
 import requests
 
 from app.core import config
@@ -32,3 +35,137 @@ def test_read_item(superuser_token_headers):
     assert content["description"] == item.description
     assert content["id"] == item.id
     assert content["owner_username"] == item.owner_username
+
+
+def test_read_items_with_cursor(superuser_token_headers):
+    create_random_item()
+    create_random_item()
+    server_api = get_server_api()
+    response = requests.get(
+        f"{server_api}{config.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"limit": 1},
+    )
+    first_page = response.json()
+    assert len(first_page) == 1
+    cursor = response.headers["X-Next-Cursor"]
+    response = requests.get(
+        f"{server_api}{config.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"limit": 1, "cursor": cursor},
+    )
+    second_page = response.json()
+    assert len(second_page) == 1
+    assert second_page[0]["id"] > first_page[0]["id"]
+
+
+def test_read_items_invalid_cursor(superuser_token_headers):
+    server_api = get_server_api()
+    response = requests.get(
+        f"{server_api}{config.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"cursor": "not a cursor"},
+    )
+    assert response.status_code == 400
+
+
+def test_read_items_stream_ndjson(superuser_token_headers):
+    item = create_random_item()
+    server_api = get_server_api()
+    headers = {**superuser_token_headers, "Accept": "application/x-ndjson"}
+    response = requests.get(
+        f"{server_api}{config.API_V1_STR}/items/",
+        headers=headers,
+        params={"limit": 10000},
+        stream=True,
+    )
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    ids = [json.loads(line)["id"] for line in response.iter_lines() if line]
+    assert item.id in ids
+
+
+def test_read_items_stream_json_array(superuser_token_headers):
+    item = create_random_item()
+    server_api = get_server_api()
+    response = requests.get(
+        f"{server_api}{config.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"limit": 10000, "stream": True},
+    )
+    content = response.json()
+    assert item.id in [doc["id"] for doc in content]
+
+
+def test_create_and_delete_items_batch(superuser_token_headers):
+    server_api = get_server_api()
+    data = [{"title": "Foo", "description": "Fighters"}, {"title": "Bar"}]
+    response = requests.post(
+        f"{server_api}{config.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    content = response.json()
+    assert len(content) == 2
+    assert all(result["success"] for result in content)
+    assert content[0]["item"]["title"] == "Foo"
+    ids = [result["id"] for result in content] + ["nonexistent"]
+    response = requests.delete(
+        f"{server_api}{config.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        json=ids,
+    )
+    content = response.json()
+    assert [result["success"] for result in content] == [True, True, False]
+    assert content[2]["error"] == "Item not found"
+
+
+def test_read_items_with_mutation_state(superuser_token_headers):
+    server_api = get_server_api()
+    data = {"title": "Foo", "description": "Fighters"}
+    response = requests.post(
+        f"{server_api}{config.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    created_item = response.json()
+    mutation_state = response.headers["X-Couchbase-Mutation-State"]
+    headers = {**superuser_token_headers, "X-Couchbase-Mutation-State": mutation_state}
+    response = requests.get(
+        f"{server_api}{config.API_V1_STR}/items/",
+        headers=headers,
+        params={"limit": 10000},
+    )
+    assert created_item["id"] in [item["id"] for item in response.json()]
+
+
+def test_read_items_invalid_mutation_state(superuser_token_headers):
+    server_api = get_server_api()
+    headers = {**superuser_token_headers, "X-Couchbase-Mutation-State": "invalid"}
+    response = requests.get(f"{server_api}{config.API_V1_STR}/items/", headers=headers)
+    assert response.status_code == 400
+    # Valid base64 JSON, but not mutation tokens
+    for data in [{}, {"bucket": {"0": "not a token"}}]:
+        mutation_state = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        headers = {
+            **superuser_token_headers,
+            "X-Couchbase-Mutation-State": mutation_state,
+        }
+        response = requests.get(
+            f"{server_api}{config.API_V1_STR}/items/", headers=headers
+        )
+        assert response.status_code == 400
+
+
+def test_update_item_if_match(superuser_token_headers):
+    item = create_random_item()
+    server_api = get_server_api()
+    url = f"{server_api}{config.API_V1_STR}/items/{item.id}"
+    response = requests.get(url, headers=superuser_token_headers)
+    etag = response.headers["ETag"]
+    headers = {**superuser_token_headers, "If-Match": etag}
+    response = requests.put(url, headers=headers, json={"title": "Foo"})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Foo"
+    assert response.headers["ETag"] != etag
+    response = requests.put(url, headers=headers, json={"title": "Bar"})
+    assert response.status_code == 412
@@ -28,3 +28,56 @@ def test_use_access_token(superuser_token_headers):
     result = r.json()
     assert r.status_code == 200
     assert "username" in result
+
+
+def test_refresh_token():
+    server_api = get_server_api()
+    login_data = {
+        "username": config.FIRST_SUPERUSER,
+        "password": config.FIRST_SUPERUSER_PASSWORD,
+    }
+    r = requests.post(
+        f"{server_api}{config.API_V1_STR}/login/access-token", data=login_data
+    )
+    refresh_token = r.json()["refresh_token"]
+    r = requests.post(
+        f"{server_api}{config.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": refresh_token},
+    )
+    tokens = r.json()
+    assert r.status_code == 200
+    assert tokens["access_token"]
+    assert tokens["refresh_token"] != refresh_token
+    # Each refresh token can be used only once
+    r = requests.post(
+        f"{server_api}{config.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": refresh_token},
+    )
+    assert r.status_code == 403
+    r = requests.post(
+        f"{server_api}{config.API_V1_STR}/logout",
+        json={"refresh_token": tokens["refresh_token"]},
+    )
+    assert r.status_code == 200
+    r = requests.post(
+        f"{server_api}{config.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": tokens["refresh_token"]},
+    )
+    assert r.status_code == 403
+
+
+def test_refresh_token_is_not_an_access_token():
+    server_api = get_server_api()
+    login_data = {
+        "username": config.FIRST_SUPERUSER,
+        "password": config.FIRST_SUPERUSER_PASSWORD,
+    }
+    r = requests.post(
+        f"{server_api}{config.API_V1_STR}/login/access-token", data=login_data
+    )
+    refresh_token = r.json()["refresh_token"]
+    r = requests.post(
+        f"{server_api}{config.API_V1_STR}/login/test-token",
+        headers={"Authorization": f"Bearer {refresh_token}"},
+    )
+    assert r.status_code == 403
@@ -3,7 +3,7 @@ import requests
 from app import crud
 from app.core import config
 from app.db.database import get_default_bucket
-from app.models.user import UserCreate
+from app.models.user import UserCreate, UserUpdate
 from app.tests.utils.user import user_authentication_headers
 from app.tests.utils.utils import get_server_api, random_lower_string
 
@@ -118,3 +118,29 @@ def test_retrieve_users(superuser_token_headers):
     for user in all_users:
         assert "username" in user
         assert "admin_roles" in user
+
+
+def test_update_user_me_keeps_concurrent_changes():
+    server_api = get_server_api()
+    username = random_lower_string()
+    password = random_lower_string()
+    user_in = UserCreate(username=username, email=username, password=password)
+    bucket = get_default_bucket()
+    crud.user.upsert(bucket, user_in=user_in, persist_to=1)
+    headers = user_authentication_headers(server_api, username, password)
+    # The server caches the current user
+    r = requests.get(f"{server_api}{config.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+    # Changed by an admin, in another process
+    crud.user.update(
+        bucket, username=username, user_in=UserUpdate(admin_channels=["updated"])
+    )
+    r = requests.put(
+        f"{server_api}{config.API_V1_STR}/users/me",
+        headers=headers,
+        json={"full_name": "Updated"},
+    )
+    assert r.status_code == 200
+    user = crud.user.get(bucket, username=username)
+    assert user.full_name == "Updated"
+    assert user.admin_channels == ["updated"]
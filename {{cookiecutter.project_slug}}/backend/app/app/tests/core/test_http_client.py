@@ -0,0 +1,53 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from app.core.http_client import HTTPService
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Responses to return, in order, then 200
+    statuses = []
+
+    def respond(self):
+        status = self.statuses.pop(0) if self.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = respond
+    do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = HTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_service_retries_idempotent_requests(server_url):
+    service = HTTPService("test", timeout=5, retries=2, backoff=0)
+    FlakyHandler.statuses = [503, 503]
+    assert service.get(server_url).status_code == 200
+    FlakyHandler.statuses = [503, 503, 503]
+    assert service.get(server_url).status_code == 503
+    stats = service.stats()
+    assert stats["requests"] == 2
+    assert stats["errors"] == 0
+    assert stats["time_max_secs"] > 0
+
+
+def test_http_service_does_not_retry_post(server_url):
+    service = HTTPService("test", timeout=5, retries=2, backoff=0)
+    FlakyHandler.statuses = [503]
+    assert service.post(server_url).status_code == 503
+    assert service.get(server_url).status_code == 200
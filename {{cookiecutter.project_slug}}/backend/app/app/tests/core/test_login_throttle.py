@@ -0,0 +1,58 @@
+import pytest
+
+from app.core.login_throttle import FailureCounter, LoginThrottle, LoginThrottled
+from app.core.security import PasswordHasherBusy
+
+
+def get_login_throttle(max_concurrent=1):
+    return LoginThrottle(
+        max_concurrent=max_concurrent,
+        username_failures=FailureCounter(
+            free_failures=2, backoff_base=10, backoff_max=60, size=10
+        ),
+        client_failures=FailureCounter(
+            free_failures=3, backoff_base=10, backoff_max=60, size=10
+        ),
+    )
+
+
+def test_failure_counter_backoff():
+    failure_counter = FailureCounter(
+        free_failures=1, backoff_base=10, backoff_max=30, size=10
+    )
+    failure_counter.record_failure("johndoe")
+    assert failure_counter.retry_after("johndoe") == 0
+    failure_counter.record_failure("johndoe")
+    assert 9 < failure_counter.retry_after("johndoe") <= 10
+    failure_counter.record_failure("johndoe")
+    assert 19 < failure_counter.retry_after("johndoe") <= 20
+    failure_counter.record_failure("johndoe")
+    assert 29 < failure_counter.retry_after("johndoe") <= 30
+    failure_counter.record_failure("johndoe")
+    assert failure_counter.retry_after("johndoe") <= 30
+    failure_counter.reset("johndoe")
+    assert failure_counter.retry_after("johndoe") == 0
+
+
+def test_login_throttle_by_username_and_client():
+    login_throttle = get_login_throttle()
+    for _ in range(3):
+        login_throttle.record_failure(username="johndoe", client="10.0.0.1")
+    with pytest.raises(LoginThrottled):
+        login_throttle.check(username="johndoe", client="10.0.0.2")
+    login_throttle.check(username="janedoe", client="10.0.0.1")
+    login_throttle.record_failure(username="janedoe", client="10.0.0.1")
+    with pytest.raises(LoginThrottled):
+        login_throttle.check(username="janedoe", client="10.0.0.1")
+    assert login_throttle.stats()["throttled"] == 2
+
+
+def test_login_throttle_concurrent_verifications():
+    login_throttle = get_login_throttle(max_concurrent=1)
+    with login_throttle.verification():
+        with pytest.raises(PasswordHasherBusy):
+            with login_throttle.verification():
+                pass
+    with login_throttle.verification():
+        pass
+    assert login_throttle.stats()["busy"] == 1
@@ -0,0 +1,41 @@
+import pytest
+
+from app.core.security import PasswordHasher, PasswordHasherBusy, get_crypt_context
+
+
+def test_password_hasher_inline():
+    password_hasher = PasswordHasher(workers=0, max_queue=1, timeout=10)
+    hashed_password = password_hasher.hash("secret")
+    assert password_hasher.verify("secret", hashed_password)
+    assert not password_hasher.verify("not secret", hashed_password)
+    stats = password_hasher.stats()
+    assert stats["operations"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["time_max_secs"] > 0
+
+
+def test_password_hasher_pool():
+    password_hasher = PasswordHasher(workers=1, max_queue=1, timeout=10)
+    hashed_password = password_hasher.hash("secret")
+    assert password_hasher.verify("secret", hashed_password)
+
+
+def test_password_hasher_busy():
+    password_hasher = PasswordHasher(workers=0, max_queue=0, timeout=10)
+    with pytest.raises(PasswordHasherBusy):
+        password_hasher.hash("secret")
+    assert password_hasher.stats()["rejected"] == 1
+
+
+def test_crypt_context_needs_update():
+    old_context = get_crypt_context(
+        "bcrypt", bcrypt_rounds=4, argon2_rounds=2, argon2_memory_cost=512
+    )
+    context = get_crypt_context(
+        "bcrypt", bcrypt_rounds=5, argon2_rounds=2, argon2_memory_cost=512
+    )
+    hashed_password = old_context.hash("secret")
+    assert not old_context.needs_update(hashed_password)
+    assert context.needs_update(hashed_password)
+    # Hashes with the old cost are still verified
+    assert context.verify("secret", hashed_password)
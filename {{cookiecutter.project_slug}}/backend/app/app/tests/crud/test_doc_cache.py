@@ -0,0 +1,51 @@
+from app.crud.doc_cache import DocCache
+from app.models.role import RoleEnum
+
+
+def get_doc_cache():
+    doc_cache = DocCache(enabled=True)
+    doc_cache.configure("item", size=2, ttl=60)
+    return doc_cache
+
+
+def test_doc_cache_only_caches_configured_types():
+    doc_cache = get_doc_cache()
+    doc_cache.set("userprofile::johndoe", cas=1, value={"username": "johndoe"})
+    assert doc_cache.get("userprofile::johndoe") is None
+    doc_cache.set("item::foo", cas=1, value={"id": "foo"})
+    assert doc_cache.get("item::foo") == (1, {"id": "foo"})
+
+
+def test_doc_cache_ignores_older_cas():
+    doc_cache = get_doc_cache()
+    doc_cache.set("item::foo", cas=2, value={"title": "new"})
+    doc_cache.set("item::foo", cas=1, value={"title": "old"})
+    assert doc_cache.get("item::foo") == (2, {"title": "new"})
+
+
+def test_doc_cache_invalidate_keeps_tombstone():
+    doc_cache = get_doc_cache()
+    doc_cache.set("item::foo", cas=1, value={"title": "foo"})
+    doc_cache.invalidate("item::foo", cas=2)
+    assert doc_cache.get("item::foo") is None
+    doc_cache.set("item::foo", cas=1, value={"title": "foo"})
+    assert doc_cache.get("item::foo") is None
+
+
+def test_doc_cache_evicts_least_recently_used():
+    doc_cache = get_doc_cache()
+    doc_cache.set("item::a", cas=1, value={"id": "a"})
+    doc_cache.set("item::b", cas=1, value={"id": "b"})
+    doc_cache.get("item::a")
+    doc_cache.set("item::c", cas=1, value={"id": "c"})
+    assert doc_cache.get("item::b") is None
+    assert doc_cache.get("item::a")
+    assert doc_cache.stats()["item"]["evictions"] == 1
+
+
+def test_doc_cache_set_written_caches_json_values():
+    doc_cache = get_doc_cache()
+    doc_cache.set_written(
+        "item::foo", cas=1, value={"roles": [RoleEnum.superuser], "tags": {"a"}}
+    )
+    assert doc_cache.get("item::foo") == (1, {"roles": ["superuser"], "tags": ["a"]})
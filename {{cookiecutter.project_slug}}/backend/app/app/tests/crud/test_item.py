@@ -1,7 +1,13 @@
+import asyncio
+
+import pytest
+from couchbase.exceptions import KeyExistsError
+
 from app import crud
-from app.db.database import get_default_bucket
+from app.db.database import async_bucket_holder, get_default_bucket
 from app.models.config import ITEM_DOC_TYPE
-from app.models.item import ItemCreate, ItemUpdate
+from app.models.item import Item, ItemCreate, ItemUpdate
+from app.tests.utils.item import create_random_item
 from app.tests.utils.user import create_random_user
 from app.tests.utils.utils import random_lower_string
 
@@ -40,6 +46,28 @@ def test_get_item():
     assert item.owner_username == stored_item.owner_username
 
 
+def test_get_item_async():
+    title = random_lower_string()
+    description = random_lower_string()
+    id = crud.utils.generate_new_id()
+    item_in = ItemCreate(title=title, description=description)
+    bucket = get_default_bucket()
+    user = create_random_user()
+    item = crud.item.upsert(
+        bucket=bucket, id=id, doc_in=item_in, owner_username=user.username, persist_to=1
+    )
+
+    async def get_stored_item():
+        async_bucket = await async_bucket_holder.get()
+        return await crud.item.get_async(bucket=async_bucket, id=id)
+
+    stored_item = asyncio.get_event_loop().run_until_complete(get_stored_item())
+    assert item.id == stored_item.id
+    assert item.title == stored_item.title
+    assert item.description == stored_item.description
+    assert item.owner_username == stored_item.owner_username
+
+
 def test_update_item():
     title = random_lower_string()
     description = random_lower_string()
@@ -83,3 +111,29 @@ def test_delete_item():
     assert item2.title == title
     assert item2.description == description
     assert item2.owner_username == user.username
+
+
+def test_get_multi_by_owner_projection():
+    item = create_random_item()
+    bucket = get_default_bucket()
+    items = crud.item.get_multi_by_owner(bucket, owner_username=item.owner_username)
+    assert len(items) == 1
+    assert isinstance(items[0], Item)
+    assert items[0].id == item.id
+    assert items[0].title == item.title
+    assert items[0].description == item.description
+
+
+def test_update_item_fields_stale_cas():
+    item = create_random_item()
+    bucket = get_default_bucket()
+    cas = bucket.get(crud.item.get_doc_id(item.id)).cas
+    title = random_lower_string()
+    crud.item.update(bucket, id=item.id, doc_in=ItemUpdate(title=title), cas=cas)
+    with pytest.raises(KeyExistsError):
+        crud.item.update(
+            bucket, id=item.id, doc_in=ItemUpdate(description="stale"), cas=cas
+        )
+    stored_item = crud.item.get(bucket, id=item.id)
+    assert stored_item.title == title
+    assert stored_item.description == item.description
@@ -0,0 +1,34 @@
+from app.crud.principal_cache import PrincipalCache
+from app.models.user import UserInDB
+
+
+def get_user(username: str):
+    return UserInDB(username=username, hashed_password="hashed")
+
+
+def test_principal_cache_by_token_issue_time():
+    principal_cache = PrincipalCache(enabled=True, size=10, ttl=60)
+    user = get_user("johndoe")
+    generation = principal_cache.generation()
+    principal_cache.set("johndoe", issued_at=1, user=user, generation=generation)
+    assert principal_cache.get("johndoe", issued_at=1) == user
+    assert principal_cache.get("johndoe", issued_at=2) is None
+
+
+def test_principal_cache_invalidate():
+    principal_cache = PrincipalCache(enabled=True, size=10, ttl=60)
+    generation = principal_cache.generation()
+    principal_cache.set(
+        "johndoe", issued_at=1, user=get_user("johndoe"), generation=generation
+    )
+    principal_cache.set(
+        "janedoe", issued_at=1, user=get_user("janedoe"), generation=generation
+    )
+    principal_cache.invalidate("johndoe")
+    assert principal_cache.get("johndoe", issued_at=1) is None
+    assert principal_cache.get("janedoe", issued_at=1) is not None
+    # A user read before the write is not stored
+    principal_cache.set(
+        "johndoe", issued_at=1, user=get_user("johndoe"), generation=generation
+    )
+    assert principal_cache.get("johndoe", issued_at=1) is None
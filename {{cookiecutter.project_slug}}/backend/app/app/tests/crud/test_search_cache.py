@@ -0,0 +1,55 @@
+from app.crud.search_cache import SearchCache, get_search_key, normalize_query_string
+
+
+def get_search_cache():
+    search_cache = SearchCache(enabled=True, size=10, ttl=60)
+    search_cache.configure("items", doc_type="item")
+    return search_cache
+
+
+def test_normalize_query_string():
+    assert normalize_query_string(
+        " title:foo*   owner_username:johndoe type:item"
+    ) == normalize_query_string("title:foo* type:item  owner_username:johndoe")
+    assert normalize_query_string('title:"foo  bar"') == 'title:"foo  bar"'
+    assert normalize_query_string('title:"foo') == 'title:"foo'
+
+
+def test_search_cache_only_caches_configured_indexes():
+    search_cache = get_search_cache()
+    key = get_search_key(index_name="users", query_string="johndoe")
+    search_cache.set(key, [{"id": "userprofile::johndoe"}], generation=0)
+    assert search_cache.get(key) is None
+    key = get_search_key(index_name="items", query_string="title:foo*")
+    search_cache.set(key, [{"id": "item::foo"}], generation=0)
+    assert search_cache.get(key) == [{"id": "item::foo"}]
+
+
+def test_search_cache_write_invalidates_type():
+    search_cache = get_search_cache()
+    key = get_search_key(index_name="items", query_string="title:foo*")
+    generation = search_cache.generation(key)
+    search_cache.set(key, [{"id": "item::foo"}], generation=generation)
+    search_cache.invalidate("userprofile::johndoe")
+    assert search_cache.get(key) == [{"id": "item::foo"}]
+    search_cache.invalidate("item::bar")
+    assert search_cache.get(key) is None
+    # Hits of a search that started before the write are not stored
+    search_cache.set(key, [{"id": "item::foo"}], generation=generation)
+    assert search_cache.get(key) is None
+
+
+def test_search_key_filters():
+    key = get_search_key(
+        index_name="items",
+        query_string="foo",
+        filters={"type": "item", "owner_username": "johndoe"},
+    )
+    assert key == get_search_key(
+        index_name="items",
+        query_string="foo",
+        filters={"owner_username": "johndoe", "type": "item"},
+    )
+    assert key != get_search_key(
+        index_name="items", query_string="foo", filters={"type": "item"}
+    )
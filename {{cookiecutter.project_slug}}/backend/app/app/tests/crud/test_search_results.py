@@ -0,0 +1,103 @@
+import pytest
+
+from app.crud.utils import (
+    SEARCH_SORT,
+    CursorSearchParams,
+    build_search_query,
+    decode_search_cursor,
+    encode_search_cursor,
+    get_hit_sort,
+    get_term_facets,
+    search_results_to_model,
+)
+from app.models.user import UserInDB
+
+
+def test_search_results_to_model():
+    hits = [
+        {
+            "fields": {
+                "username": "johndoe@example.com",
+                "hashed_password": "hashed",
+                "full_name": "",
+                "admin_channels": "public",
+                "not_a_model_field": "ignored",
+            }
+        },
+        {"id": "userprofile::without-stored-fields"},
+    ]
+    users = search_results_to_model(hits, doc_model=UserInDB)
+    assert len(users) == 1
+    user = users[0]
+    assert user.username == "johndoe@example.com"
+    assert user.full_name is None
+    assert user.admin_channels == ["public"]
+    assert not hasattr(user, "not_a_model_field")
+
+
+def test_get_term_facets():
+    facet_results = {
+        "owner_username": {
+            "field": "owner_username",
+            "total": 3,
+            "missing": 1,
+            "other": 0,
+            "terms": [
+                {"term": "johndoe@example.com", "count": 2},
+                {"term": "janedoe@example.com", "count": 1},
+            ],
+        }
+    }
+    assert get_term_facets(facet_results) == {
+        "owner_username": {
+            "total": 3,
+            "missing": 1,
+            "other": 0,
+            "terms": [
+                {"term": "johndoe@example.com", "count": 2},
+                {"term": "janedoe@example.com", "count": 1},
+            ],
+        }
+    }
+    assert get_term_facets(None) == {}
+
+
+def test_search_cursor():
+    sort = ["_score", "item::foo"]
+    assert decode_search_cursor(encode_search_cursor(sort)) == sort
+    with pytest.raises(ValueError):
+        decode_search_cursor("not a cursor")
+
+
+def test_search_cursor_from_hit():
+    hit = {
+        "index": "items_0123456789abcdef_4c1c5584",
+        "id": "item::foo",
+        "score": 0.5312412087398478,
+        "sort": ["_score", "item::foo"],
+        "fields": {"title": "Foo"},
+    }
+    cursor = encode_search_cursor(get_hit_sort(hit))
+    score, doc_id = decode_search_cursor(cursor)
+    # The next page starts after the real score, not the placeholder
+    assert float(score) == hit["score"]
+    assert doc_id == "item::foo"
+    params = CursorSearchParams(
+        limit=10, sort=SEARCH_SORT, search_after=decode_search_cursor(cursor)
+    )
+    encoded = params.as_encodable("items")
+    assert encoded["search_after"] == [score, "item::foo"]
+    assert encoded["sort"] == SEARCH_SORT
+
+
+def test_build_search_query_filters():
+    query = build_search_query(
+        "title:foo*", filters={"type": "item", "owner_username": "johndoe"}
+    )
+    user_query, owner_filter, type_filter = query.encodable["conjuncts"]
+    assert user_query["query"] == "title:foo*"
+    assert owner_filter["field"] == "owner_username"
+    assert owner_filter["term"] == "johndoe"
+    assert owner_filter["boost"] == 0
+    assert type_filter["field"] == "type"
+    assert type_filter["term"] == "item"
@@ -0,0 +1,26 @@
+import pytest
+
+from app import crud
+from app.crud.statements import StatementRegistry
+from app.db.database import get_default_bucket
+from app.tests.utils.user import create_random_user
+
+
+def test_register_statement_twice():
+    registry = StatementRegistry()
+    registry.register("by_id", "SELECT 1;")
+    with pytest.raises(ValueError):
+        registry.register("by_id", "SELECT 2;")
+
+
+def test_prepared_statement_stats():
+    user = create_random_user()
+    bucket = get_default_bucket()
+    statement = crud.statements.statement_registry.get("users_by_email")
+    executions = statement.stats()["executions"]
+    for _ in range(2):
+        found_user = crud.user.get_by_email(bucket, email=user.email)
+        assert found_user.username == user.username
+    stats = statement.stats()
+    assert stats["executions"] == executions + 2
+    assert stats["time_max_secs"] > 0
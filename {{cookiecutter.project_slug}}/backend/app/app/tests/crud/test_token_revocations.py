@@ -0,0 +1,33 @@
+import time
+
+from app.crud.token_revocations import TokenRevocations
+from app.db.database import get_default_bucket
+from app.tests.utils.utils import random_lower_string
+
+
+def test_token_revocations():
+    bucket = get_default_bucket()
+    username = random_lower_string()
+    token_revocations = TokenRevocations(size=10, ttl=60, expiry=60)
+    issued_at = time.time()
+    assert not token_revocations.is_revoked(bucket, username, issued_at=issued_at)
+    token_revocations.revoke(bucket, username)
+    assert token_revocations.is_revoked(bucket, username, issued_at=issued_at)
+    assert not token_revocations.is_revoked(
+        bucket, random_lower_string(), issued_at=issued_at
+    )
+    # Tokens issued after the revocation have the new claims
+    assert not token_revocations.is_revoked(bucket, username, issued_at=time.time() + 1)
+
+
+def test_token_revocations_other_process():
+    bucket = get_default_bucket()
+    username = random_lower_string()
+    # Each process has its own instance, with its own cache
+    token_revocations = TokenRevocations(size=10, ttl=60, expiry=60)
+    other_token_revocations = TokenRevocations(size=10, ttl=0.1, expiry=60)
+    issued_at = time.time()
+    assert not other_token_revocations.is_revoked(bucket, username, issued_at=issued_at)
+    token_revocations.revoke(bucket, username)
+    time.sleep(0.2)
+    assert other_token_revocations.is_revoked(bucket, username, issued_at=issued_at)
@@ -1,9 +1,12 @@
+import time
+
 from fastapi.encoders import jsonable_encoder
 
 from app import crud
+from app.core import config
 from app.db.database import get_default_bucket
 from app.models.role import RoleEnum
-from app.models.user import UserCreate
+from app.models.user import UserCreate, UserInDB
 from app.tests.utils.utils import random_lower_string
 
 
@@ -41,6 +44,22 @@ def test_not_authenticate_user():
     assert user is None
 
 
+def test_authenticate_user_created_after_unknown():
+    email = random_lower_string()
+    password = random_lower_string()
+    bucket = get_default_bucket()
+    assert crud.user.authenticate(bucket, username=email, password=password) is None
+    assert crud.user.unknown_usernames.get(email, False)
+    user_in = UserCreate(username=email, email=email, password=password)
+    crud.user.upsert(bucket, user_in=user_in, persist_to=1)
+    # Created in this process, the name is no longer unknown
+    assert crud.user.authenticate(bucket, username=email, password=password)
+    # As if it was still unknown to another process, until the TTL expires
+    crud.user.unknown_usernames.set(email, True)
+    time.sleep(config.LOGIN_UNKNOWN_USERNAMES_TTL_SECS)
+    assert crud.user.authenticate(bucket, username=email, password=password)
+
+
 def test_check_if_user_is_active():
     email = random_lower_string()
     password = random_lower_string()
@@ -97,3 +116,23 @@ def test_get_user():
     user_2 = crud.user.get(bucket, username=username)
     assert user.username == user_2.username
     assert jsonable_encoder(user) == jsonable_encoder(user_2)
+
+
+def test_token_claims_changed():
+    user = UserInDB(
+        username="johndoe",
+        hashed_password="hashed",
+        admin_roles=["superuser"],
+        disabled=False,
+    )
+    # Edits that send the same roles and status keep the tokens
+    assert not crud.user.token_claims_changed(
+        user,
+        fields={
+            "admin_roles": [RoleEnum.superuser],
+            "disabled": False,
+            "full_name": "John Doe",
+        },
+    )
+    assert crud.user.token_claims_changed(user, fields={"disabled": True})
+    assert crud.user.token_claims_changed(user, fields={"admin_roles": []})
@@ -0,0 +1,41 @@
+import pytest
+
+from app.core import config
+from app.db.database import BucketPool, BucketPoolTimeout
+
+
+def test_bucket_pool_reuses_buckets():
+    pool = BucketPool(
+        username=config.COUCHBASE_USER,
+        password=config.COUCHBASE_PASSWORD,
+        bucket_name=config.COUCHBASE_BUCKET_NAME,
+        host=config.COUCHBASE_HOST,
+        port=config.COUCHBASE_PORT,
+        size=2,
+    )
+    with pool.checkout() as bucket:
+        assert pool.stats()["in_use"] == 1
+    with pool.checkout() as bucket_2:
+        assert bucket_2 is bucket
+    stats = pool.stats()
+    assert stats["opened"] == 1
+    assert stats["idle"] == 1
+    assert stats["in_use"] == 0
+    assert stats["checkouts"] == 2
+
+
+def test_bucket_pool_checkout_timeout():
+    pool = BucketPool(
+        username=config.COUCHBASE_USER,
+        password=config.COUCHBASE_PASSWORD,
+        bucket_name=config.COUCHBASE_BUCKET_NAME,
+        host=config.COUCHBASE_HOST,
+        port=config.COUCHBASE_PORT,
+        size=1,
+        checkout_timeout=0.1,
+    )
+    with pool.checkout():
+        with pytest.raises(BucketPoolTimeout):
+            with pool.checkout():
+                pass
+    assert pool.stats()["checkout_timeouts"] == 1
@@ -0,0 +1,50 @@
+import json
+
+from app.db.full_text_search_utils import get_stored_fields
+
+
+def write_index_definition(index_dir, index_definition):
+    file_path = index_dir / f"{index_definition['name']}.json"
+    file_path.write_text(json.dumps(index_definition))
+
+
+def get_field_mapping(name: str, store: bool):
+    return {"enabled": True, "fields": [{"name": name, "store": store}]}
+
+
+def test_get_stored_fields(tmp_path):
+    write_index_definition(
+        tmp_path,
+        {
+            "name": "things_01",
+            "type": "fulltext-index",
+            "params": {
+                "mapping": {
+                    "types": {
+                        "thing": {
+                            "enabled": True,
+                            "properties": {
+                                "title": get_field_mapping("title", store=True),
+                                "secret": get_field_mapping("secret", store=False),
+                            },
+                        }
+                    }
+                }
+            },
+        },
+    )
+    write_index_definition(
+        tmp_path,
+        {
+            "name": "things",
+            "type": "fulltext-alias",
+            "params": {"targets": {"things_01": {}}},
+        },
+    )
+    index_dir = str(tmp_path)
+    assert get_stored_fields("things", index_dir=index_dir) == {"title"}
+    assert get_stored_fields("things_01", doc_type="thing", index_dir=index_dir) == {
+        "title"
+    }
+    assert not get_stored_fields("things", doc_type="other", index_dir=index_dir)
+    assert not get_stored_fields("missing", index_dir=index_dir)
@@ -0,0 +1,37 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models.config import ITEM_SCHEMA_VERSION
+from app.models.item import Item, ItemInDB
+from app.models.schema import doc_to_model
+
+
+def test_doc_to_model_trusted():
+    data = {
+        "type": "item",
+        "schema_version": ITEM_SCHEMA_VERSION,
+        "id": "1",
+        "title": "Foo",
+        "owner_username": "johndoe",
+    }
+    item = doc_to_model(data, doc_model=Item)
+    assert isinstance(item, Item)
+    assert item.title == "Foo"
+    assert item.description is None
+    assert item.dict(skip_defaults=True) == {
+        "id": "1",
+        "title": "Foo",
+        "owner_username": "johndoe",
+    }
+
+
+def test_doc_to_model_other_version_is_validated():
+    data = {"type": "item", "schema_version": 0, "id": "1", "owner_username": 2}
+    with pytest.raises(ValidationError):
+        doc_to_model(data, doc_model=ItemInDB)
+
+
+def test_doc_to_model_missing_required_is_validated():
+    data = {"schema_version": ITEM_SCHEMA_VERSION, "id": "1", "owner_username": "j"}
+    with pytest.raises(ValidationError):
+        doc_to_model(data, doc_model=Item)
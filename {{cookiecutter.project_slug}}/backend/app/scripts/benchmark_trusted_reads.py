@@ -0,0 +1,79 @@
+"""
+Compare the rows per second of validated and trusted model creation, as done
+when reading documents from Couchbase.
+
+Run from the backend app directory with:
+
+    PYTHONPATH=. python scripts/benchmark_trusted_reads.py
+"""
+
+import time
+import uuid
+
+from app.models.config import ITEM_SCHEMA_VERSION, USERPROFILE_SCHEMA_VERSION
+from app.models.item import Item, ItemInDB
+from app.models.schema import doc_to_model
+from app.models.user import User, UserInDB
+
+ROWS = 50000
+ROUNDS = 3
+
+
+def item_doc(i: int):
+    return {
+        "type": "item",
+        "schema_version": ITEM_SCHEMA_VERSION,
+        "id": str(uuid.uuid4()),
+        "title": f"Item {i}",
+        "description": f"Description of item {i}",
+        "owner_username": f"user{i % 100}@example.com",
+    }
+
+
+def user_doc(i: int):
+    return {
+        "type": "userprofile",
+        "schema_version": USERPROFILE_SCHEMA_VERSION,
+        "username": f"user{i}@example.com",
+        "email": f"user{i}@example.com",
+        "full_name": f"User {i}",
+        "hashed_password": "$2b$12$" + "x" * 53,
+        "admin_roles": ["superuser"],
+        "admin_channels": [f"user{i}@example.com", "public"],
+        "disabled": False,
+    }
+
+
+def rows_per_sec(create, docs):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for doc in docs:
+            create(doc)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(docs) / best
+
+
+def main():
+    cases = [
+        ("Item", Item, item_doc),
+        ("ItemInDB", ItemInDB, item_doc),
+        ("User", User, user_doc),
+        ("UserInDB", UserInDB, user_doc),
+    ]
+    print(
+        f"{'model':<10} {'validated rows/s':>18} {'trusted rows/s':>16} {'speedup':>8}"
+    )
+    for name, doc_model, make_doc in cases:
+        docs = [make_doc(i) for i in range(ROWS)]
+        validated = rows_per_sec(lambda doc: doc_model(**doc), docs)
+        trusted = rows_per_sec(lambda doc: doc_to_model(doc, doc_model=doc_model), docs)
+        print(
+            f"{name:<10} {validated:>18,.0f} {trusted:>16,.0f} "
+            f"{trusted / validated:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
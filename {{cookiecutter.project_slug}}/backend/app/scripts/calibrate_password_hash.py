@@ -0,0 +1,92 @@
+"""
+Find the password hashing cost that takes about a target time to verify on the
+current hardware, to set it in the environment of the backend.
+
+Run from the backend app directory, on the same kind of machine as the
+backend, with:
+
+    PYTHONPATH=. python scripts/calibrate_password_hash.py --target-ms 250
+
+Stored hashes with another cost are rehashed on the next login of each user.
+"""
+
+import argparse
+import time
+
+from passlib.hash import argon2, bcrypt
+
+PASSWORD = "calibration password"
+ROUNDS = 3
+
+
+def verify_ms(handler) -> float:
+    hashed_password = handler.hash(PASSWORD)
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        handler.verify(PASSWORD, hashed_password)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def calibrate(get_handler, *, min_rounds: int, max_rounds: int, target_ms: float):
+    """
+    Return the highest rounds that verify within `target_ms`, and the time they
+    take, or `min_rounds` if even those are slower. The verify time grows with
+    the rounds, so stop at the first one over.
+    """
+    rounds, elapsed_ms = None, None
+    for candidate in range(min_rounds, max_rounds + 1):
+        candidate_ms = verify_ms(get_handler(candidate))
+        print(f"  rounds {candidate:>3}: {candidate_ms:>8.1f} ms")
+        if rounds is not None and candidate_ms > target_ms:
+            break
+        rounds, elapsed_ms = candidate, candidate_ms
+    return rounds, elapsed_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], default="bcrypt")
+    parser.add_argument(
+        "--argon2-memory-cost", type=int, default=argon2.memory_cost, help="KiB"
+    )
+    args = parser.parse_args()
+    if args.scheme == "bcrypt":
+        print(f"bcrypt, target {args.target_ms:.0f} ms")
+        rounds, elapsed_ms = calibrate(
+            lambda rounds: bcrypt.using(rounds=rounds),
+            min_rounds=8,
+            max_rounds=bcrypt.max_rounds,
+            target_ms=args.target_ms,
+        )
+        settings = {"PASSWORD_HASH_BCRYPT_ROUNDS": rounds}
+    else:
+        if not argon2.has_backend():
+            parser.exit(1, "argon2 requires argon2-cffi, install it first\n")
+        print(
+            f"argon2, memory cost {args.argon2_memory_cost} KiB, "
+            f"target {args.target_ms:.0f} ms"
+        )
+        rounds, elapsed_ms = calibrate(
+            lambda rounds: argon2.using(
+                rounds=rounds, memory_cost=args.argon2_memory_cost
+            ),
+            min_rounds=1,
+            max_rounds=50,
+            target_ms=args.target_ms,
+        )
+        settings = {
+            "PASSWORD_HASH_ARGON2_ROUNDS": rounds,
+            "PASSWORD_HASH_ARGON2_MEMORY_COST": args.argon2_memory_cost,
+        }
+    print(f"\nVerify takes {elapsed_ms:.1f} ms with:\n")
+    print(f"PASSWORD_HASH_SCHEME={args.scheme}")
+    for name, value in settings.items():
+        print(f"{name}={value}")
+
+
+if __name__ == "__main__":
+    main()